@@ -1,170 +1,1023 @@
-from fastapi import FastAPI, HTTPException, Body
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Body, Header, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from x402.common import process_price_to_atomic_amount
+from x402.encoding import safe_base64_decode
+from x402.facilitator import FacilitatorClient
 from x402.fastapi.middleware import require_payment
+from x402.types import PaymentPayload, PaymentRequirements
 from dotenv import load_dotenv
-from arkiv import Arkiv
-from arkiv.account import NamedAccount
-from web3 import HTTPProvider
-from arkiv.types import QueryOptions, KEY, ATTRIBUTES, PAYLOAD
-from typing import Optional, Dict, Any
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, List
+from src.log import setup_logging, current_route
+from src.cache import make_cache
+from src.admission import WalletLimiter, LoadShedder, limiter_key
+from src.log import logging_stats
+from src.singleflight import SingleFlight, normalize_query
+from src.keepalive import KeepAliveRegistry
+from src.events import EventHub, LogPoller
+from src.webhooks import WebhookDispatcher, validate_url
+from src.query import compile_query
+from src.streams import StreamHub, sse_message
+from src.history import HistoryStore, HistoryRecorder
+from src.backfill import Backfill
+from src.lazy import lazy_import
+from src.series import SNAPSHOT_FIELDS, SeriesStore, SeriesRecorder, parse_duration
+from src.alerts import AlertEngine
+from src.wallets import WALLET_ATTRIBUTE, WalletIndex
+from src.signers import SignerPool
+from src.txparams import TxParamsCache
+from src.receipts import ReceiptTracker, is_tx_hash
+from src.resilience import CircuitBreaker, RpcGuard, RpcUnavailable
+from src.idempotency import (IDEMPOTENCY_HEADER, MAX_KEY_LENGTH, REPLAYED_HEADER, IdempotencyStore, StoredResponse,
+                             request_fingerprint)
+from src.responses import dumps, json_response, entity_etag, etag_matches, not_modified, cache_headers, is_immutable
+from concurrent.futures import ThreadPoolExecutor
+import anyio
+import asyncio
+import json
+import logging
+import math
 import os
+import secrets
+import threading
+import time
 
 load_dotenv()
+setup_logging()
+
+logger = logging.getLogger("arkivendor")
 
 # Environment variables
 PAYTO_ADDRESS = os.getenv("PAYTO_ADDRESS")
 API_COST = os.getenv("API_COST", "0.01")
+PAYMENT_NETWORK = "base-sepolia"
 ARKIV_PRIVATE_KEY = os.getenv("ARKIV_PRIVATE_KEY")
+ARKIV_SIGNER_KEYS = [k.strip() for k in os.getenv("ARKIV_SIGNER_KEYS", "").split(",") if k.strip()]  # Extra write wallets
+SIGNER_MIN_BALANCE = float(os.getenv("SIGNER_MIN_BALANCE") or "0")  # ETH; poorer signers get no new entities
+TX_FEE_REFRESH_SECONDS = float(os.getenv("TX_FEE_REFRESH_SECONDS") or "5")  # Fee data shared by all writes this long
+TX_GAS_MARGIN = float(os.getenv("TX_GAS_MARGIN") or "1.2")  # Headroom over cached gas estimates
+TX_CONFIRM = os.getenv("TX_CONFIRM", "included")  # Default write policy: submitted | included | final | <confirmations>
+TX_FINALITY = int(os.getenv("TX_FINALITY") or "6")  # Confirmations after which a transaction is final
+TX_WAIT_SECONDS = float(os.getenv("TX_WAIT_SECONDS") or "120")  # Longest a write waits before answering 202
+TX_POLL_SECONDS = float(os.getenv("TX_POLL_SECONDS") or "1")  # One batched receipt poll per interval
+TX_DROP_SECONDS = float(os.getenv("TX_DROP_SECONDS") or "300")  # Unmined and unknown this long: dropped
 ARKIV_RPC_URL = os.getenv("ARKIV_RPC_URL", "https://mendoza.hoodi.arkiv.network/rpc")
 BACKEND_WALLET = os.getenv("ARKIV_ACCOUNT_ADDRESS")
 MAINNET = os.getenv("MAINNET", "false").lower() == "true"
+ENTITY_META_TTL = float(os.getenv("ENTITY_META_TTL") or "5")
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL") or "2")  # One block by default
+CACHE_MAX_AGE = int(os.getenv("CACHE_MAX_AGE") or "60")  # Cap for mutable entities, seconds
+CACHE_SHARED = os.getenv("CACHE_SHARED", "false").lower() == "true"  # Allow shared caches (proxy/CDN)
+BLOCK_TIME_SECONDS = 2  # Arkiv block time, same as ArkivModuleBase.BLOCK_TIME_SECONDS
+HEAD_REFRESH_SECONDS = 30
+READ_RATE = float(os.getenv("READ_RATE") or "10")  # Per wallet, requests per second
+READ_BURST = float(os.getenv("READ_BURST") or "20")
+WRITE_RATE = float(os.getenv("WRITE_RATE") or "1")
+WRITE_BURST = float(os.getenv("WRITE_BURST") or "5")
+SHED_MAX_INFLIGHT = int(os.getenv("SHED_MAX_INFLIGHT") or "64")  # Requests waiting on RPC
+SHED_MAX_WRITES = int(os.getenv("SHED_MAX_WRITES") or "16")  # Writes waiting on a transaction
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE") or "64")  # Threads serving blocking SDK calls
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS") or "86400")  # 0 disables Idempotency-Key
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS") or "10000")  # Recorded responses per worker
+DATA_DIR = os.getenv("DATA_DIR", ".arkivendor")  # Local state (keep-alive registry, ...)
+KEEPALIVE_LEAD_SECONDS = int(os.getenv("KEEPALIVE_LEAD_SECONDS") or "300")  # Extend this long before expiry
+KEEPALIVE_STEP_SECONDS = int(os.getenv("KEEPALIVE_STEP_SECONDS") or "86400")  # Extension per transaction
+KEEPALIVE_MAX_SECONDS = int(os.getenv("KEEPALIVE_MAX_SECONDS") or "2592000")  # Longest lifetime one request may ask for
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE") or "50")  # Max events per delivery
+WEBHOOK_BATCH_WINDOW = float(os.getenv("WEBHOOK_BATCH_WINDOW") or "1")  # Seconds to gather a batch
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE") or "1000")  # Per subscriber, oldest dropped when full
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS") or "6")
+WEBHOOK_ALLOW_PRIVATE = os.getenv("WEBHOOK_ALLOW_PRIVATE", "false").lower() == "true"  # Allow private/loopback URLs
+EVENT_POLL_SECONDS = float(os.getenv("EVENT_POLL_SECONDS") or "1")  # One eth_getLogs per interval for all consumers
+STREAM_BUFFER_SIZE = int(os.getenv("STREAM_BUFFER_SIZE") or "10000")  # Recent events kept for resuming streams
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE") or "1000")  # Per client, disconnected with "overflow" past this
+STREAM_MAX_CLIENTS = int(os.getenv("STREAM_MAX_CLIENTS") or "1000")  # Per worker
+STREAM_LINGER_SECONDS = float(os.getenv("STREAM_LINGER_SECONDS") or "300")  # Keep watching after the last client leaves
+STREAM_PING_SECONDS = 15
+HISTORY_ENABLED = os.getenv("HISTORY_ENABLED", "true").lower() == "true"  # Record entity version history
+HISTORY_QUERY = os.getenv("HISTORY_QUERY", "")  # Entities whose history is recorded (default: all)
+HISTORY_FROM_BLOCK = os.getenv("HISTORY_FROM_BLOCK")  # Backfill from this block on first start (default: from now)
+HISTORY_PAYLOAD_HASH = os.getenv("HISTORY_PAYLOAD_HASH", "false").lower() == "true"  # Store a sha256 of each payload
+SERIES_ENABLED = os.getenv("SERIES_ENABLED", "true").lower() == "true"  # Record snapshot metrics as time series
+SERIES_ENTITY_TYPE = os.getenv("SERIES_ENTITY_TYPE", "polkadot-stash")  # `type` attribute of snapshot entities
+SERIES_FIELDS = [f.strip() for f in os.getenv("SERIES_FIELDS", ",".join(SNAPSHOT_FIELDS)).split(",") if f.strip()]
+SERIES_MAX_POINTS = 10000
+WALLET_INDEX_ENABLED = os.getenv("WALLET_INDEX_ENABLED", "true").lower() == "true"  # Serve GET /me/entities from memory
+WALLET_INDEX_QUERY = os.getenv("WALLET_INDEX_QUERY", f'{WALLET_ATTRIBUTE} ~ "0x*"')  # Entities loaded at startup
+CREATE_DEFAULT_OWNER = os.getenv("CREATE_DEFAULT_OWNER", "backend").lower()  # backend | payer: owner of new entities
+TRANSFER_MAX_ENTITIES = int(os.getenv("TRANSFER_MAX_ENTITIES") or "1000")  # Per bulk transfer request
+TRANSFER_BATCH_SIZE = int(os.getenv("TRANSFER_BATCH_SIZE") or "100")  # Ownership changes per transaction
+ALERT_COOLDOWN_SECONDS = float(os.getenv("ALERT_COOLDOWN_SECONDS") or "300")  # Default min time between alert deliveries
+ARKIV_BACKEND = os.getenv("ARKIV_BACKEND", "rpc").lower()  # "rpc", or "memory" for an in-memory node (offline)
+MEMORY_NODE_BLOCK_SECONDS = float(os.getenv("MEMORY_NODE_BLOCK_SECONDS") or str(BLOCK_TIME_SECONDS))  # 0: per transaction
+MEMORY_NODE_LATENCY_MS = os.getenv("MEMORY_NODE_LATENCY_MS")  # e.g. "20" or "lognormal:20:0.5"
+MEMORY_NODE_FAILURE_RATE = float(os.getenv("MEMORY_NODE_FAILURE_RATE") or "0")  # Requests failing in transit
+MEMORY_NODE_REVERT_RATE = float(os.getenv("MEMORY_NODE_REVERT_RATE") or "0")  # Transactions mined with status 0
+MEMORY_NODE_DROP_RATE = float(os.getenv("MEMORY_NODE_DROP_RATE") or "0")  # Transactions never mined
+RPC_POOL_SIZE = int(os.getenv("RPC_POOL_SIZE") or "10")
+RPC_TIMEOUT_SECONDS = float(os.getenv("RPC_TIMEOUT_SECONDS") or "10")  # Per RPC request
+RPC_RETRIES = int(os.getenv("RPC_RETRIES") or "2")  # Extra attempts for reads failing in transit
+RPC_BACKOFF_SECONDS = float(os.getenv("RPC_BACKOFF_SECONDS") or "0.2")  # Jittered, doubling up to RPC_BACKOFF_MAX_SECONDS
+RPC_BACKOFF_MAX_SECONDS = float(os.getenv("RPC_BACKOFF_MAX_SECONDS") or "2")
+RPC_BREAKER_FAILURES = int(os.getenv("RPC_BREAKER_FAILURES") or "5")  # Consecutive failed calls opening the breaker
+RPC_BREAKER_RESET_SECONDS = float(os.getenv("RPC_BREAKER_RESET_SECONDS") or "30")  # Fail fast this long once open
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS") or "4")
+WARMUP_QUERY = os.getenv("WARMUP_QUERY")  # Optional query whose entities' metadata is prefetched
+
+sdk = lazy_import("src.sdk")
+
+# Admission control, applied ahead of payment verification
+limiter = WalletLimiter(READ_RATE, READ_BURST, WRITE_RATE, WRITE_BURST)
+shedder = LoadShedder(SHED_MAX_INFLIGHT, SHED_MAX_WRITES)
+ADMISSION_EXEMPT = {"/", "/ready", "/metrics", "/docs", "/openapi.json"}
+
+# Responses of writes sent with an Idempotency-Key, replayed to retries without a second payment
+idempotency = IdempotencyStore(maxsize=IDEMPOTENCY_MAX_KEYS, ttl=IDEMPOTENCY_TTL_SECONDS, wait_timeout=TX_WAIT_SECONDS)
+
+# Retries and circuit breaker for the RPC endpoint (shared by every signer's client)
+rpc_guard = RpcGuard(
+    attempts=1 + RPC_RETRIES,
+    backoff=RPC_BACKOFF_SECONDS,
+    max_backoff=RPC_BACKOFF_MAX_SECONDS,
+    breaker=CircuitBreaker(failure_threshold=RPC_BREAKER_FAILURES, reset_after=RPC_BREAKER_RESET_SECONDS),
+)
+
+# Chain id, fees, gas estimates and nonces reused across writes (transactions are signed locally)
+tx_params = TxParamsCache(fee_interval=TX_FEE_REFRESH_SECONDS, gas_margin=TX_GAS_MARGIN,
+                          # Shared by the workers, unless each runs its own in-memory node
+                          nonce_path=None if ARKIV_BACKEND == "memory" else os.path.join(DATA_DIR, "nonces.json"))
+
+# Receipts of every sent transaction, polled in batches by one thread
+receipts = ReceiptTracker(
+    poll=lambda tx_hashes: sdk.poll_receipts(get_arkiv_client(), tx_hashes),
+    fetch_receipt=lambda tx_hash: sdk.get_receipt(get_arkiv_client(), tx_hash),
+    is_known=lambda tx_hash: sdk.is_transaction_known(get_arkiv_client(), tx_hash),
+    finality=TX_FINALITY,
+    interval=TX_POLL_SECONDS,
+    drop_after=TX_DROP_SECONDS,
+    allow_private=WEBHOOK_ALLOW_PRIVATE,
+)
+
+# Entities kept alive by the backend until their target lifetime
+keepalive = KeepAliveRegistry(
+    os.path.join(DATA_DIR, "keepalive.json"),
+    extend=lambda batch, settled: extend_kept_alive(batch, settled),
+    head_block=lambda: head_block(),
+    exists=lambda entity_key: entity_key.lower() in sdk.get_owners(get_arkiv_client(), [entity_key]),
+    block_time=BLOCK_TIME_SECONDS,
+    lead_blocks=KEEPALIVE_LEAD_SECONDS // BLOCK_TIME_SECONDS,
+    window_blocks=KEEPALIVE_LEAD_SECONDS // BLOCK_TIME_SECONDS,
+    step_seconds=KEEPALIVE_STEP_SECONDS,
+)
+
+# Entity change events from one shared log poller, fanned out to webhooks, streams and history
+event_hub = EventHub(fetch_attributes=lambda keys, block: sdk.get_attributes(get_arkiv_client(), keys, at_block=block))
+event_source = None
+event_source_lock = threading.Lock()
+event_demand = {"webhooks": False, "streams": False, "history": False, "series": False, "wallets": False}
+
+def set_event_demand(consumer: str, active: bool):
+    """Run the event poller only while something consumes its events"""
+    global event_source
+    with event_source_lock:
+        event_demand[consumer] = active
+        if any(event_demand.values()) and event_source is None:
+            client = get_arkiv_client()
+            event_source = LogPoller(
+                client, event_hub,
+                log_filter=lambda from_block, to_block: sdk.event_log_filter(client, from_block, to_block),
+                decode=lambda log: sdk.decode_log(client, log),
+                interval=EVENT_POLL_SECONDS,
+            )
+            event_source.start()
+        elif not any(event_demand.values()) and event_source is not None:
+            event_source.stop()
+            event_source = None
+
+webhooks = WebhookDispatcher(
+    os.path.join(DATA_DIR, "webhooks.json"),
+    batch_size=WEBHOOK_BATCH_SIZE,
+    batch_window=WEBHOOK_BATCH_WINDOW,
+    queue_size=WEBHOOK_QUEUE_SIZE,
+    max_attempts=WEBHOOK_MAX_ATTEMPTS,
+    on_active=lambda active: asyncio.create_task(asyncio.to_thread(set_event_demand, "webhooks", active)),
+    allow_private=WEBHOOK_ALLOW_PRIVATE,
+)
+event_hub.subscribe(webhooks.offer)
+
+streams = StreamHub(
+    head_block=lambda: head_block(),
+    buffer_size=STREAM_BUFFER_SIZE,
+    queue_size=STREAM_QUEUE_SIZE,
+    max_clients=STREAM_MAX_CLIENTS,
+    linger=STREAM_LINGER_SECONDS,
+    on_active=lambda active: asyncio.create_task(asyncio.to_thread(set_event_demand, "streams", active)),
+)
+event_hub.subscribe(streams.offer)
+
+# Append-only entity version log, written by one worker and read by all
+history = HistoryStore(os.path.join(DATA_DIR, "history", "history.jsonl"))
+history_recorder = HistoryRecorder(
+    history,
+    HISTORY_QUERY,
+    fetch_version=lambda key, block, with_payload: fetch_entity_version(key, block, with_payload),
+    hash_payloads=HISTORY_PAYLOAD_HASH,
+)
+event_hub.subscribe(history_recorder.offer)
+history_stop = threading.Event()  # Ends backfill retries at shutdown
+
+# Entities of each user wallet (custody mode), loaded at startup and kept current from events
+wallet_index = WalletIndex()
+event_hub.subscribe(wallet_index.offer)
 
-# Initialize Arkiv client
+# Threshold alert rules, evaluated on every appended snapshot
+alerts = AlertEngine(os.path.join(DATA_DIR, "alerts.json"), SERIES_FIELDS, allow_private=WEBHOOK_ALLOW_PRIVATE)
+
+# Per-stash columns of snapshot metrics (memory-mapped), appended by one worker
+series_store = SeriesStore(os.path.join(DATA_DIR, "series"), SERIES_FIELDS)
+series_recorder = SeriesRecorder(
+    series_store,
+    fetch_payload=lambda key, block: fetch_entity_version(key, block, with_payload=True)[1],
+    entity_type=SERIES_ENTITY_TYPE,
+    on_append=alerts.observe,
+)
+event_hub.subscribe(series_recorder.offer)
+
+# Single-use WebSocket tickets (payment middleware only sees HTTP requests)
+stream_tickets = make_cache("stream_tickets", maxsize=10000, ttl=60)
+
+# Coalesces concurrent identical reads and queries into one RPC
+reads = SingleFlight()
+
+# Entity metadata (etag, owner, blocks) by key, used to answer If-None-Match without an RPC
+entity_meta = make_cache("entity_meta", maxsize=10000, ttl=ENTITY_META_TTL)
+
+# Formatted query results by (query, limit, include_payload), cleared on every local write
+query_cache = make_cache("query", maxsize=1000, ttl=QUERY_CACHE_TTL)
+
+# Initialize Arkiv client (built by the lifespan warm-up, or lazily by the first request)
 client = None
+client_lock = threading.Lock()
+
+# Backend wallets writes are spread over (the client's own wallet first)
+signer_pool = None
+signer_pool_lock = threading.Lock()
+
+# Readiness, flipped by the lifespan warm-up
+readiness = {"ready": False, "error": None, "warmup_seconds": None}
 
 def get_arkiv_client():
     """Get or create Arkiv client instance"""
     global client
     if client is None:
-        if not ARKIV_PRIVATE_KEY:
-            raise RuntimeError("ARKIV_PRIVATE_KEY not found in environment variables")
-
-        account = NamedAccount.from_private_key("backend", ARKIV_PRIVATE_KEY)
-        provider = HTTPProvider(ARKIV_RPC_URL)
-        client = Arkiv(provider=provider, account=account)
+        with client_lock:
+            if client is None:
+                if ARKIV_BACKEND == "memory":
+                    client = sdk.build_memory_client(
+                        ARKIV_PRIVATE_KEY or "0x" + secrets.token_hex(32),
+                        guard=rpc_guard,
+                        block_time=MEMORY_NODE_BLOCK_SECONDS,
+                        latency=MEMORY_NODE_LATENCY_MS,
+                        failure_rate=MEMORY_NODE_FAILURE_RATE,
+                        revert_rate=MEMORY_NODE_REVERT_RATE,
+                        drop_rate=MEMORY_NODE_DROP_RATE,
+                    )
+                    logger.warning("Using an in-memory Arkiv node; nothing is written on chain")
+                elif not ARKIV_PRIVATE_KEY:
+                    raise RuntimeError("ARKIV_PRIVATE_KEY not found in environment variables")
+                else:
+                    client = sdk.build_client(ARKIV_PRIVATE_KEY, ARKIV_RPC_URL, pool_size=RPC_POOL_SIZE,
+                                              guard=rpc_guard, timeout=RPC_TIMEOUT_SECONDS)
 
     return client
 
+def get_signer_pool() -> SignerPool:
+    """Get or create the signer pool: the client's wallet plus one per ARKIV_SIGNER_KEYS entry"""
+    global signer_pool
+    if signer_pool is None:
+        primary = get_arkiv_client()
+        with signer_pool_lock:
+            if signer_pool is None:
+                clients = [primary] + [
+                    sdk.build_signer(primary, key, f"signer-{i}") for i, key in enumerate(ARKIV_SIGNER_KEYS, 1)
+                ]
+                signer_pool = SignerPool(clients, min_balance=int(SIGNER_MIN_BALANCE * 10**18))
+    return signer_pool
+
+def warm_up():
+    """Build the client, open RPC connections and prime the head block and metadata caches"""
+    started = time.monotonic()
+    # Client first: it loads the lazy sdk module under client_lock, which the keepalive thread may race for
+    client = get_arkiv_client()
+    result = sdk.warm_up(client, connections=WARMUP_CONNECTIONS, query=WARMUP_QUERY)
+    _head["block"] = result["head_block"]
+    _head["at"] = time.monotonic()
+    for entity in result["entities"]:
+        remember_entity_meta(entity)
+    get_signer_pool().start()
+    readiness["warmup_seconds"] = round(time.monotonic() - started, 3)
+    readiness["ready"] = True
+    logger.info(
+        "Warm-up complete",
+        extra={"chain_id": result["chain_id"], "head_block": result["head_block"],
+               "prefetched": len(result["entities"]), "seconds": readiness["warmup_seconds"]}
+    )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up in the background so the server listens immediately and /ready gates traffic"""
+    async def run_warm_up():
+        try:
+            await asyncio.to_thread(warm_up)
+        except Exception as e:
+            readiness["error"] = str(e)
+            logger.exception("Warm-up failed")
+            return
+        if HISTORY_ENABLED:
+            # Retries its backfill until it completes, so it must not hold up the others
+            background.append(asyncio.create_task(asyncio.to_thread(start_history)))
+        if SERIES_ENABLED:
+            await asyncio.to_thread(start_series)
+        if WALLET_INDEX_ENABLED:
+            await asyncio.to_thread(start_wallet_index)
+
+    background = []  # Keeps references to tasks nobody awaits
+    # Blocking SDK calls run in the threadpool; size it to the admitted backlog
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+
+    task = asyncio.create_task(run_warm_up())
+    receipts.start()
+    keepalive.start()
+    await webhooks.start()
+    streams.start()
+    yield
+    task.cancel()
+    history_stop.set()
+    keepalive.stop()
+    await webhooks.stop()
+    history.leader.release()
+    series_store.leader.release()
+    alerts.stop()
+    receipts.stop()
+    if signer_pool is not None:
+        signer_pool.stop()
+    for consumer in event_demand:
+        await asyncio.to_thread(set_event_demand, consumer, False)
+    if client is not None:
+        client.arkiv.cleanup_filters()
+
+# Last fetched head block and when, extrapolated between refreshes
+_head = {"block": None, "at": 0.0}
+
 # Helper functions
-def entity_exists(entity_key: str) -> bool:
-    """Check if entity exists"""
-    return get_arkiv_client().arkiv.entity_exists(entity_key)
+def head_block() -> Optional[int]:
+    """Estimated current block number, refreshed from the node every HEAD_REFRESH_SECONDS"""
+    now = time.monotonic()
+    if _head["block"] is None or now - _head["at"] > HEAD_REFRESH_SECONDS:
+        try:
+            _head["block"] = get_arkiv_client().eth.block_number
+            _head["at"] = now
+        except Exception as e:
+            logger.warning("Failed to fetch head block", extra={"error": str(e)})
+            return None
+    return _head["block"] + int((now - _head["at"]) // BLOCK_TIME_SECONDS)
+
+def entity_cache_headers(meta: Dict[str, Any]) -> Dict[str, str]:
+    """Caching headers for an entity read, bounded by its remaining lifetime"""
+    return cache_headers(
+        meta["expires_at_block"],
+        head_block(),
+        BLOCK_TIME_SECONDS,
+        immutable=meta["immutable"],
+        max_age_cap=CACHE_MAX_AGE,
+        shared=CACHE_SHARED,
+    )
+
+def request_failed(action: str, e: Exception) -> HTTPException:
+    """500 for a failed request, or 503 + Retry-After while the RPC endpoint is unavailable"""
+    if isinstance(e, RpcUnavailable):
+        return HTTPException(status_code=503, detail=f"Failed to {action}: {str(e)}",
+                             headers={"Retry-After": str(math.ceil(e.retry_after))})
+    return HTTPException(status_code=500, detail=f"Failed to {action}: {str(e)}")
+
+def get_entity_or_404(entity_key: str, fields: Optional[int] = None):
+    """Fetch entity in a single query, raising 404 if it does not exist"""
+    if not sdk.is_entity_key(entity_key):
+        raise HTTPException(status_code=404, detail="Entity not found")
+    arkiv = get_arkiv_client().arkiv
+    try:
+        if fields is None:
+            return reads.do(("get", entity_key), lambda: arkiv.get_entity(entity_key))
+        return reads.do(("get", entity_key, fields), lambda: arkiv.get_entity(entity_key, fields=fields))
+    except ValueError as e:
+        if "not found" in str(e):
+            raise HTTPException(status_code=404, detail="Entity not found")
+        raise
+
+def fetch_entity_version(entity_key: str, block: Optional[int], with_payload: bool = False):
+    """(attributes, payload) of an entity as of block (latest if None); (None, None) if it did not exist"""
+    fields = sdk.KEY | sdk.ATTRIBUTES | (sdk.PAYLOAD if with_payload else 0)
+    try:
+        entity = get_arkiv_client().arkiv.get_entity(entity_key, fields=fields, at_block=block)
+    except ValueError as e:
+        if "not found" in str(e):
+            return None, None
+        raise
+    return entity.attributes, entity.payload if with_payload else None
+
+def start_history():
+    """
+    Backfill the version log from where it stopped up to where the live poller
+    starts, then record live events. Live events arriving meanwhile are
+    buffered, so the log has neither gaps nor duplicates. A failed backfill is
+    retried (from its checkpoint) until it completes: recording live events
+    past a missing range would leave that range unrecorded for good. Leader only.
+    """
+    history.load()
+    if not history.leader.acquire():
+        return
+    history_recorder.pause()
+    set_event_demand("history", True)
+    live_from = event_source.next_block
+    if history.last_block is not None:
+        start = history.last_block + 1
+    elif HISTORY_FROM_BLOCK:
+        start = int(HISTORY_FROM_BLOCK)
+    else:
+        start = live_from
+    if start < live_from:
+        client = get_arkiv_client()
+        backfill = Backfill(
+            lambda from_block, to_block: sdk.get_event_logs(client, from_block, to_block),
+            history_recorder.record_logs(lambda log: sdk.decode_log(client, log)),
+            start, live_from - 1,
+            checkpoint_path=os.path.join(DATA_DIR, "history", "backfill.json"),
+        )
+        attempt = 0
+        while True:
+            try:
+                stats = backfill.run()
+                break
+            except Exception:
+                logger.exception("History backfill failed, retrying", extra={"done_through": backfill.done_through})
+            if history_stop.wait(min(60.0, 2.0 ** attempt)):
+                return  # Shutting down; the next start backfills from the last recorded block
+            attempt += 1
+        logger.info("History backfill complete", extra=stats)
+    history_recorder.resume(after_block=live_from - 1)
+
+def start_wallet_index():
+    """Load the wallet index as of the block before the event poller starts, then follow events"""
+    wallet_index.begin_load()
+    set_event_demand("wallets", True)
+    at_block = event_source.next_block - 1
+    try:
+        client = get_arkiv_client()
+        wallet_index.finish_load(
+            sdk.query_all(client, WALLET_INDEX_QUERY, sdk.KEY | sdk.OWNER | sdk.ATTRIBUTES, at_block=at_block),
+            after_block=at_block
+        )
+        logger.info("Wallet index loaded", extra=wallet_index.stats())
+    except Exception:
+        logger.exception("Wallet index load failed")
+        wallet_index.finish_load([], after_block=at_block, complete=False)
+
+def start_series():
+    """Record snapshots observed from now on into the series store (leader only)"""
+    if series_store.leader.acquire():
+        set_event_demand("series", True)
+
+def paying_wallet(request: Request) -> Optional[str]:
+    """Wallet that paid for this request, as verified by the x402 middleware"""
+    verify_response = getattr(request.state, "verify_response", None)
+    return getattr(verify_response, "payer", None)
+
+def wallet_controls(entity, wallet: Optional[str]) -> bool:
+    """Whether wallet owns entity, or is the user the backend holds it for (its WALLET_ATTRIBUTE tag)"""
+    if not wallet:
+        return False
+    tagged = (entity.attributes or {}).get(WALLET_ATTRIBUTE)
+    return wallet.lower() in (str(entity.owner).lower(), str(tagged).lower())
+
+def require_backend_owner(entity) -> None:
+    """403 unless one of the backend's signers owns entity (a write from any other wallet would revert)"""
+    if not get_signer_pool().owns(entity.owner):
+        raise HTTPException(status_code=403, detail=f"Backend is not owner, this is owner: {entity.owner}")
+
+def parse_confirm(confirm: Optional[str]) -> int:
+    """Confirmations a write waits for: submitted (0), included (1), final, or a number"""
+    value = (confirm or TX_CONFIRM).strip().lower()
+    if value == "submitted":
+        return 0
+    if value == "included":
+        return 1
+    if value == "final":
+        return TX_FINALITY
+    if value.isdigit():
+        return int(value)
+    raise HTTPException(status_code=400, detail="confirm must be submitted, included, final or a number of confirmations")
+
+def track_write(tx_hash: str, kind: str, size: int, on_receipt=None, on_failure=None):
+    """
+    Track a sent write; on_receipt(receipt) applies its local effects once it
+    is mined successfully, on_failure(error) runs if it fails or is dropped
+    """
+    def done(tx):
+        if tx.state == "failed":
+            tx_params.forget_gas(kind, size)
+        if tx.state in ("failed", "dropped"):
+            if on_failure is not None:
+                on_failure(tx.error)
+        elif tx.receipt is not None and on_receipt is not None:
+            on_receipt(tx.receipt)
+    return receipts.track(tx_hash, on_receipt=done)
+
+def extend_kept_alive(batch, settled) -> None:
+    """Send one keep-alive extension; settled(receipt), or settled(None) on failure, runs from the tracker"""
+    tx_hash, kind, size = sdk.send_operations(get_arkiv_client(), sdk.extend_operations(batch), tx_params)
+    track_write(tx_hash.to_0x_hex(), kind, size, on_receipt=settled, on_failure=lambda error: settled(None))
+
+def submit_write(client, operations, confirmations: int, on_receipt=None):
+    """Send operations in one transaction and wait for `confirmations` (or TX_WAIT_SECONDS)"""
+    tx_hash, kind, size = sdk.send_operations(client, operations, tx_params)
+    tracked = track_write(tx_hash.to_0x_hex(), kind, size, on_receipt)
+    receipts.wait(tracked, confirmations, TX_WAIT_SECONDS)
+    if tracked.state in ("failed", "dropped"):
+        raise RuntimeError(tracked.error)
+    return tracked
+
+def write_response(tracked, content: Dict[str, Any], status_code: int = 200) -> ORJSONResponse:
+    """Write result with its transaction's state; 202 while the transaction is not mined yet"""
+    content["tx_state"] = tracked.state
+    content["confirmations"] = tracked.confirmations
+    return ORJSONResponse(status_code=202 if tracked.state == "pending" else status_code, content=content)
+
+def invalidate_entity(entity_key: str) -> None:
+    """Drop cached state that a local write to entity_key makes stale"""
+    entity_meta.delete(entity_key)
+    query_cache.clear()
+
+def run_query(query: str, limit: int, include_payload: bool) -> Dict[str, Any]:
+    """
+    Run a query and format its results. Served from query_cache when possible;
+    concurrent identical (whitespace-normalized) queries share one RPC.
+    """
+    query = normalize_query(query)
+    cache_key = (query, limit, include_payload)
+    cached = query_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    return reads.do(("query",) + cache_key, lambda: fetch_query(query, limit, include_payload))
+
+def fetch_query(query: str, limit: int, include_payload: bool) -> Dict[str, Any]:
+    """Run one page (up to limit results) of a query against the node"""
+    cache_key = (query, limit, include_payload)
+
+    # Build fields
+    fields = sdk.KEY | sdk.ATTRIBUTES
+    if include_payload:
+        fields |= sdk.PAYLOAD
+
+    options = sdk.QueryOptions(fields, max_results_per_page=limit)
+    results = get_arkiv_client().arkiv.query_entities_page(query, options).entities
+
+    # Format results
+    formatted_results = []
+    for entity in results:
+        result = {
+            "key": entity.key,
+            "attributes": entity.attributes
+        }
+
+        if include_payload and entity.payload:
+            try:
+                result["payload"] = entity.payload.decode('utf-8')
+            except:
+                result["payload"] = entity.payload.hex()
+
+        formatted_results.append(result)
+
+    body = {
+        "query": query,
+        "count": len(formatted_results),
+        "results": formatted_results
+    }
+    if QUERY_CACHE_TTL > 0:
+        query_cache.set(cache_key, body)
+    return body
+
+def remember_entity_meta(entity) -> Dict[str, Any]:
+    """Cache the validator and metadata of a freshly fetched entity"""
+    meta = {
+        "etag": entity_etag(entity.key, entity.last_modified_at_block, entity.owner),
+        "owner": entity.owner,
+        "last_modified_at_block": entity.last_modified_at_block,
+        "expires_at_block": entity.expires_at_block,
+        "immutable": is_immutable(entity.attributes),
+    }
+    if meta["etag"]:
+        entity_meta.set(entity.key, meta)
+    return meta
+
+async def open_stream(query: Optional[str], events: Optional[str], last_event_id: Optional[str]):
+    """Subscribe a stream client, mapping bad filters to 400 and a full hub to 503"""
+    types = [t.strip() for t in events.split(",") if t.strip()] if events else None
+    try:
+        return await streams.subscribe(query, types, last_event_id)
+    except OverflowError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def ws_message(kind: str, detail: Optional[str] = None) -> str:
+    """Control message on the WebSocket stream (events are sent as {"id", "event"})"""
+    return dumps({"type": kind, "detail": detail}).decode()
 
 # Initialize FastAPI app
-app = FastAPI(title="Arkiv API with X402 Payments")
+app = FastAPI(title="Arkiv API with X402 Payments", default_response_class=ORJSONResponse, lifespan=lifespan)
 
-print(f'constants: PAYTO_ADDRESS={PAYTO_ADDRESS}, API_COST={API_COST}, ARKIV_RPC_URL={ARKIV_RPC_URL}, BACKEND_WALLET={BACKEND_WALLET}, MAINNET={MAINNET}')
+logger.info(
+    "Configuration loaded",
+    extra={"payto_address": PAYTO_ADDRESS, "api_cost": API_COST, "arkiv_rpc_url": ARKIV_RPC_URL,
+           "backend_wallet": BACKEND_WALLET, "mainnet": MAINNET}
+)
 
 # Configure custom facilitator URL if needed
 facilitator_url = os.getenv("FACILITATOR_URL")
 facilitator_config = {"url": facilitator_url} if facilitator_url else None
 
 if facilitator_config:
-    print(f'X402 facilitator: {facilitator_url}')
+    logger.info("X402 facilitator configured", extra={"facilitator_url": facilitator_url})
 
 # Apply X402 payment middleware to all entity endpoints
 app.middleware("http")(
     require_payment(
         price=API_COST,
         pay_to_address=PAYTO_ADDRESS,
-        network="base-sepolia",
-        path=["/entities", "/entities/query", "/entities/transfer"],
+        network=PAYMENT_NETWORK,
+        path=["/entities", "/entities/query", "/entities/transfer", "/entities/transfer/bulk", "/entities/events",
+              "/entities/events/*", "/entities/stream", "/entities/stream/ticket", "/entities/*/keepalive",
+              "/entities/*/history", "/series/*", "/alerts", "/alerts/*", "/me/entities", "/tx/*"],
         facilitator_config=facilitator_config
     )
 )
 
+# Checks the payment of an idempotent retry, which is answered before the payment middleware runs
+payment_facilitator = FacilitatorClient(facilitator_config)
+payment_amount, payment_asset, payment_domain = process_price_to_atomic_amount(API_COST, PAYMENT_NETWORK)
+
+async def verified_payer(request: Request) -> Optional[str]:
+    """Wallet of the request's X-PAYMENT if the facilitator accepts it (verified only, never settled)"""
+    payer = paying_wallet(request)
+    if payer is not None:
+        return payer.lower()
+    header = request.headers.get("X-PAYMENT")
+    if not header:
+        return None
+    try:
+        payment = PaymentPayload(**json.loads(safe_base64_decode(header)))
+        requirements = PaymentRequirements(
+            scheme="exact", network=PAYMENT_NETWORK, asset=payment_asset, max_amount_required=payment_amount,
+            resource=str(request.url), description="", mime_type="", pay_to=PAYTO_ADDRESS, max_timeout_seconds=60,
+            extra=payment_domain,
+        )
+        verify_response = await payment_facilitator.verify(payment, requirements)
+    except Exception as e:
+        logger.warning("Payment verification failed", extra={"error": str(e)})
+        return None
+    return verify_response.payer.lower() if verify_response.is_valid and verify_response.payer else None
+
+@app.middleware("http")
+async def idempotent_writes(request, call_next):
+    """
+    Replay writes retried with the same Idempotency-Key; runs after admission,
+    before payment (no second charge). Paid writes are scoped to the payer of a
+    verified payment, so a payer claimed by an unchecked X-PAYMENT replays nothing.
+    """
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if key is None or request.method in ("GET", "HEAD", "OPTIONS") or IDEMPOTENCY_TTL_SECONDS <= 0:
+        return await call_next(request)
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return ORJSONResponse(status_code=400,
+                              content={"detail": f"{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters"})
+
+    payer = await verified_payer(request)
+    if payer is None:
+        if request.headers.get("X-PAYMENT"):
+            return await call_next(request)  # The payment middleware refuses it
+        payer = f"ip:{request.client.host if request.client else 'unknown'}"
+    scope = (payer, key)
+    fingerprint = request_fingerprint(request.method, request.url.path, request.url.query, await request.body())
+
+    outcome, stored = await idempotency.begin(scope, fingerprint)
+    if outcome == "conflict":
+        return ORJSONResponse(status_code=422,
+                              content={"detail": f"{IDEMPOTENCY_HEADER} was already used for a different request"})
+    if outcome == "busy":
+        return ORJSONResponse(status_code=409, content={"detail": "A request with this key is still in progress"},
+                              headers={"Retry-After": "1"})
+    if outcome == "replay":
+        response = Response(content=stored.body, status_code=stored.status)
+        response.raw_headers = [*stored.headers, (REPLAYED_HEADER.lower().encode(), b"true")]
+        return response
+
+    record = None
+    try:
+        response = await call_next(request)
+        if not 200 <= response.status_code < 300:
+            return response  # Not paid for, so a retry runs again
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        record = StoredResponse(fingerprint, response.status_code, list(response.raw_headers), body)
+        replay = Response(content=body, status_code=response.status_code)
+        replay.raw_headers = record.headers
+        return replay
+    finally:
+        idempotency.finish(scope, record)
+
+@app.middleware("http")
+async def admission(request, call_next):
+    """Per-wallet rate limits and load shedding; registered after the payment middleware so it runs first"""
+    if request.url.path in ADMISSION_EXEMPT:
+        return await call_next(request)
+
+    is_write = request.method not in ("GET", "HEAD")
+    wallet = limiter_key(request.headers.get("X-PAYMENT"), request.client.host if request.client else "unknown")
+
+    wait = limiter.check(wallet, "write" if is_write else "read")
+    if wait:
+        return ORJSONResponse(
+            status_code=429,
+            content={"detail": "Rate limit exceeded"},
+            headers={"Retry-After": str(math.ceil(min(wait, 3600)))}
+        )
+
+    retry_after = shedder.admit(is_write)
+    if retry_after:
+        return ORJSONResponse(
+            status_code=503,
+            content={"detail": "Server overloaded, retry later"},
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+
+    started = time.monotonic()
+    try:
+        return await call_next(request)
+    finally:
+        shedder.done(is_write, time.monotonic() - started)
+
+@app.middleware("http")
+async def route_context(request, call_next):
+    """Expose the current route to log records (used for per-route sampling)"""
+    token = current_route.set(f"{request.method} {request.url.path}")
+    try:
+        return await call_next(request)
+    finally:
+        current_route.reset(token)
+
+@app.exception_handler(RpcUnavailable)
+async def rpc_unavailable(request, e: RpcUnavailable):
+    """503 + Retry-After for RPC outages not handled by the route itself"""
+    return ORJSONResponse(status_code=503, content={"detail": str(e)},
+                          headers={"Retry-After": str(math.ceil(e.retry_after))})
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
     return {"message": "Arkiv API with X402 Payments", "status": "healthy"}
 
+@app.get("/ready")
+async def ready():
+    """Readiness endpoint: 200 only once the Arkiv client is built and warmed up"""
+    if readiness["ready"]:
+        return {"status": "ready", "warmup_seconds": readiness["warmup_seconds"]}
+    status = "failed" if readiness["error"] else "warming"
+    return ORJSONResponse(status_code=503, content={"status": status, "error": readiness["error"]})
+
+@app.get("/metrics")
+async def metrics():
+    """Operational counters for this worker"""
+    return {
+        "admission": {**shedder.stats(), "rate_limited": limiter.limited},
+        "idempotency": idempotency.stats(),
+        "singleflight": reads.stats(),
+        "keepalive": keepalive.stats(),
+        "events": {"published": event_hub.published, "attribute_fetches": event_hub.fetches,
+                   **(event_source.stats() if event_source else {"running": False})},
+        "webhooks": webhooks.stats(),
+        "streams": streams.stats(),
+        "history": history_recorder.stats(),
+        "series": series_recorder.stats(),
+        "alerts": alerts.stats(),
+        "wallets": wallet_index.stats(),
+        "signers": signer_pool.stats() if signer_pool else {"signers": []},
+        "transactions": {**tx_params.stats(), "receipts": receipts.stats()},
+        "rpc": rpc_guard.stats(),
+        "memory_node": client.provider.node.stats() if ARKIV_BACKEND == "memory" and client else None,
+        "cache": {"entity_meta": entity_meta.stats(), "query": query_cache.stats()},
+        "logging": logging_stats(),
+    }
+
 @app.post("/entities")
-async def create(
+def create(
+    request: Request,
     payload: bytes = Body(...),
     content_type: str = Body("text/plain"),
     attributes: Optional[Dict[str, Any]] = Body(None),
-    ttl: int = Body(86400)  # Default 1 day in seconds
+    ttl: int = Body(86400),  # Default 1 day in seconds
+    owner: Optional[str] = Body(None),  # Address, "payer" or "backend"
+    confirm: Optional[str] = None
 ):
-    """Creates entity on behalf of caller, optionally transfer ownership"""
+    """Creates entity on behalf of caller, optionally owned by the caller (or another wallet)"""
     try:
+        confirmations = parse_confirm(confirm)
+
         # Validate attributes
         if attributes is not None and not isinstance(attributes, dict):
             raise HTTPException(status_code=400, detail="attributes must be a dictionary")
 
-        client = get_arkiv_client()
+        owner = owner or CREATE_DEFAULT_OWNER
+        if owner == "payer":
+            owner = paying_wallet(request)
+            if owner is None:
+                raise HTTPException(status_code=400, detail="No paying wallet to transfer the entity to")
+        elif owner != "backend" and not sdk.is_address(owner):
+            raise HTTPException(status_code=400, detail="owner must be an address, \"payer\" or \"backend\"")
 
-        # Create entity
-        entity_key, receipt = client.arkiv.create_entity(
-            payload=payload,
-            content_type=content_type,
-            attributes=attributes or {},
-            expires_in=ttl
-        )
+        # Tag the entity with the paying wallet so it is listed by GET /me/entities
+        attributes = dict(attributes or {})
+        payer = paying_wallet(request)
+        if payer and WALLET_ATTRIBUTE not in attributes:
+            attributes[WALLET_ATTRIBUTE] = payer
 
-        print(f'Created entity {entity_key} with receipt {receipt}')
+        signers = get_signer_pool()
 
-        return JSONResponse(
-            status_code=201,
-            content={
-                "entity_key": entity_key,
-                "tx_hash": receipt.tx_hash.hex() if hasattr(receipt.tx_hash, 'hex') else str(receipt.tx_hash)
-            }
-        )
+        # Create entity with the least busy signer, then hand it over unless the backend keeps it
+        keep = owner == "backend" or signers.owns(owner)
+        with signers.use(None if owner == "backend" else owner) as client:
+            signer = client.eth.default_account
+            if keep:
+                owner = signer
+
+            def created(receipt):
+                invalidate_entity(receipt.creates[0].key)
+                wallet_index.put(receipt.creates[0].key, attributes, signer)
+
+            # The key is only known from the receipt, so a hand-over waits for the create to be mined
+            tracked = submit_write(
+                client, sdk.create_operations(payload, content_type, attributes, ttl),
+                confirmations if keep else max(confirmations, 1), on_receipt=created
+            )
+            entity_key = tracked.receipt.creates[0].key if tracked.receipt else None
+
+            transfer = None
+            if not keep:
+                if entity_key is None:
+                    raise RuntimeError(f"Create {tracked.hash} is not mined yet, entity was not transferred to {owner}")
+
+                def transferred(receipt):
+                    invalidate_entity(entity_key)
+                    wallet_index.set_owner(entity_key, owner)
+
+                try:
+                    transfer = submit_write(client, sdk.change_owner_operations([(entity_key, owner)]),
+                                            confirmations, on_receipt=transferred)
+                except Exception as e:
+                    raise RuntimeError(f"Entity {entity_key} was created but not transferred to {owner}: {e}") from e
+
+        logger.info("Created entity", extra={"entity_key": entity_key, "tx_hash": tracked.hash, "sampled": True})
+
+        content = {
+            "entity_key": entity_key,
+            "tx_hash": tracked.hash,
+            "owner": owner
+        }
+        if transfer is not None:
+            content["transfer_tx_hash"] = transfer.hash
+        return write_response(transfer or tracked, content, status_code=201)
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to create entity: {str(e)}")
+        raise request_failed("create entity", e)
 
 @app.get("/entities/query")
-async def query(
+def query(
     query: str,
     limit: int = 20,
-    include_payload: bool = False
+    include_payload: bool = False,
+    if_none_match: Optional[str] = Header(None)
 ):
     """Completes query on behalf of caller, returns result"""
     try:
-        client = get_arkiv_client()
-
         if not query:
             raise HTTPException(status_code=400, detail="query parameter is required")
 
-        # Build fields
-        fields = KEY | ATTRIBUTES
-        if include_payload:
-            fields |= PAYLOAD
+        body = run_query(query, limit, include_payload)
 
-        options = QueryOptions(fields, max_results_per_page=limit)
-        results = list(client.arkiv.query_entities(query=query, options=options))
+        return json_response(
+            body, if_none_match=if_none_match,
+            headers=cache_headers(None, None, BLOCK_TIME_SECONDS, shared=CACHE_SHARED)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise request_failed("query entities", e)
 
-        # Format results
-        formatted_results = []
-        for entity in results:
-            result = {
-                "key": entity.key,
-                "attributes": entity.attributes
-            }
+@app.get("/entities/stream")
+async def stream(
+    query: Optional[str] = None,
+    events: Optional[str] = None,
+    last_event_id: Optional[str] = Header(None)
+):
+    """Server-Sent Events stream of entity events matching query, resuming after Last-Event-ID"""
+    sub, complete = await open_stream(query, events, last_event_id)
 
-            if include_payload and entity.payload:
+    async def body():
+        try:
+            if not complete:
+                yield sse_message("gap", {"detail": "Events since Last-Event-ID are no longer buffered"})
+            while True:
                 try:
-                    result["payload"] = entity.payload.decode('utf-8')
-                except:
-                    result["payload"] = entity.payload.hex()
+                    event_id, event = await asyncio.wait_for(sub.next(), STREAM_PING_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+                    continue
+                if event_id == "overflow":
+                    yield sse_message("overflow", {"detail": "Client too slow, reconnect with Last-Event-ID"})
+                    return
+                yield sse_message(event["type"], event, id=event_id)
+        finally:
+            streams.unsubscribe(sub)
 
-            formatted_results.append(result)
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-        return {
-            "query": query,
-            "count": len(formatted_results),
-            "results": formatted_results
-        }
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to query entities: {str(e)}")
+@app.post("/entities/stream/ticket")
+def stream_ticket():
+    """Issues a single-use ticket for the WebSocket stream"""
+    ticket = secrets.token_urlsafe(24)
+    stream_tickets.set(ticket, True)
+    return {"ticket": ticket, "expires_in": 60}
+
+@app.websocket("/entities/stream/ws")
+async def stream_ws(
+    websocket: WebSocket,
+    ticket: str,
+    query: Optional[str] = None,
+    events: Optional[str] = None,
+    last_event_id: Optional[str] = None
+):
+    """WebSocket stream of entity events matching query; requires a ticket from /entities/stream/ticket"""
+    if not stream_tickets.get(ticket):
+        await websocket.close(code=1008, reason="Invalid or expired ticket")
+        return
+    stream_tickets.delete(ticket)
+
+    try:
+        sub, complete = await open_stream(query, events, last_event_id)
+    except HTTPException as e:
+        await websocket.close(code=1008 if e.status_code == 400 else 1013, reason=e.detail)
+        return
+
+    await websocket.accept()
+    try:
+        if not complete:
+            await websocket.send_text(ws_message("gap", "Events since last_event_id are no longer buffered"))
+        while True:
+            try:
+                event_id, event = await asyncio.wait_for(sub.next(), STREAM_PING_SECONDS)
+            except asyncio.TimeoutError:
+                await websocket.send_text(ws_message("ping"))
+                continue
+            if event_id == "overflow":
+                await websocket.send_text(ws_message("overflow", "Client too slow, reconnect with last_event_id"))
+                await websocket.close(code=1013)
+                return
+            await websocket.send_text(dumps({"id": event_id, "event": event}).decode())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        streams.unsubscribe(sub)
 
 @app.get("/entities/{entity_key}")
-async def read(entity_key: str):
+def read(entity_key: str, if_none_match: Optional[str] = Header(None)):
     """Reads blockchain based on entity_key"""
     try:
-        client = get_arkiv_client()
+        # Revalidation: answer from cached metadata, or a payload-less lookup
+        if if_none_match:
+            meta = entity_meta.get(entity_key)
+            if meta is None:
+                meta = remember_entity_meta(get_entity_or_404(entity_key, fields=sdk.META_FIELDS))
+            if etag_matches(if_none_match, meta["etag"]):
+                return not_modified(meta["etag"], entity_cache_headers(meta))
 
-        if not entity_exists(entity_key):
-            raise HTTPException(status_code=404, detail="Entity not found")
-
-        entity = client.arkiv.get_entity(entity_key)
+        entity = get_entity_or_404(entity_key)
+        meta = remember_entity_meta(entity)
         data = (entity.payload or b"").decode("utf-8", errors="ignore")
 
-        return {
+        return json_response({
             "data": data,
             "entity": {
                 "key": entity.key,
@@ -172,93 +1025,103 @@ async def read(entity_key: str):
                 "content_type": entity.content_type,
                 "attributes": entity.attributes
             }
-        }
+        }, etag=meta["etag"], headers=entity_cache_headers(meta))
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to read entity: {str(e)}")
+        raise request_failed("read entity", e)
 
 @app.put("/entities/{entity_key}")
-async def update(
+def update(
     entity_key: str,
+    request: Request,
     attributes: Optional[Dict[str, Any]] = Body(None),
     payload: Optional[bytes] = Body(None),
     content_type: Optional[str] = Body(None),
-    ttl: Optional[int] = Body(None)
+    ttl: Optional[int] = Body(None),
+    confirm: Optional[str] = None
 ):
     """Updates an entity key"""
     try:
-        client = get_arkiv_client()
-
-        if not entity_exists(entity_key):
-            raise HTTPException(status_code=404, detail="Entity not found")
+        confirmations = parse_confirm(confirm)
+        entity = get_entity_or_404(entity_key, fields=sdk.KEY | sdk.OWNER)
+        require_backend_owner(entity)
 
         # Build update parameters
         update_params = {"entity_key": entity_key}
 
         if attributes is not None:
+            # Replacing the attributes keeps the entity's wallet tag
+            wallet = wallet_index.wallet_of(entity_key) or paying_wallet(request)
+            if wallet and WALLET_ATTRIBUTE not in attributes:
+                attributes = {**attributes, WALLET_ATTRIBUTE: wallet}
             update_params["attributes"] = attributes
         if payload is not None:
             update_params["payload"] = payload
         if content_type is not None:
             update_params["content_type"] = content_type
         if ttl is not None:
-            update_params["expires_in"] = client.arkiv.to_seconds(seconds=ttl)
+            update_params["expires_in"] = ttl
 
-        receipt = client.arkiv.update_entity(**update_params)
+        def updated(receipt):
+            invalidate_entity(entity_key)
+            if attributes is not None:
+                wallet_index.put(entity_key, attributes)
 
-        return {
+        # Only the owner may update, so the signer owning the entity sends it
+        with get_signer_pool().use(entity.owner) as client:
+            tracked = submit_write(client, sdk.update_operations(**update_params), confirmations, on_receipt=updated)
+
+        return write_response(tracked, {
             "status": "success",
             "entity_key": entity_key,
-            "tx_hash": receipt.tx_hash.hex() if hasattr(receipt.tx_hash, 'hex') else str(receipt.tx_hash)
-        }
+            "tx_hash": tracked.hash
+        })
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to update entity: {str(e)}")
+        raise request_failed("update entity", e)
 
 @app.delete("/entities/{entity_key}")
-async def delete(entity_key: str):
+def delete(entity_key: str, confirm: Optional[str] = None):
     """Deletes an entity"""
     try:
-        client = get_arkiv_client()
+        confirmations = parse_confirm(confirm)
+        entity = get_entity_or_404(entity_key, fields=sdk.KEY | sdk.OWNER)
+        require_backend_owner(entity)
 
-        if not entity_exists(entity_key):
-            raise HTTPException(status_code=404, detail="Entity not found")
+        def deleted(receipt):
+            invalidate_entity(entity_key)
+            wallet_index.remove(entity_key)
+            keepalive.forget([entity_key])
 
-        receipt = client.arkiv.delete_entity(entity_key)
+        with get_signer_pool().use(entity.owner) as client:
+            tracked = submit_write(client, sdk.delete_operations(entity_key), confirmations, on_receipt=deleted)
 
-        return {
+        return write_response(tracked, {
             "status": "success",
             "entity_key": entity_key,
-            "tx_hash": receipt.tx_hash.hex() if hasattr(receipt.tx_hash, 'hex') else str(receipt.tx_hash)
-        }
+            "tx_hash": tracked.hash
+        })
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to delete entity: {str(e)}")
+        raise request_failed("delete entity", e)
 
 @app.post("/entities/transfer")
-async def transfer(
+def transfer(
     entity_key: str = Body(...),
-    new_owner: str = Body(...)  # ideally we extract address from x402 headers?
+    new_owner: str = Body(...),  # ideally we extract address from x402 headers?
+    confirm: Optional[str] = None
 ):
     """Transfers ownership of entity from backend wallet to client"""
     try:
-        client = get_arkiv_client()
+        confirmations = parse_confirm(confirm)
+        signers = get_signer_pool()
 
-        if not entity_exists(entity_key):
-            raise HTTPException(status_code=404, detail="Entity not found")
-
-        entity = client.arkiv.get_entity(entity_key)
+        entity = get_entity_or_404(entity_key, fields=sdk.KEY | sdk.OWNER)
         owner = entity.owner
-
-        # Check if backend owns the entity
-        if BACKEND_WALLET and BACKEND_WALLET.lower() != owner.lower():
-            raise HTTPException(
-                status_code=403,
-                detail=f"Backend is not owner, this is owner: {owner}"
-            )
+        require_backend_owner(entity)
 
         # Check if new owner is different
         if new_owner.lower() == owner.lower():
@@ -267,26 +1130,416 @@ async def transfer(
                 detail=f"new_owner {new_owner} already owns entity {entity_key}"
             )
 
-        receipt = client.arkiv.change_owner(entity_key, new_owner)
+        def transferred(receipt):
+            invalidate_entity(entity_key)
+            wallet_index.set_owner(entity_key, new_owner)
+            keepalive.forget([entity_key])  # The new owner keeps it alive from now on
 
-        return {
+        with signers.use(owner) as client:
+            tracked = submit_write(client, sdk.change_owner_operations([(entity_key, new_owner)]), confirmations,
+                                   on_receipt=transferred)
+
+        return write_response(tracked, {
             "status": "success",
             "entity_key": entity_key,
             "old_owner": owner,
             "new_owner": new_owner,
-            "tx_hash": receipt.tx_hash.hex() if hasattr(receipt.tx_hash, 'hex') else str(receipt.tx_hash)
+            "tx_hash": tracked.hash
+        })
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise request_failed("transfer ownership", e)
+
+@app.post("/entities/transfer/bulk")
+def transfer_bulk(
+    request: Request,
+    new_owner: str = Body(...),
+    entity_keys: Optional[List[str]] = Body(None),
+    query: Optional[str] = Body(None),
+    confirm: Optional[str] = None
+):
+    """Transfers many entities (listed, or matching a query) from backend wallet to client"""
+    if (entity_keys is None) == (query is None):
+        raise HTTPException(status_code=400, detail="Provide either entity_keys or query")
+    if not sdk.is_address(new_owner):
+        raise HTTPException(status_code=400, detail="new_owner must be an address")
+    try:
+        confirmations = parse_confirm(confirm)
+        client = get_arkiv_client()
+        signers = get_signer_pool()
+
+        # One batched read for every owner
+        if query is not None:
+            # A query only selects the paying wallet's entities (those tagged with it)
+            payer = paying_wallet(request)
+            if payer is None:
+                raise HTTPException(status_code=400, detail="No paying wallet to select entities for")
+            compile_query(query)  # Checked alone, so it cannot escape the parentheses below
+            tagged = f'{WALLET_ATTRIBUTE} = "{payer}"'
+            query = f"({query}) && {tagged}" if query.strip() else tagged
+            owners = sdk.query_owners(client, query, TRANSFER_MAX_ENTITIES)
+            keys = list(owners)
+        else:
+            keys = list(dict.fromkeys(key.lower() for key in entity_keys))
+            owners = sdk.get_owners(client, [key for key in keys if sdk.is_entity_key(key)])
+        if len(keys) > TRANSFER_MAX_ENTITIES:
+            raise HTTPException(status_code=400, detail=f"At most {TRANSFER_MAX_ENTITIES} entities per request")
+
+        results = {}
+        for key in keys:
+            owner = owners.get(key)
+            if owner is None:
+                results[key] = {"entity_key": key, "status": "not_found"}
+            elif owner.lower() == new_owner.lower():
+                results[key] = {"entity_key": key, "status": "already_owner"}
+            elif not signers.owns(owner):
+                results[key] = {"entity_key": key, "status": "not_owner", "owner": owner}
+
+        # Each signer sends the transfers of the entities it owns, all signers at once
+        by_signer: Dict[str, List] = {}
+        for key in keys:
+            if key not in results:
+                by_signer.setdefault(owners[key].lower(), []).append((key, new_owner))
+
+        def send(owner: str, transfers: List) -> List[Dict[str, Any]]:
+            with signers.use(owner) as signer:
+                return sdk.send_change_owners(signer, transfers, tx_params, batch_size=TRANSFER_BATCH_SIZE)
+
+        def on_receipt(keys: List[str]):
+            def transferred(receipt):
+                for key in keys:
+                    invalidate_entity(key)
+                    wallet_index.set_owner(key, new_owner)
+                keepalive.forget(keys)
+            return transferred
+
+        transactions = []
+        if by_signer:
+            with ThreadPoolExecutor(max_workers=len(by_signer)) as pool:
+                for sent in pool.map(lambda item: send(*item), by_signer.items()):
+                    transactions.extend(sent)
+
+        # Every transaction is sent before the first wait, so they are mined together
+        deadline = time.monotonic() + TX_WAIT_SECONDS
+        for tx in transactions:
+            if tx["tx_hash"] is not None:
+                tracked = track_write(tx["tx_hash"], tx["kind"], tx["size"], on_receipt(tx["keys"]))
+                receipts.wait(tracked, confirmations, max(0.0, deadline - time.monotonic()))
+                if tracked.state in ("failed", "dropped"):
+                    tx["error"] = tracked.error
+                tx["state"] = tracked.state
+            for key in tx["keys"]:
+                if tx["error"]:
+                    status = "failed"
+                else:
+                    status = "pending" if tx["state"] == "pending" else "transferred"
+                results[key] = {"entity_key": key, "status": status, "tx_hash": tx["tx_hash"]}
+                if tx["error"]:
+                    results[key]["error"] = tx["error"]
+
+        transferred = sum(1 for r in results.values() if r["status"] == "transferred")
+        pending = sum(1 for r in results.values() if r["status"] == "pending")
+        logger.info("Bulk transfer", extra={"entities": len(keys), "transferred": transferred, "pending": pending,
+                                            "transactions": len(transactions), "sampled": True})
+        if transferred + pending == len(keys):
+            status = "pending" if pending else "success"
+        else:
+            status = "partial" if transferred + pending else "failed"
+        return ORJSONResponse(
+            status_code=202 if status == "pending" else 200,
+            content={
+                "status": status,
+                "new_owner": new_owner,
+                "transferred": transferred,
+                "pending": pending,
+                "total": len(keys),
+                "transactions": [tx["tx_hash"] for tx in transactions if tx["tx_hash"]],
+                "results": [results[key] for key in keys]
+            }
+        )
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise request_failed("transfer ownership", e)
+
+@app.post("/entities/{entity_key}/keepalive")
+def keep_alive(request: Request, entity_key: str, lifetime: int = Body(..., embed=True)):
+    """Keeps an entity of the paying wallet alive for `lifetime` seconds, extending it shortly before each expiry"""
+    try:
+        if not 0 < lifetime <= KEEPALIVE_MAX_SECONDS:
+            raise HTTPException(status_code=400,
+                                detail=f"lifetime must be between 1 and {KEEPALIVE_MAX_SECONDS} seconds")
+        payer = paying_wallet(request)
+        if payer is None:
+            raise HTTPException(status_code=400, detail="No paying wallet for this request")
+
+        entity = get_entity_or_404(entity_key, fields=sdk.KEY | sdk.OWNER | sdk.ATTRIBUTES | sdk.EXPIRATION)
+        if not wallet_controls(entity, payer):
+            raise HTTPException(status_code=403, detail="Entity is not owned by or held for the paying wallet")
+        current = keepalive.get(entity_key)
+        if current is not None and current.get("payer") not in (None, payer.lower()):
+            raise HTTPException(status_code=403, detail="Entity is kept alive by another wallet")
+        head = head_block()
+        if head is None:
+            raise HTTPException(status_code=503, detail="Current block unavailable, retry later")
+
+        entry = keepalive.register(entity_key, lifetime, entity.expires_at_block, head, payer)
+
+        return {
+            "status": "success",
+            "entity_key": entity_key,
+            "expires_at_block": entry["expires_at_block"],
+            "keep_alive_until_block": entry["until_block"]
         }
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to transfer ownership: {str(e)}")
+        raise request_failed("register keep-alive", e)
+
+@app.delete("/entities/{entity_key}/keepalive")
+def stop_keep_alive(request: Request, entity_key: str):
+    """Stops keeping an entity alive (only for the wallet that registered it); it expires at its current expiry block"""
+    entry = keepalive.get(entity_key)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Entity is not kept alive")
+    payer = paying_wallet(request)
+    if payer is None or entry.get("payer") != payer.lower():
+        raise HTTPException(status_code=403, detail="Entity is kept alive by another wallet")
+    keepalive.unregister(entity_key)
+    return {"status": "success", "entity_key": entity_key}
+
+@app.get("/entities/{entity_key}/history")
+def entity_history(entity_key: str, limit: int = 50, cursor: int = 0, order: str = "desc"):
+    """Recorded versions of an entity (block, tx hash, attribute diff, payload hash), newest first by default"""
+    if not 1 <= limit <= 500:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 500")
+    if cursor < 0 or order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="cursor must be >= 0 and order asc or desc")
+    if not sdk.is_entity_key(entity_key):
+        raise HTTPException(status_code=404, detail="No history recorded for entity")
+
+    versions, next_cursor, total = history.versions(entity_key, cursor=cursor, limit=limit,
+                                                    newest_first=order == "desc")
+    if not total:
+        raise HTTPException(status_code=404, detail="No history recorded for entity")
+    return {
+        "entity_key": entity_key,
+        "total": total,
+        "count": len(versions),
+        "versions": versions,
+        "next_cursor": next_cursor
+    }
 
 @app.post("/entities/events")
-async def events():
-    """Fires up event listener for arkiv events - returns webhook url"""
-    # TODO: Implement event listener
-    raise HTTPException(status_code=501, detail="Event listener not yet implemented")
+def events(
+    request: Request,
+    url: str = Body(...),
+    query: Optional[str] = Body(None),
+    events: Optional[List[str]] = Body(None),
+    secret: Optional[str] = Body(None)
+):
+    """Registers a webhook receiving batches of entity events that match query"""
+    try:
+        validate_url(url, allow_private=WEBHOOK_ALLOW_PRIVATE)
+        sub = webhooks.register(url, query=query, events=events, secret=secret, payer=paying_wallet(request))
+
+        return ORJSONResponse(
+            status_code=201,
+            content={
+                "subscription_id": sub["id"],
+                "url": sub["url"],
+                "query": sub["query"],
+                "events": sub["events"]
+            }
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise request_failed("register webhook", e)
+
+@app.delete("/entities/events/{subscription_id}")
+def delete_events(request: Request, subscription_id: str):
+    """Removes a webhook subscription (only for the wallet that registered it)"""
+    sub = webhooks.get(subscription_id)
+    if sub is None:
+        raise HTTPException(status_code=404, detail="Subscription not found")
+    payer = paying_wallet(request)
+    if payer is None or sub.get("payer") != payer.lower():
+        raise HTTPException(status_code=403, detail="Subscription belongs to another wallet")
+    if not webhooks.unregister(subscription_id):
+        raise HTTPException(status_code=404, detail="Subscription not found")
+    return {"status": "success", "subscription_id": subscription_id}
+
+@app.get("/series/{stash}")
+def series(
+    stash: str,
+    fields: Optional[str] = None,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    bucket: Optional[str] = None,
+    limit: int = 1000,
+    if_none_match: Optional[str] = Header(None)
+):
+    """
+    Snapshot metrics of a stash with start <= ts < end (unix ms), most recent
+    `limit` points, or with `bucket` (e.g. 1h, 1d) min/max/mean/last/count per bucket
+    """
+    if not 1 <= limit <= SERIES_MAX_POINTS:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {SERIES_MAX_POINTS}")
+    names = [f.strip() for f in fields.split(",") if f.strip()] if fields else SERIES_FIELDS
+    unknown = set(names) - set(SERIES_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    try:
+        bucket_ms = parse_duration(bucket) if bucket else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    stored = series_store.get(stash)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Series not found")
+
+    if bucket_ms is not None:
+        buckets, stats = stored.aggregate(bucket_ms, start, end, names)
+        first = max(0, len(buckets) - limit)
+        return json_response(
+            {
+                "stash": stash,
+                "bucket": bucket_ms,
+                "total": len(buckets),
+                "count": len(buckets) - first,
+                "truncated": first > 0,
+                "ts": buckets[first:],
+                "values": {name: {k: v[first:] for k, v in stats[name].items()} for name in names}
+            },
+            if_none_match=if_none_match
+        )
+
+    lo, hi = stored.window(start, end)
+    columns = stored.columns()
+    first = max(lo, hi - limit)
+
+    return json_response(
+        {
+            "stash": stash,
+            "total": hi - lo,
+            "count": hi - first,
+            "truncated": first > lo,
+            "ts": columns["ts"][first:hi],
+            "block": columns["block"][first:hi],
+            "values": {name: columns[name][first:hi] for name in names}
+        },
+        if_none_match=if_none_match
+    )
+
+@app.get("/me/entities")
+def my_entities(request: Request, limit: int = 50, cursor: int = 0):
+    """Entities of the paying wallet: tagged with it (held by the backend) or owned by it"""
+    if not 1 <= limit <= 500:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 500")
+    if cursor < 0:
+        raise HTTPException(status_code=400, detail="cursor must be >= 0")
+    wallet = paying_wallet(request)
+    if wallet is None:
+        raise HTTPException(status_code=400, detail="No paying wallet for this request")
+    if not wallet_index.loaded:
+        raise HTTPException(status_code=503, detail="Wallet index is loading, retry later")
+
+    entities, next_cursor, total = wallet_index.keys(wallet, cursor=cursor, limit=limit)
+    return {
+        "wallet": wallet.lower(),
+        "total": total,
+        "count": len(entities),
+        "entities": [
+            {"entity_key": e["entity_key"], "owner": e["owner"], "custody": e["owner"] != wallet.lower()}
+            for e in entities
+        ],
+        "next_cursor": next_cursor
+    }
+
+@app.get("/tx/{tx_hash}")
+def transaction(tx_hash: str):
+    """State of a transaction: pending, included, final, failed or dropped, with its confirmations"""
+    tx_hash = tx_hash.lower()
+    if not is_tx_hash(tx_hash):
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    tracked = receipts.get(tx_hash)
+    if tracked is not None:
+        return tracked.to_dict()
+    try:
+        state = receipts.lookup(tx_hash)
+    except Exception as e:
+        raise request_failed("look up transaction", e)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    return state
+
+@app.post("/tx/{tx_hash}/notify")
+def notify_transaction(tx_hash: str, url: str = Body(...), secret: Optional[str] = Body(None)):
+    """POSTs the transaction's state to url once it is final, failed or dropped"""
+    if not is_tx_hash(tx_hash.lower()):
+        raise HTTPException(status_code=400, detail="tx_hash must be a 32-byte hex hash")
+    try:
+        validate_url(url, allow_private=WEBHOOK_ALLOW_PRIVATE)
+        tracked = receipts.subscribe(tx_hash.lower(), url, secret=secret)
+        return ORJSONResponse(status_code=201, content={"tx_hash": tracked.hash, "state": tracked.state, "url": url})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise request_failed("register notification", e)
+
+@app.post("/alerts")
+def create_alert(
+    request: Request,
+    stash: str = Body(...),
+    field: str = Body(...),
+    kind: str = Body(...),
+    threshold: float = Body(...),
+    url: str = Body(...),
+    window: Optional[int] = Body(None),
+    cooldown: float = Body(ALERT_COOLDOWN_SECONDS),
+    secret: Optional[str] = Body(None)
+):
+    """Registers an alert rule on a stash's snapshot series (or every stash, "*"), delivered to url"""
+    try:
+        validate_url(url, allow_private=WEBHOOK_ALLOW_PRIVATE)
+        rule = alerts.register(stash, field, kind, threshold, url, window=window, cooldown=cooldown, secret=secret,
+                               payer=paying_wallet(request))
+
+        return ORJSONResponse(
+            status_code=201,
+            content={
+                "rule_id": rule["id"],
+                "stash": rule["stash"],
+                "field": rule["field"],
+                "kind": rule["kind"],
+                "threshold": rule["threshold"],
+                "window": rule["window"],
+                "url": rule["url"],
+                "cooldown": rule["cooldown"]
+            }
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise request_failed("register alert", e)
+
+@app.delete("/alerts/{rule_id}")
+def delete_alert(request: Request, rule_id: str):
+    """Removes an alert rule (only for the wallet that registered it)"""
+    rule = alerts.get(rule_id)
+    if rule is None:
+        raise HTTPException(status_code=404, detail="Alert rule not found")
+    payer = paying_wallet(request)
+    if payer is None or rule.get("payer") != payer.lower():
+        raise HTTPException(status_code=403, detail="Alert rule belongs to another wallet")
+    if not alerts.unregister(rule_id):
+        raise HTTPException(status_code=404, detail="Alert rule not found")
+    return {"status": "success", "rule_id": rule_id}
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000, log_config=None)
\ No newline at end of file
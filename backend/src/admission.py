@@ -0,0 +1,125 @@
+"""
+Admission control: per-wallet token buckets and global load shedding.
+
+Runs in front of the x402 middleware, so rejected requests are never verified
+or charged. Buckets are keyed by the client IP plus the payer wallet read
+from the X-PAYMENT header, with separate buckets for reads (GET/HEAD) and
+writes. The header is not verified yet at this point, so the payer alone is
+never the key: anyone could claim a victim's wallet and drain its buckets.
+"""
+
+import base64
+import json
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, up to `burst` stored"""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, now: float) -> float:
+        """Consume a token; returns 0 on success, else seconds until one is available"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        if self.rate <= 0:
+            return math.inf
+        return (1 - self.tokens) / self.rate
+
+
+def payer_from_header(x_payment: Optional[str]) -> Optional[str]:
+    """Payer wallet from an X-PAYMENT header, without verifying the signature"""
+    if not x_payment:
+        return None
+    try:
+        payment = json.loads(base64.b64decode(x_payment))
+        payer = payment["payload"]["authorization"]["from"]
+    except (ValueError, KeyError, TypeError):
+        return None
+    return payer.lower() if isinstance(payer, str) else None
+
+
+def limiter_key(x_payment: Optional[str], client_ip: str) -> str:
+    """Bucket key of a request: its client IP, plus the (claimed) payer if it sent a payment"""
+    payer = payer_from_header(x_payment)
+    return f"ip:{client_ip}" if payer is None else f"{payer}@{client_ip}"
+
+
+class WalletLimiter:
+    """Token buckets per (wallet, read|write), keeping at most max_wallets idle-evicted entries"""
+
+    def __init__(self, read_rate: float, read_burst: float, write_rate: float, write_burst: float,
+                 max_wallets: int = 100000):
+        self.limits = {"read": (read_rate, read_burst), "write": (write_rate, write_burst)}
+        self.max_wallets = max_wallets
+        self.buckets: "OrderedDict[Tuple[str, str], TokenBucket]" = OrderedDict()
+        self.limited = {"read": 0, "write": 0}
+
+    def check(self, wallet: str, kind: str) -> float:
+        """0 if admitted, else seconds to wait"""
+        key = (wallet, kind)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(*self.limits[kind])
+            self.buckets[key] = bucket
+            if len(self.buckets) > self.max_wallets:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+        wait = bucket.take(time.monotonic())
+        if wait:
+            self.limited[kind] += 1
+        return wait
+
+
+class LoadShedder:
+    """
+    Tracks requests in flight (each one holds an RPC or is queued for one) and
+    rejects new work once the backlog or the pending writes pass a threshold.
+    """
+
+    def __init__(self, max_inflight: int, max_writes: int):
+        self.max_inflight = max_inflight
+        self.max_writes = max_writes
+        self.inflight = 0
+        self.writes = 0
+        self.shed = 0
+        self.latency = 0.5  # EWMA of request latency, seconds
+
+    def admit(self, is_write: bool) -> float:
+        """0 if admitted (caller must call done()), else suggested Retry-After seconds"""
+        if self.inflight >= self.max_inflight or (is_write and self.writes >= self.max_writes):
+            self.shed += 1
+            # Time for the current backlog to drain, assuming it is served max_inflight at a time
+            backlog = max(self.inflight, 1) / max(self.max_inflight, 1)
+            return max(1.0, self.latency * backlog)
+        self.inflight += 1
+        if is_write:
+            self.writes += 1
+        return 0.0
+
+    def done(self, is_write: bool, elapsed: float) -> None:
+        self.inflight -= 1
+        if is_write:
+            self.writes -= 1
+        self.latency = 0.9 * self.latency + 0.1 * elapsed
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "inflight": self.inflight,
+            "pending_writes": self.writes,
+            "shed": self.shed,
+            "latency_ewma": round(self.latency, 4),
+        }
@@ -0,0 +1,300 @@
+"""
+Threshold alerts on snapshot series.
+
+A rule watches one field of one series (or of every series, stash "*"):
+
+    {"id", "stash", "field", "kind", "threshold", "window", "url", "secret", "cooldown", "payer"}
+
+    change       |value - reference| >= threshold
+    pct_change   |value - reference| / |reference| * 100 >= threshold
+    deviation    |value - mean| >= threshold * stddev over the previous `window` values
+
+The reference of the change kinds is the first value seen, then the value at
+each alert, so slow drift fires as well as jumps. Each (rule, series) pair
+keeps O(1) state updated per appended row: a reference value, or a sliding
+window with its running mean and sum of squared deviations.
+
+Alerts are POSTed to the rule's url (signed like webhooks). Deliveries are
+debounced per (rule, series): the first alert goes out at once, later ones
+within `cooldown` seconds are coalesced into one delivery at the end of it
+(the latest alert, with the number it replaced), so a noisy series sends at
+most one request per cooldown.
+"""
+
+import logging
+import math
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+from src.localstate import JsonStore
+from src.responses import dumps
+from src.webhooks import SIGNATURE_HEADER, delivery_session, permanent_failure, sign
+
+logger = logging.getLogger(__name__)
+
+RULE_KINDS = ("change", "pct_change", "deviation")
+
+_STASH = re.compile(r"^(\*|[A-Za-z0-9_-]{1,128})$")
+
+
+class _ChangeTracker:
+    """Absolute or percentage change against a reference value, reset on every alert"""
+
+    def __init__(self, threshold: float, percent: bool):
+        self.threshold = threshold
+        self.percent = percent
+        self.reference: Optional[float] = None
+
+    def update(self, value: float) -> Optional[Dict[str, float]]:
+        reference = self.reference
+        if reference is None:
+            self.reference = value
+            return None
+        if self.percent:
+            if reference == 0:
+                return None
+            change = (value - reference) / abs(reference) * 100
+        else:
+            change = value - reference
+        if abs(change) < self.threshold:
+            return None
+        self.reference = value
+        return {"reference": reference, "change": change}
+
+
+class _DeviationTracker:
+    """Distance from the mean of the previous `window` values, in standard deviations"""
+
+    def __init__(self, threshold: float, window: int):
+        self.threshold = threshold
+        self.window = window
+        self.values: Deque[float] = deque()
+        self.mean = 0.0
+        self.m2 = 0.0  # Sum of squared deviations from the mean
+
+    def _push(self, value: float) -> None:
+        if len(self.values) < self.window:
+            # Welford's update while the window fills
+            self.values.append(value)
+            delta = value - self.mean
+            self.mean += delta / len(self.values)
+            self.m2 += delta * (value - self.mean)
+            return
+        # Replace the oldest value, keeping mean and m2 exact in O(1)
+        old = self.values.popleft()
+        self.values.append(value)
+        mean = self.mean + (value - old) / self.window
+        self.m2 = max(0.0, self.m2 + (value - old) * (value - mean + old - self.mean))
+        self.mean = mean
+
+    def update(self, value: float) -> Optional[Dict[str, float]]:
+        alert = None
+        if len(self.values) == self.window:
+            std = math.sqrt(self.m2 / self.window)
+            if std > 0 and abs(value - self.mean) >= self.threshold * std:
+                alert = {"reference": self.mean, "change": (value - self.mean) / std}
+        self._push(value)
+        return alert
+
+
+def validate_rule(rule: Dict[str, Any], fields: Iterable[str]) -> None:
+    """Raise ValueError for a malformed rule"""
+    if not isinstance(rule.get("stash"), str) or not _STASH.match(rule["stash"]):
+        raise ValueError("stash must be a stash address or *")
+    if rule.get("field") not in tuple(fields):
+        raise ValueError(f"Unknown field: {rule.get('field')}")
+    if rule.get("kind") not in RULE_KINDS:
+        raise ValueError(f"kind must be one of {', '.join(RULE_KINDS)}")
+    if not isinstance(rule.get("threshold"), (int, float)) or rule["threshold"] <= 0:
+        raise ValueError("threshold must be a positive number")
+    if rule["kind"] == "deviation" and not (isinstance(rule.get("window"), int) and rule["window"] >= 2):
+        raise ValueError("deviation rules need a window of at least 2 values")
+    if not isinstance(rule.get("cooldown"), (int, float)) or rule["cooldown"] < 0:
+        raise ValueError("cooldown must be a non-negative number of seconds")
+
+
+def _tracker(rule: Dict[str, Any]):
+    if rule["kind"] == "deviation":
+        return _DeviationTracker(rule["threshold"], rule["window"])
+    return _ChangeTracker(rule["threshold"], percent=rule["kind"] == "pct_change")
+
+
+class _Debounce:
+    """Delivery state of one (rule, series) pair"""
+
+    def __init__(self):
+        self.sent_at = -math.inf
+        self.pending: Optional[Dict[str, Any]] = None
+        self.coalesced = 0
+        self.timer: Optional[threading.Timer] = None
+
+
+class AlertEngine:
+    """
+    Rules persisted in `path` (shared by the workers), evaluated by whichever
+    worker appends to the series: call `observe` for every appended row.
+    """
+
+    def __init__(self, path: str, fields: Iterable[str], max_attempts: int = 4, backoff: float = 1.0,
+                 timeout: float = 10.0, concurrency: int = 8,
+                 post: Optional[Callable[[str, bytes, Dict[str, str]], int]] = None, allow_private: bool = False):
+        self.store = JsonStore(path)
+        self.fields = tuple(fields)
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.timeout = timeout
+        self._session = delivery_session(allow_private)
+        self.post = post or (lambda url, body, headers: self._session.post(
+            url, data=body, headers=headers, timeout=self.timeout, allow_redirects=False).status_code)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="alert")
+        self.rules: Dict[str, Dict[str, Any]] = {}
+        # Rules by stash ("*" for every series) and state by (rule id, stash)
+        self._by_stash: Dict[str, List[Dict[str, Any]]] = {}
+        self._trackers: Dict[Tuple[str, str], Any] = {}
+        self._debounce: Dict[Tuple[str, str], _Debounce] = {}
+        self._lock = threading.Lock()
+        self.evaluated = 0
+        self.fired = 0
+        self.coalesced = 0
+        self.delivered = 0
+        self.failed = 0
+        self._load(self.store.read())
+
+    def _load(self, rules: Dict[str, Dict[str, Any]]) -> None:
+        with self._lock:
+            self.rules = rules
+            by_stash: Dict[str, List[Dict[str, Any]]] = {}
+            for rule in rules.values():
+                by_stash.setdefault(rule["stash"], []).append(rule)
+            self._by_stash = by_stash
+            # Forget state of removed rules (a changed rule gets a new id)
+            self._trackers = {k: v for k, v in self._trackers.items() if k[0] in rules}
+
+    # Registry (callable from any thread)
+
+    def register(self, stash: str, field: str, kind: str, threshold: float, url: str,
+                 window: Optional[int] = None, cooldown: float = 300, secret: Optional[str] = None,
+                 payer: Optional[str] = None) -> Dict[str, Any]:
+        rule = {
+            "id": uuid.uuid4().hex,
+            "stash": stash,
+            "field": field,
+            "kind": kind,
+            "threshold": threshold,
+            "window": window,
+            "url": url,
+            "secret": secret,
+            "cooldown": cooldown,
+            "payer": payer.lower() if payer else None,  # Only this wallet may remove it
+            "created_at": int(time.time()),
+        }
+        validate_rule(rule, self.fields)
+        self._load(self.store.update(lambda rules: rules.__setitem__(rule["id"], rule)))
+        return rule
+
+    def get(self, rule_id: str) -> Optional[Dict[str, Any]]:
+        if self.store.changed():
+            self._load(self.store.read())
+        return self.rules.get(rule_id)
+
+    def unregister(self, rule_id: str) -> bool:
+        found = {}
+        def remove(rules):
+            found["rule"] = rules.pop(rule_id, None)
+        self._load(self.store.update(remove))
+        return found["rule"] is not None
+
+    # Evaluation
+
+    def observe(self, stash: str, ts: int, block: int, values: Dict[str, float]) -> int:
+        """Update every rule watching this series with a new row; returns the number of alerts"""
+        if self.store.changed():
+            self._load(self.store.read())
+        fired = 0
+        for rule in self._by_stash.get(stash, []) + self._by_stash.get("*", []):
+            value = values.get(rule["field"])
+            if value is None or math.isnan(value):
+                continue
+            key = (rule["id"], stash)
+            tracker = self._trackers.get(key)
+            if tracker is None:
+                tracker = self._trackers[key] = _tracker(rule)
+            self.evaluated += 1
+            detail = tracker.update(value)
+            if detail is not None:
+                fired += 1
+                self._fire(rule, stash, {
+                    "rule_id": rule["id"], "stash": stash, "field": rule["field"], "kind": rule["kind"],
+                    "threshold": rule["threshold"], "value": value, **detail, "ts": ts, "block": block,
+                })
+        self.fired += fired
+        return fired
+
+    # Delivery
+
+    def _fire(self, rule: Dict[str, Any], stash: str, alert: Dict[str, Any]) -> None:
+        key = (rule["id"], stash)
+        with self._lock:
+            state = self._debounce.setdefault(key, _Debounce())
+            now = time.monotonic()
+            if state.pending is None and now - state.sent_at >= rule["cooldown"]:
+                state.sent_at = now
+                self._executor.submit(self._deliver, rule, {**alert, "coalesced": 0})
+                return
+            if state.pending is not None:
+                state.coalesced += 1
+                self.coalesced += 1
+            state.pending = alert
+            if state.timer is None:
+                state.timer = threading.Timer(max(0.0, state.sent_at + rule["cooldown"] - now), self._flush, (rule, key))
+                state.timer.daemon = True
+                state.timer.start()
+
+    def _flush(self, rule: Dict[str, Any], key: Tuple[str, str]) -> None:
+        with self._lock:
+            state = self._debounce[key]
+            alert, coalesced = state.pending, state.coalesced
+            state.pending, state.coalesced, state.timer = None, 0, None
+            state.sent_at = time.monotonic()
+        if alert is not None and rule["id"] in self.rules:
+            self._executor.submit(self._deliver, rule, {**alert, "coalesced": coalesced})
+
+    def _deliver(self, rule: Dict[str, Any], alert: Dict[str, Any]) -> None:
+        body = dumps({"rule_id": rule["id"], "alerts": [alert]})
+        headers = {"Content-Type": "application/json"}
+        if rule.get("secret"):
+            headers[SIGNATURE_HEADER] = sign(rule["secret"], body)
+        error = None
+        for attempt in range(self.max_attempts):
+            try:
+                status = self.post(rule["url"], body, headers)
+                if status < 300:
+                    self.delivered += 1
+                    return
+                error = f"HTTP {status}"
+                if permanent_failure(status):
+                    break
+            except requests.RequestException as e:
+                error = str(e)
+            if attempt < self.max_attempts - 1:
+                time.sleep(self.backoff * 2 ** attempt)
+        self.failed += 1
+        logger.warning("Alert delivery failed", extra={"rule_id": rule["id"], "error": error})
+
+    def stop(self) -> None:
+        with self._lock:
+            for state in self._debounce.values():
+                if state.timer is not None:
+                    state.timer.cancel()
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"rules": len(self.rules), "tracked": len(self._trackers), "evaluated": self.evaluated,
+                "fired": self.fired, "coalesced": self.coalesced, "delivered": self.delivered, "failed": self.failed}
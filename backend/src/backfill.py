@@ -0,0 +1,184 @@
+"""
+Parallel historical log backfill.
+
+Splits [from_block, to_block] into chunks fetched concurrently with
+eth_getLogs. A chunk the node refuses as too large (block range or result
+count) is halved and retried, and the chunk size for the rest of the run
+shrinks with it, growing back gradually on success (never past a size that
+failed). Results are handed to `on_logs` strictly in (block, log index) order,
+one contiguous chunk at a time, and the last fully handed-over block is
+checkpointed so an interrupted run resumes where it stopped, even if it is
+restarted with a later `to_block`.
+"""
+
+import logging
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.localstate import JsonStore
+from src.resilience import is_transient
+
+logger = logging.getLogger(__name__)
+
+_RATE_LIMITED = re.compile(r"rate.?limit|too many requests|\b429\b", re.IGNORECASE)
+# What nodes and providers answer to an eth_getLogs over too many blocks or results, e.g.
+# "exceed maximum block range: 5000", "query returned more than 10000 results",
+# "Log response size exceeded", "eth_getLogs is limited to a 10,000 range", "query timeout exceeded"
+_RANGE_TOO_LARGE = re.compile(
+    r"block range|range (is )?too (large|big|wide)|more than [\d,]+ (results|logs|blocks)"
+    r"|response size (exceeded|too large)|limited to a [\d,]+ (block )?range|too many (results|logs|blocks)"
+    r"|query timeout exceeded",
+    re.IGNORECASE,
+)
+
+
+def is_range_error(error: BaseException) -> bool:
+    """True for node errors meaning "ask for fewer blocks", as opposed to transient failures"""
+    if is_transient(error):
+        return False  # The node did not answer (e.g. RpcUnavailable: "Max retries exceeded"), whatever it says
+    message = str(error)
+    return not _RATE_LIMITED.search(message) and bool(_RANGE_TOO_LARGE.search(message))
+
+
+class Backfill:
+    """
+    One backfill run. `fetch_logs(from_block, to_block)` returns raw logs;
+    `on_logs(logs, through_block)` receives them in order and runs on the
+    calling thread, so it needs no locking.
+    """
+
+    def __init__(
+        self,
+        fetch_logs: Callable[[int, int], List[Any]],
+        on_logs: Callable[[List[Any], int], None],
+        from_block: int,
+        to_block: int,
+        checkpoint_path: Optional[str] = None,
+        chunk_size: int = 2000,
+        min_chunk: int = 1,
+        concurrency: int = 8,
+        max_attempts: int = 5,
+        backoff: float = 0.5,
+    ):
+        self.fetch_logs = fetch_logs
+        self.on_logs = on_logs
+        self.from_block = from_block
+        self.to_block = to_block
+        self.store = JsonStore(checkpoint_path) if checkpoint_path else None
+        self.max_chunk = chunk_size
+        self.chunk_size = chunk_size
+        self.min_chunk = min_chunk
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+
+        # Every block up to done_through has been handed to on_logs
+        self.done_through = from_block - 1
+        self.requests = 0
+        self.splits = 0
+        self.retries = 0
+        self.logs = 0
+
+    # Checkpoint
+
+    def _load_checkpoint(self) -> None:
+        if self.store is None:
+            return
+        state = self.store.read()
+        # Keyed on from_block only: the end of the range usually moves on between runs
+        if state.get("from_block") == self.from_block:
+            self.done_through = max(self.done_through, min(self.to_block, state.get("done_through", self.done_through)))
+
+    def _save_checkpoint(self) -> None:
+        if self.store is None:
+            return
+        state = {"from_block": self.from_block, "to_block": self.to_block, "done_through": self.done_through}
+        self.store.update(lambda data: data.update(state))
+
+    # Fetching
+
+    def _fetch(self, start: int, end: int) -> Tuple[str, Any]:
+        """("ok", logs) | ("split", None) | raises after max_attempts transient failures"""
+        for attempt in range(self.max_attempts):
+            try:
+                self.requests += 1
+                return "ok", self.fetch_logs(start, end)
+            except Exception as e:
+                if is_range_error(e) and end > start:
+                    return "split", None
+                if attempt == self.max_attempts - 1:
+                    raise
+                self.retries += 1
+                time.sleep(self.backoff * 2 ** attempt)
+        raise RuntimeError("unreachable")
+
+    def run(self) -> Dict[str, Any]:
+        """Backfill the whole range (or what remains after a checkpoint); returns run statistics"""
+        started = time.monotonic()
+        self._load_checkpoint()
+        next_start = self.done_through + 1
+        # Finished chunks waiting for the blocks before them: start -> (end, logs)
+        ready: Dict[int, Tuple[int, List[Any]]] = {}
+        # Split chunks are fetched before new ones
+        requeued: List[Tuple[int, int]] = []
+        inflight: Dict[Future, Tuple[int, int]] = {}
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="backfill") as pool:
+            while True:
+                # Keep the pool busy, but bound how far ahead of the ordered frontier we fetch
+                # (split chunks are always refetched: the frontier may be waiting on them)
+                while len(inflight) < self.concurrency:
+                    if requeued:
+                        start, end = requeued.pop()
+                    elif next_start <= self.to_block and len(ready) < self.concurrency * 4:
+                        start, end = next_start, min(self.to_block, next_start + self.chunk_size - 1)
+                        next_start = end + 1
+                    else:
+                        break
+                    inflight[pool.submit(self._fetch, start, end)] = (start, end)
+
+                if not inflight:
+                    break
+
+                done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    start, end = inflight.pop(future)
+                    status, logs = future.result()
+                    if status == "split":
+                        self.splits += 1
+                        middle = (start + end) // 2
+                        requeued += [(middle + 1, end), (start, middle)]
+                        # Never grow back to a size the node refused
+                        size = end - start + 1
+                        self.max_chunk = max(self.min_chunk, min(self.max_chunk, size - 1))
+                        self.chunk_size = max(self.min_chunk, min(self.chunk_size, size // 2))
+                        continue
+                    ready[start] = (end, logs)
+                    self.chunk_size = min(self.max_chunk, self.chunk_size + max(1, self.chunk_size // 4))
+
+                self._flush(ready)
+
+        logger.info("Backfill complete", extra={"from_block": self.from_block, "to_block": self.to_block,
+                                                "logs": self.logs, "splits": self.splits})
+        return {
+            "from_block": self.from_block,
+            "to_block": self.to_block,
+            "done_through": self.done_through,
+            "logs": self.logs,
+            "requests": self.requests,
+            "splits": self.splits,
+            "retries": self.retries,
+            "seconds": round(time.monotonic() - started, 3),
+        }
+
+    def _flush(self, ready: Dict[int, Tuple[int, List[Any]]]) -> None:
+        """Hand over (and checkpoint) every chunk that continues the contiguous prefix, in order"""
+        while self.done_through + 1 in ready:
+            end, logs = ready.pop(self.done_through + 1)
+            logs = sorted(logs, key=lambda log: (log["blockNumber"], log["logIndex"]))
+            self.on_logs(logs, end)
+            self.logs += len(logs)
+            self.done_through = end
+            self._save_checkpoint()
@@ -0,0 +1,306 @@
+"""
+Caches for entity metadata and query results.
+
+Caches implement the CacheBackend interface. TTLCache keeps entries in the
+worker process; SocketCache keeps them in one cache server per host, reached
+over a Unix socket, so every uvicorn worker shares the same entries. The server
+stores each namespace in a TTLCache, so eviction (LRU + TTL) and invalidation
+behave the same in both tiers.
+
+Configuration (environment):
+    CACHE_BACKEND - "memory" (default) or "socket"
+    CACHE_SOCKET  - Unix socket path for the shared tier (default DATA_DIR/run/cache.sock)
+
+Frames are JSON, and both ends check that the peer runs as the same user, so
+a socket planted by another local user is refused rather than trusted.
+"""
+
+import fcntl
+import logging
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class CacheBackend:
+    """Interface shared by the in-process and shared cache tiers"""
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        raise NotImplementedError
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: Hashable) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+
+class TTLCache(CacheBackend):
+    """Thread-safe LRU cache whose entries also expire after a TTL"""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 5.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] <= now:
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+# Shared tier: frames are a 4 byte big-endian length followed by a JSON array.
+# The socket is created with 0600 permissions in a 0700 directory, and each end
+# checks the other's uid, so only this user's workers can connect.
+
+def _send(sock: socket.socket, obj: Any) -> None:
+    data = orjson.dumps(obj)
+    sock.sendall(struct.pack(">I", len(data)) + data)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            raise ConnectionError("cache socket closed")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def _recv(sock: socket.socket) -> Any:
+    (size,) = struct.unpack(">I", _recv_exact(sock, 4))
+    return orjson.loads(_recv_exact(sock, size))
+
+
+def _peer_uid(sock: socket.socket, path: str) -> int:
+    """uid of the process at the other end of a Unix socket (the socket file's owner where SO_PEERCRED is missing)"""
+    if hasattr(socket, "SO_PEERCRED"):
+        _, uid, _ = struct.unpack("3i", sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")))
+        return uid
+    return os.stat(path).st_uid
+
+
+def _check_peer(sock: socket.socket, path: str) -> None:
+    if _peer_uid(sock, path) != os.getuid():
+        raise PermissionError(f"cache socket {path} belongs to another user")
+
+
+class _CacheRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        namespaces: Dict[str, TTLCache] = self.server.namespaces  # type: ignore[attr-defined]
+        lock: threading.Lock = self.server.namespaces_lock  # type: ignore[attr-defined]
+        try:
+            _check_peer(self.request, self.server.server_address)  # type: ignore[arg-type]
+        except OSError:
+            return
+        while True:
+            try:
+                op, ns, *args = _recv(self.request)
+            except (ConnectionError, OSError, TypeError, ValueError):
+                return
+            if op == "config":
+                with lock:
+                    if ns not in namespaces:
+                        namespaces[ns] = TTLCache(maxsize=args[0], ttl=args[1])
+                _send(self.request, None)
+                continue
+            cache = namespaces.get(ns)
+            if cache is None:
+                _send(self.request, (False, None) if op == "get" else None)
+                continue
+            if op == "get":
+                value = cache.get(args[0], _MISSING)
+                _send(self.request, (False, None) if value is _MISSING else (True, value))
+            elif op == "set":
+                cache.set(args[0], args[1], args[2])
+                _send(self.request, None)
+            elif op == "delete":
+                cache.delete(args[0])
+                _send(self.request, None)
+            elif op == "clear":
+                cache.clear()
+                _send(self.request, None)
+            elif op == "stats":
+                _send(self.request, cache.stats())
+            else:
+                _send(self.request, None)
+
+
+class _CacheServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _start_server(path: str) -> bool:
+    """Bind the host's cache server unless another worker already serves it"""
+    os.makedirs(os.path.dirname(path) or ".", mode=0o700, exist_ok=True)
+    # Serialize takeover between workers so only one of them unlinks and binds
+    fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return _bind_server(path)
+    finally:
+        os.close(fd)  # Releases the lock
+
+
+def _bind_server(path: str) -> bool:
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        pass
+    else:
+        _check_peer(probe, path)  # Served by one of our workers, not someone else's socket
+        return False
+    finally:
+        probe.close()
+
+    # Nobody is listening: remove a stale socket file and take over
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    old_umask = os.umask(0o177)
+    try:
+        server = _CacheServer(path, _CacheRequestHandler)
+    finally:
+        os.umask(old_umask)
+    server.namespaces = {}
+    server.namespaces_lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, name="cache-server", daemon=True).start()
+    logger.info("Shared cache server started", extra={"socket": path, "pid": os.getpid()})
+    return True
+
+
+class SocketCache(CacheBackend):
+    """
+    Namespace in the host-wide cache server. Each thread keeps its own
+    connection. If the server is unreachable the cache degrades to misses and
+    retries (taking over the server if its owner died) on a later call.
+    """
+
+    def __init__(self, namespace: str, path: str, maxsize: int = 10000, ttl: float = 5.0):
+        self.namespace = namespace
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._local = threading.local()
+        self._retry_at = 0.0
+        self.errors = 0
+
+    def _connect(self) -> Optional[socket.socket]:
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            return sock
+        if time.monotonic() < self._retry_at:
+            return None
+        try:
+            _start_server(self.path)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.path)
+            _check_peer(sock, self.path)
+            _send(sock, ("config", self.namespace, self.maxsize, self.ttl))
+            _recv(sock)
+        except (OSError, ValueError) as e:
+            self.errors += 1
+            self._retry_at = time.monotonic() + 1.0
+            logger.warning("Shared cache unavailable", extra={"socket": self.path, "error": str(e)})
+            return None
+        self._local.sock = sock
+        return sock
+
+    def _call(self, op: str, *args: Any) -> Any:
+        sock = self._connect()
+        if sock is None:
+            return _MISSING
+        try:
+            _send(sock, (op, self.namespace, *args))
+            return _recv(sock)
+        except (OSError, TypeError, ValueError):  # Also values orjson cannot encode
+            self.errors += 1
+            self._local.sock = None
+            sock.close()
+            return _MISSING
+
+    @staticmethod
+    def _key(key: Hashable) -> str:
+        # Keys (strings or tuples of them) travel as their JSON text, which the server can hash
+        return orjson.dumps(key).decode()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        result = self._call("get", self._key(key))
+        if result is _MISSING or not result[0]:
+            return default
+        return result[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self._call("set", self._key(key), value, self.ttl if ttl is None else ttl)
+
+    def delete(self, key: Hashable) -> None:
+        self._call("delete", self._key(key))
+
+    def clear(self) -> None:
+        self._call("clear")
+
+    def stats(self) -> Dict[str, int]:
+        stats = self._call("stats")
+        if stats is _MISSING or stats is None:
+            stats = {"size": 0, "hits": 0, "misses": 0}
+        return {**stats, "errors": self.errors}
+
+
+def make_cache(namespace: str, maxsize: int = 10000, ttl: float = 5.0) -> CacheBackend:
+    """Cache for `namespace` on the tier selected by CACHE_BACKEND"""
+    backend = os.getenv("CACHE_BACKEND", "memory").lower()
+    if backend == "socket":
+        path = os.getenv("CACHE_SOCKET") or os.path.join(os.getenv("DATA_DIR", ".arkivendor"), "run", "cache.sock")
+        return SocketCache(namespace, path, maxsize=maxsize, ttl=ttl)
+    return TTLCache(maxsize=maxsize, ttl=ttl)
@@ -0,0 +1,228 @@
+"""
+Entity change events.
+
+EventHub turns SDK events into plain dicts, attaches the entity's attributes
+(so consumers can evaluate query filters in memory) and fans each event out to
+every registered consumer. LogPoller feeds the hub: a single eth_getLogs poll
+per interval covering every Arkiv event type, however many consumers there are,
+and one attribute query per block for all the entities the poll saw change.
+
+Event shape:
+    {"type": "created" | "updated" | "extended" | "deleted" | "expired" | "owner_changed",
+     "key", "owner", "block", "log_index", "tx_hash", "expires_at_block", "attributes", ...}
+"""
+
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = ("created", "updated", "extended", "deleted", "expired", "owner_changed")
+
+Event = Dict[str, Any]
+Consumer = Callable[[Event], None]
+
+
+def _hex(value: Any) -> str:
+    if isinstance(value, bytes):
+        return "0x" + value.hex()
+    return value.to_0x_hex() if hasattr(value, "to_0x_hex") else str(value)
+
+
+def event_to_dict(event_type: str, event: Any, tx_hash: Any, block: Optional[int] = None,
+                  log_index: Optional[int] = None) -> Event:
+    """Plain, JSON-serializable form of an SDK event"""
+    data: Event = {
+        "type": event_type,
+        "key": event.key,
+        "block": block,
+        "log_index": log_index,
+        "tx_hash": _hex(tx_hash),
+    }
+    if event_type == "owner_changed":
+        data["owner"] = event.new_owner_address
+        data["old_owner"] = event.old_owner_address
+    else:
+        data["owner"] = event.owner_address
+    if hasattr(event, "new_expiration_block"):
+        data["expires_at_block"] = event.new_expiration_block
+        data["old_expires_at_block"] = event.old_expiration_block
+    elif hasattr(event, "expiration_block"):
+        data["expires_at_block"] = event.expiration_block
+    return data
+
+
+def query_record(event: Event) -> Dict[str, Any]:
+    """Record a compiled query (src.query) is evaluated against"""
+    return {"$key": event["key"], "$owner": event.get("owner"), "attributes": event.get("attributes") or {}}
+
+
+class EventHub:
+    """
+    Fans events out to consumers. Attributes are looked up with
+    `fetch_attributes(keys, block)` (as of the events' block, one call per
+    block of a published batch; returns lowercase key -> attributes for the
+    keys that existed) for created/updated events and remembered, so later
+    events for the same entity (including its deletion) carry them too.
+    """
+
+    def __init__(self, fetch_attributes: Callable[[List[str], Optional[int]], Dict[str, Dict[str, Any]]],
+                 maxsize: int = 100000):
+        self.fetch_attributes = fetch_attributes
+        self._attributes = TTLCache(maxsize=maxsize, ttl=7 * 86400)
+        self._consumers: List[Consumer] = []
+        self._lock = threading.Lock()
+        self.published = 0
+        self.fetches = 0
+
+    def subscribe(self, consumer: Consumer) -> None:
+        with self._lock:
+            self._consumers = self._consumers + [consumer]
+
+    def unsubscribe(self, consumer: Consumer) -> None:
+        with self._lock:
+            self._consumers = [c for c in self._consumers if c is not consumer]
+
+    def _prefetch(self, events: List[Event]) -> Dict[Tuple[str, Optional[int]], Dict[str, Any]]:
+        """(key, block) -> attributes for every event of the batch that needs a lookup, one fetch per block"""
+        wanted: Dict[Optional[int], List[str]] = {}
+        changed = set()
+        for event in events:
+            if "attributes" in event or event["type"] in ("deleted", "expired"):
+                continue
+            key = event["key"]
+            if event["type"] in ("created", "updated") or (key not in changed and self._attributes.get(key) is None):
+                keys = wanted.setdefault(event.get("block"), [])
+                if key not in keys:
+                    keys.append(key)
+            if event["type"] in ("created", "updated"):
+                changed.add(key)
+
+        fetched = {}
+        for block, keys in wanted.items():
+            try:
+                found = self.fetch_attributes(keys, block)
+            except Exception as e:
+                logger.warning("Failed to fetch event attributes",
+                               extra={"entities": len(keys), "block": block, "error": str(e)})
+                continue
+            self.fetches += 1
+            for key in keys:
+                if key.lower() in found:
+                    fetched[(key, block)] = found[key.lower()]
+        return fetched
+
+    def _attributes_for(self, event: Event, fetched: Dict[Tuple[str, Optional[int]], Dict[str, Any]]
+                        ) -> Optional[Dict[str, Any]]:
+        key = event["key"]
+        attributes = None if event["type"] in ("created", "updated") else self._attributes.get(key)
+        if attributes is None and event["type"] not in ("deleted", "expired"):
+            attributes = fetched.get((key, event.get("block")))
+        if attributes is not None:
+            if event["type"] in ("deleted", "expired"):
+                self._attributes.delete(key)
+            else:
+                self._attributes.set(key, attributes)
+        return attributes
+
+    def publish(self, event: Event) -> None:
+        self.publish_many([event])
+
+    def publish_many(self, events: List[Event]) -> None:
+        """Publish events in order, looking up the attributes they need together"""
+        fetched = self._prefetch(events)
+        for event in events:
+            if "attributes" not in event:
+                event["attributes"] = self._attributes_for(event, fetched)
+            self.published += 1
+            for consumer in self._consumers:
+                try:
+                    consumer(event)
+                except Exception:
+                    logger.exception("Event consumer failed")
+
+
+class LogPoller:
+    """
+    Polls the Arkiv contract's logs for all event types in one eth_getLogs call
+    per interval, from the head at start(), and publishes them in (block, log
+    index) order. Replaces one SDK watch filter (and polling thread) per event
+    type and consumer.
+    """
+
+    def __init__(self, client: Any, hub: EventHub, log_filter: Callable[[int, int], Dict[str, Any]],
+                 decode: Callable[[Any], Optional[tuple]], interval: float = 1.0, max_range: int = 1000):
+        self.client = client
+        self.hub = hub
+        self.log_filter = log_filter
+        self.decode = decode
+        self.interval = interval
+        self.max_range = max_range
+        self.next_block: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.polls = 0
+        self.logs = 0
+        self.errors = 0
+
+    def poll_once(self) -> int:
+        """Fetch and publish logs from next_block up to the head; returns the number of events"""
+        head = self.client.eth.block_number
+        published = 0
+        while self.next_block <= head:
+            to_block = min(head, self.next_block + self.max_range - 1)
+            logs = self.client.eth.get_logs(self.log_filter(self.next_block, to_block))
+            self.polls += 1
+            events = []
+            for log in sorted(logs, key=lambda l: (l["blockNumber"], l["logIndex"])):
+                try:
+                    decoded = self.decode(log)
+                except Exception as e:
+                    logger.warning("Failed to decode event log", extra={"block": log["blockNumber"], "error": str(e)})
+                    continue
+                if decoded is None:
+                    continue
+                event_type, event = decoded
+                events.append(event_to_dict(
+                    event_type, event, log["transactionHash"], block=log["blockNumber"], log_index=log["logIndex"]
+                ))
+            self.hub.publish_many(events)
+            published += len(events)
+            self.logs += len(logs)
+            self.next_block = to_block + 1
+        return published
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.poll_once()
+            except Exception as e:
+                self.errors += 1
+                logger.warning("Event log poll failed", extra={"from_block": self.next_block, "error": str(e)})
+            self._stop.wait(self.interval)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, from_block: Optional[int] = None) -> None:
+        if self._thread is not None:
+            return
+        self.next_block = from_block if from_block is not None else self.client.eth.block_number + 1
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="event-poller", daemon=True)
+        self._thread.start()
+        logger.info("Event poller started", extra={"from_block": self.next_block})
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+            self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"running": self.running, "next_block": self.next_block, "polls": self.polls,
+                "logs": self.logs, "errors": self.errors}
@@ -0,0 +1,232 @@
+"""
+Entity version history.
+
+HistoryStore is an append-only JSONL log of entity versions with an in-memory
+index (key -> versions sorted by block and log index, as file offsets). Only
+the worker holding the store's leader lock appends; other workers pick up new
+lines on their next read.
+
+Each record:
+    {"key", "type", "block", "log_index", "tx_hash", "owner", "expires_at_block",
+     "diff": {"set": {...}, "removed": [...]} | None, "payload_hash": "..." | None}
+
+HistoryRecorder turns entity events into records. On start it backfills the
+store from its last recorded block up to where the live event poller begins
+(buffering live events meanwhile), so the log stays gap-free and ordered.
+"""
+
+import bisect
+import hashlib
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import orjson
+
+from src.events import Event, event_to_dict, query_record
+from src.localstate import LeaderLock
+from src.query import compile_query
+from src.responses import dumps
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def attribute_diff(old: Optional[Dict[str, Any]], new: Dict[str, Any]) -> Dict[str, Any]:
+    """Attributes added or changed, and those removed, going from old to new"""
+    old = old or {}
+    return {
+        "set": {k: v for k, v in new.items() if old.get(k, _MISSING) != v},
+        "removed": sorted(k for k in old if k not in new),
+    }
+
+
+def payload_hash(payload: Optional[bytes]) -> Optional[str]:
+    return hashlib.sha256(payload).hexdigest() if payload is not None else None
+
+
+class HistoryStore:
+    """Append-only version log; see module docstring"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.leader = LeaderLock(path + ".leader")
+        self._index: Dict[str, List[Tuple[int, int, int]]] = {}
+        # Attributes after each key's latest version, to diff the next one against
+        self._latest: Dict[str, Dict[str, Any]] = {}
+        self._scanned = 0
+        self._lock = threading.Lock()
+        self.last_block: Optional[int] = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def _apply(self, record: Dict[str, Any], offset: int) -> None:
+        key = record["key"]
+        bisect.insort(self._index.setdefault(key, []), (record["block"], record["log_index"], offset))
+        if record.get("diff") is not None:
+            attributes = dict(self._latest.get(key) or {})
+            attributes.update(record["diff"]["set"])
+            for name in record["diff"]["removed"]:
+                attributes.pop(name, None)
+            self._latest[key] = attributes
+        if self.last_block is None or record["block"] > self.last_block:
+            self.last_block = record["block"]
+
+    def _catch_up(self) -> None:
+        """Index complete lines appended since the last scan (by us or another process)"""
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(self._scanned)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b"\n") + 1
+        offset = self._scanned
+        for line in data[:end].splitlines(keepends=True):
+            if line.strip():
+                self._apply(orjson.loads(line), offset)
+            offset += len(line)
+        self._scanned += end
+
+    def load(self) -> None:
+        with self._lock:
+            self._catch_up()
+
+    def tracks(self, entity_key: str) -> bool:
+        return entity_key in self._index
+
+    def append(self, event: Event, attributes: Optional[Dict[str, Any]] = None,
+               payload: Optional[bytes] = None) -> Optional[Dict[str, Any]]:
+        """Record one version; None if this (block, log index) is already recorded"""
+        key = event["key"]
+        with self._lock:
+            self._catch_up()
+            position = (event["block"], event["log_index"])
+            if any(entry[:2] == position for entry in self._index.get(key, ())):
+                return None
+            record = {
+                "key": key,
+                "type": event["type"],
+                "block": event["block"],
+                "log_index": event["log_index"],
+                "tx_hash": event["tx_hash"],
+                "owner": event.get("owner"),
+                "expires_at_block": event.get("expires_at_block"),
+                "diff": attribute_diff(self._latest.get(key), attributes) if attributes is not None else None,
+                "payload_hash": payload_hash(payload),
+            }
+            line = dumps(record) + b"\n"
+            with open(self.path, "ab") as f:
+                offset = f.tell()
+                f.write(line)
+            self._apply(record, offset)
+            self._scanned = offset + len(line)
+            return record
+
+    def versions(self, entity_key: str, cursor: int = 0, limit: int = 50,
+                 newest_first: bool = True) -> Tuple[List[Dict[str, Any]], Optional[int], int]:
+        """(records, next cursor or None, total versions) for one page of an entity's history"""
+        with self._lock:
+            self._catch_up()
+            entries = list(self._index.get(entity_key, ()))
+        if newest_first:
+            entries.reverse()
+        page = entries[cursor:cursor + limit]
+        if not page:
+            return [], None, len(entries)  # Nothing to read (the log may not even exist yet)
+        records = []
+        with open(self.path, "rb") as f:
+            for _, _, offset in page:
+                f.seek(offset)
+                records.append(orjson.loads(f.readline()))
+        next_cursor = cursor + limit if cursor + limit < len(entries) else None
+        return records, next_cursor, len(entries)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entities": len(self._index), "bytes": self._scanned, "last_block": self.last_block,
+                "leader": self.leader.held}
+
+
+class HistoryRecorder:
+    """
+    Records events for entities matching `query` (and every later event of an
+    entity already tracked). `fetch_version(key, block)` returns the entity's
+    (attributes, payload) as of that block; the payload is only requested
+    when `hash_payloads` is set.
+    """
+
+    def __init__(self, store: HistoryStore, query: Optional[str],
+                 fetch_version: Callable[[str, int, bool], Tuple[Optional[Dict[str, Any]], Optional[bytes]]],
+                 hash_payloads: bool = False):
+        self.store = store
+        self.query = compile_query(query)
+        self.fetch_version = fetch_version
+        self.hash_payloads = hash_payloads
+        self.recording = False
+        self._buffer: Optional[List[Event]] = None
+        self._lock = threading.Lock()
+        self.recorded = 0
+
+    def record(self, event: Event) -> bool:
+        attributes, payload = event.get("attributes"), None
+        if event["type"] in ("created", "updated"):
+            if self.hash_payloads or attributes is None:
+                try:
+                    attributes, payload = self.fetch_version(event["key"], event["block"], self.hash_payloads)
+                except Exception as e:
+                    logger.warning("Failed to fetch entity version",
+                                   extra={"entity_key": event["key"], "block": event["block"], "error": str(e)})
+        else:
+            attributes = None  # Only content changes carry a diff
+
+        if not self.store.tracks(event["key"]):
+            candidate = {**event, "attributes": attributes}
+            if attributes is None or not self.query.match(query_record(candidate)):
+                return False
+        if self.store.append(event, attributes, payload) is None:
+            return False
+        self.recorded += 1
+        return True
+
+    def offer(self, event: Event) -> None:
+        """EventHub consumer: record live events, or buffer them while a backfill runs"""
+        if not self.recording:
+            return
+        with self._lock:
+            if self._buffer is not None:
+                self._buffer.append(event)
+                return
+        self.record(event)
+
+    def pause(self) -> None:
+        """Start buffering live events (call before the live poller starts)"""
+        with self._lock:
+            self._buffer = []
+        self.recording = True
+
+    def resume(self, after_block: int) -> None:
+        """Record buffered live events past after_block, then record live events directly"""
+        while True:
+            with self._lock:
+                pending, self._buffer = self._buffer or [], []
+                if not pending:
+                    self._buffer = None
+                    return
+            for event in pending:
+                if event["block"] > after_block:
+                    self.record(event)
+
+    def record_logs(self, decode: Callable[[Any], Optional[tuple]]) -> Callable[[List[Any], int], None]:
+        """Backfill `on_logs` callback recording raw logs"""
+        def on_logs(logs: List[Any], through_block: int) -> None:
+            for log in logs:
+                decoded = decode(log)
+                if decoded is not None:
+                    event_type, event = decoded
+                    self.record(event_to_dict(event_type, event, log["transactionHash"],
+                                              block=log["blockNumber"], log_index=log["logIndex"]))
+        return on_logs
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.store.stats(), "recording": self.recording, "recorded": self.recorded}
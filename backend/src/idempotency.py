@@ -0,0 +1,111 @@
+"""
+Idempotency keys for paid writes.
+
+A write sent with an `Idempotency-Key` header is recorded under (payer, key).
+A retry with the same key gets the recorded response back instead of a second
+transaction and a second payment; a retry sent while the first attempt is
+still running waits for it. Only 2xx responses are recorded (the payment
+middleware only settles those), so a failed attempt can simply be retried.
+
+Each request is fingerprinted (method, path, query, body hash); reusing a key
+for a different request is refused rather than replayed.
+
+The store is local to the worker and bounded (LRU + TTL). All methods run on
+the event loop, so there is no locking.
+"""
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(method: str, path: str, query: str, body: bytes) -> str:
+    digest = hashlib.sha256(body).hexdigest()
+    return f"{method} {path}?{query} {digest}"
+
+
+class StoredResponse:
+    def __init__(self, fingerprint: str, status: int, headers: List[Tuple[bytes, bytes]], body: bytes):
+        self.fingerprint = fingerprint
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+class IdempotencyStore:
+    def __init__(self, maxsize: int = 10000, ttl: float = 86400.0, wait_timeout: float = 120.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        # key -> (expires, response)
+        self._done: "OrderedDict[Hashable, Tuple[float, StoredResponse]]" = OrderedDict()
+        # key -> (fingerprint, future resolved with the response, or None if the attempt failed)
+        self._running: Dict[Hashable, Tuple[str, "asyncio.Future[Optional[StoredResponse]]"]] = {}
+        self.replayed = 0
+        self.waited = 0
+        self.conflicts = 0
+
+    def _stored(self, key: Hashable) -> Optional[StoredResponse]:
+        item = self._done.get(key)
+        if item is None:
+            return None
+        if item[0] <= time.monotonic():
+            del self._done[key]
+            return None
+        self._done.move_to_end(key)
+        return item[1]
+
+    async def begin(self, key: Hashable, fingerprint: str) -> Tuple[str, Optional[StoredResponse]]:
+        """
+        ("run", None): the caller makes the attempt and must call finish;
+        ("replay", response): answer with the recorded response;
+        ("conflict", None): the key was used for a different request;
+        ("busy", None): the first attempt is still running after wait_timeout.
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            stored = self._stored(key)
+            if stored is not None:
+                if stored.fingerprint != fingerprint:
+                    self.conflicts += 1
+                    return "conflict", None
+                self.replayed += 1
+                return "replay", stored
+
+            running = self._running.get(key)
+            if running is None:
+                self._running[key] = (fingerprint, asyncio.get_running_loop().create_future())
+                return "run", None
+            if running[0] != fingerprint:
+                self.conflicts += 1
+                return "conflict", None
+
+            self.waited += 1
+            remaining = deadline - time.monotonic()
+            try:
+                # Shielded: a waiter timing out must not cancel the attempt's future
+                await asyncio.wait_for(asyncio.shield(running[1]), max(0.0, remaining))
+            except asyncio.TimeoutError:
+                return "busy", None
+            # Loop: replay the recorded response, or make the attempt if the first one failed
+
+    def finish(self, key: Hashable, response: Optional[StoredResponse]) -> None:
+        """End the attempt started by begin; response None (not recorded) lets the next retry run"""
+        running = self._running.pop(key, None)
+        if response is not None:
+            self._done[key] = (time.monotonic() + self.ttl, response)
+            self._done.move_to_end(key)
+            while len(self._done) > self.maxsize:
+                self._done.popitem(last=False)
+        if running is not None and not running[1].done():
+            running[1].set_result(response)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"stored": len(self._done), "running": len(self._running), "replayed": self.replayed,
+                "waited": self.waited, "conflicts": self.conflicts}
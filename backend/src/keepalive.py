@@ -0,0 +1,246 @@
+"""
+Server-side TTL keep-alive.
+
+Clients register an entity with a target lifetime; a scheduler keeps a min-heap
+of expiry blocks and extends entities shortly before they expire, packing all
+extensions that fall due together into as few transactions as possible.
+
+Extensions are only submitted by the scheduler: `extend(batch, settled)` sends
+the transaction and calls `settled(receipt)` once it is mined, or
+`settled(None)` if it failed or was dropped, so a slow block holds up no other
+batch. The entities of a failed batch are retried one per transaction, and
+one that still fails is dropped if the chain no longer has it (deleted or
+expired early), so it cannot hold the others back.
+
+The registry is persisted as JSON so it survives restarts and is shared by all
+workers on the host; only the worker holding the leader lock runs the scheduler.
+"""
+
+import heapq
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from src.localstate import JsonStore, LeaderLock
+
+logger = logging.getLogger(__name__)
+
+
+class KeepAliveRegistry:
+    """
+    key -> {"until_block", "expires_at_block", "payer"} (payer: lowercase wallet that registered it).
+
+    Entities are extended by up to `step_seconds` at a time once they are within
+    `lead_blocks` of expiring; entities due within `lead_blocks + window_blocks`
+    ride along in the same transaction. At most `max_batch` extensions per tx.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        extend: Callable[[List[Tuple[str, int]], Callable[[Any], None]], None],
+        head_block: Callable[[], Optional[int]],
+        exists: Callable[[str], bool],
+        block_time: int = 2,
+        lead_blocks: int = 150,
+        window_blocks: int = 150,
+        step_seconds: int = 86400,
+        max_batch: int = 100,
+        interval: float = 10.0,
+    ):
+        self.store = JsonStore(path)
+        self.leader = LeaderLock(path + ".leader")
+        self.extend = extend
+        self.head_block = head_block
+        self.exists = exists
+        self.block_time = block_time
+        self.lead_blocks = lead_blocks
+        self.window_blocks = window_blocks
+        self.step_seconds = step_seconds
+        self.max_batch = max_batch
+        self.interval = interval
+
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._heap: List[Tuple[int, str]] = []
+        self._inflight: Set[str] = set()  # In a submitted, unsettled extension
+        self._solo: Set[str] = set()  # In a failed batch: retried in transactions of their own
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.extended = 0
+        self.transactions = 0
+        self.failures = 0
+        self.dropped = 0
+
+    # Persistence
+
+    def _locked_update(self, fn: Callable[[Dict[str, Dict[str, Any]]], None]) -> None:
+        """Read-modify-write the registry file under an exclusive lock"""
+        self._load(self.store.update(fn))
+
+    def _load(self, entries: Dict[str, Dict[str, Any]]) -> None:
+        with self._lock:
+            self.entries = entries
+            self._heap = [(e["expires_at_block"], key) for key, e in entries.items()]
+            heapq.heapify(self._heap)
+            self._solo &= entries.keys()
+
+    def _reload_if_changed(self) -> None:
+        if self.store.changed():
+            self._load(self.store.read())
+
+    # API
+
+    def register(self, entity_key: str, lifetime_seconds: int, expires_at_block: int, head: int,
+                 payer: str) -> Dict[str, Any]:
+        """Keep entity_key alive for lifetime_seconds from now, on behalf of payer"""
+        entry = {
+            "until_block": head + lifetime_seconds // self.block_time,
+            "expires_at_block": expires_at_block,
+            "payer": payer.lower(),
+        }
+        self._locked_update(lambda entries: entries.__setitem__(entity_key, entry))
+        return entry
+
+    def unregister(self, entity_key: str) -> bool:
+        found = entity_key in self.entries
+        self._locked_update(lambda entries: entries.pop(entity_key, None))
+        return found
+
+    def forget(self, entity_keys: List[str]) -> None:
+        """Stop keeping entities alive (deleted, or handed to another owner); one file update for all of them"""
+        entity_keys = [key for key in entity_keys if key in self.entries]
+        if entity_keys:
+            self._locked_update(lambda entries: [entries.pop(key, None) for key in entity_keys])
+
+    def get(self, entity_key: str) -> Optional[Dict[str, Any]]:
+        return self.entries.get(entity_key)
+
+    # Scheduler
+
+    def due(self, head: int) -> List[Tuple[str, int]]:
+        """(key, extend_by_seconds) for entries due now, plus those due soon enough to share the batch"""
+        horizon = head + self.lead_blocks
+        if not self._heap or self._heap[0][0] > horizon:
+            return []
+        horizon += self.window_blocks
+
+        batch = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= horizon and len(batch) < self.max_batch:
+                expires, key = self._heap[0]
+                entry = self.entries.get(key)
+                if entry is None or entry["expires_at_block"] != expires or key in self._inflight:
+                    heapq.heappop(self._heap)
+                    continue  # Stale heap entry, or already being extended
+                remaining = (entry["until_block"] - expires) * self.block_time
+                if remaining <= 0:
+                    heapq.heappop(self._heap)
+                    continue  # Target lifetime reached, let it expire
+                if key in self._solo and batch:
+                    break  # Goes in the next batch, alone
+                heapq.heappop(self._heap)
+                batch.append((key, min(self.step_seconds, remaining)))
+                if key in self._solo:
+                    break
+            self._inflight.update(key for key, _ in batch)
+        return batch
+
+    def run_once(self) -> int:
+        """Submit extensions of everything currently due; returns the number of entities submitted"""
+        self._reload_if_changed()
+        head = self.head_block()
+        if head is None:
+            return 0
+
+        submitted = 0
+        while True:
+            batch = self.due(head)
+            if not batch:
+                break
+            try:
+                self.extend(batch, lambda receipt, batch=batch: self._settle(batch, receipt))
+            except Exception as e:
+                self._settle(batch, None, str(e))
+                break  # Sending fails for every batch alike; retry on the next tick
+            submitted += len(batch)
+        self._prune(head)
+        return submitted
+
+    def _settle(self, batch: List[Tuple[str, int]], receipt: Any, error: Optional[str] = None) -> None:
+        """Apply a mined extension's new expiries, or set up the retry of a failed one"""
+        keys = [key for key, _ in batch]
+        if receipt is None:
+            self.failures += 1
+            logger.warning("Keep-alive extension failed", extra={"entities": len(batch), "error": error})
+            missing = [keys[0]] if len(keys) == 1 and keys[0] in self._solo and not self._exists(keys[0]) else []
+            with self._lock:
+                self._inflight.difference_update(keys)
+                self._solo.update(keys)
+                for key in keys:
+                    entry = self.entries.get(key)
+                    if entry is not None and key not in missing:
+                        heapq.heappush(self._heap, (entry["expires_at_block"], key))
+            if missing:
+                self.dropped += 1
+                logger.warning("Dropping keep-alive of a missing entity", extra={"entity_key": missing[0]})
+                self.forget(missing)
+            return
+
+        new_expiry = {event.key: event.new_expiration_block for event in receipt.extensions}
+
+        def apply(entries):
+            for key, block in new_expiry.items():
+                if key in entries:
+                    entries[key]["expires_at_block"] = block
+
+        with self._lock:
+            self._inflight.difference_update(keys)
+            self._solo.difference_update(keys)
+        self._locked_update(apply)
+        self.transactions += 1
+        self.extended += len(new_expiry)
+        logger.info("Extended entities", extra={"entities": len(new_expiry), "block": receipt.block_number})
+
+    def _exists(self, entity_key: str) -> bool:
+        try:
+            return self.exists(entity_key)
+        except Exception:
+            return True  # Unknown: keep retrying
+
+    def _prune(self, head: int) -> None:
+        """Forget entries that have expired or reached their target lifetime"""
+        stale = [k for k, e in self.entries.items() if e["expires_at_block"] <= head or e["expires_at_block"] >= e["until_block"]]
+        if stale:
+            self._locked_update(lambda entries: [entries.pop(k, None) for k in stale])
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            if self.leader.acquire():
+                try:
+                    self.run_once()
+                except Exception:
+                    logger.exception("Keep-alive scheduler tick failed")
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        self._load(self.store.read())
+        self._thread = threading.Thread(target=self._loop, name="keepalive", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+        self.leader.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "registered": len(self.entries),
+            "leader": self.leader.held,
+            "extended": self.extended,
+            "transactions": self.transactions,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "inflight": len(self._inflight),
+        }
@@ -0,0 +1,23 @@
+"""
+Deferred imports.
+
+arkiv/web3 and NumPy dominate the backend's import time but are not needed to
+start listening; modules loaded with lazy_import are only executed on first
+attribute access.
+"""
+
+import importlib.util
+import sys
+from types import ModuleType
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Import a module on first attribute access"""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,80 @@
+"""
+Host-local state shared by the uvicorn workers.
+
+JsonStore is a JSON document rewritten atomically under an exclusive file
+lock, so every worker can read-modify-write it; LeaderLock elects the one
+worker per host that runs a background job.
+"""
+
+import fcntl
+import json
+import os
+from typing import Any, Callable, Optional
+
+
+class JsonStore:
+    """JSON document at `path`; `update` is atomic across processes"""
+
+    def __init__(self, path: str, default: Callable[[], Any] = dict):
+        self.path = path
+        self.default = default
+        self.mtime = 0.0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def read(self) -> Any:
+        try:
+            self.mtime = os.path.getmtime(self.path)
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return self.default()
+
+    def update(self, fn: Callable[[Any], None]) -> Any:
+        """Read-modify-write under an exclusive lock; returns the new document"""
+        with open(self.path + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            data = self.read()
+            fn(data)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+            self.mtime = os.path.getmtime(self.path)
+            return data
+
+    def changed(self) -> bool:
+        """True if another process rewrote the document since our last read/update"""
+        try:
+            return os.path.getmtime(self.path) != self.mtime
+        except FileNotFoundError:
+            return False
+
+
+class LeaderLock:
+    """Non-blocking exclusive lock on `path`, held until release() or process exit"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file: Optional[Any] = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def acquire(self) -> bool:
+        if self._file is not None:
+            return True
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        lock_file = open(self.path, "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._file = lock_file
+        return True
+
+    def release(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,191 @@
+"""
+Structured, non-blocking logging for the backend.
+
+Log records are handed to a queue on the request thread and formatted/written
+by a single listener thread, so stdout I/O never blocks a request. High-volume
+messages can be sampled per route.
+
+Configuration (environment):
+    LOG_LEVEL     - root level for the backend loggers (default INFO)
+    LOG_FORMAT    - "json" (default) or "text"
+    LOG_QUEUE_SIZE - max pending records before new ones are dropped (default 10000)
+    LOG_SDK_LEVEL - level for the arkiv/web3 loggers, which log per call at INFO (default WARNING)
+    LOG_SAMPLING  - comma separated "<METHOD> <path glob>=<rate>" rules applied to
+                    access logs and records logged with extra={"sampled": True},
+                    e.g. "GET /entities/*=0.01,POST /entities=0.1"
+"""
+
+import atexit
+import contextvars
+import fnmatch
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import orjson
+
+# "<METHOD> <path>" of the request being served, set by the HTTP middleware
+current_route: contextvars.ContextVar[str] = contextvars.ContextVar("current_route", default="")
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+# Attributes present on every LogRecord, everything else was passed via `extra`
+_RESERVED = set(logging.LogRecord("", 0, "", 0, "", None, None).__dict__) | {"message", "asctime", "sampled", "route"}
+
+
+def _dumps(obj) -> str:
+    return orjson.dumps(obj, default=str).decode()
+
+
+class JsonFormatter(logging.Formatter):
+    """One compact JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        route = getattr(record, "route", "")
+        if route:
+            entry["route"] = route
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return _dumps(entry)
+
+
+class RouteSampler(logging.Filter):
+    """Keeps only a fraction of records marked `sampled` for matching routes"""
+
+    def __init__(self, rules: List[Tuple[str, float]]):
+        super().__init__()
+        self.rules = rules
+        self.dropped = 0
+
+    @lru_cache(maxsize=1024)
+    def rate_for(self, route: str) -> float:
+        for pattern, rate in self.rules:
+            if fnmatch.fnmatchcase(route, pattern):
+                return rate
+        return 1.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # Stamp the route here, on the request thread, where the contextvar is set
+        route = current_route.get() or _access_route(record)
+        record.route = route
+        sampled = getattr(record, "sampled", False) or record.name == "uvicorn.access"
+        if not sampled or not self.rules:
+            return True
+        rate = self.rate_for(route)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        self.dropped += 1
+        return False
+
+
+def _access_route(record: logging.LogRecord) -> str:
+    """Route of a uvicorn access record, logged once the middleware has reset current_route"""
+    # uvicorn.access args: (client address, method, path with query string, HTTP version, status code)
+    if record.name != "uvicorn.access" or not isinstance(record.args, tuple) or len(record.args) < 3:
+        return ""
+    return f"{record.args[1]} {str(record.args[2]).split('?', 1)[0]}"
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only merge args into the message; formatting happens on the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_sampling(spec: str) -> List[Tuple[str, float]]:
+    """Parse LOG_SAMPLING into (pattern, rate) rules"""
+    rules = []
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        pattern, rate = item.rsplit("=", 1)
+        try:
+            rules.append((pattern.strip(), max(0.0, min(1.0, float(rate)))))
+        except ValueError:
+            continue
+    return rules
+
+
+def setup_logging() -> None:
+    """Route the root logger through a queue to a background stdout writer (idempotent)"""
+    global _listener
+    if _listener is not None:
+        return
+
+    level = os.getenv("LOG_LEVEL", "INFO").upper()
+    fmt = os.getenv("LOG_FORMAT", "json").lower()
+    q: queue.Queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE") or "10000"))
+
+    stream = logging.StreamHandler(sys.stdout)
+    if fmt == "text":
+        stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(route)s] %(message)s"))
+    else:
+        stream.setFormatter(JsonFormatter())
+
+    handler = DroppingQueueHandler(q)
+    handler.addFilter(RouteSampler(parse_sampling(os.getenv("LOG_SAMPLING", ""))))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+
+    for name in ("arkiv", "web3"):
+        logging.getLogger(name).setLevel(os.getenv("LOG_SDK_LEVEL", "WARNING").upper())
+
+    # Let uvicorn's loggers go through the same queue
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uv_logger = logging.getLogger(name)
+        uv_logger.handlers = []
+        uv_logger.propagate = True
+
+    _listener = logging.handlers.QueueListener(q, stream, respect_handler_level=False)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Flush pending records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def logging_stats() -> Dict[str, int]:
+    """Dropped record counters, for metrics"""
+    stats = {"queue_dropped": 0, "sampled_out": 0}
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, DroppingQueueHandler):
+            stats["queue_dropped"] += handler.dropped
+            for f in handler.filters:
+                if isinstance(f, RouteSampler):
+                    stats["sampled_out"] += f.dropped
+    return stats
@@ -0,0 +1,667 @@
+"""
+In-memory Arkiv node for offline tests and benchmarks.
+
+MemoryNode keeps entities, transactions, blocks and contract logs in memory
+and answers the JSON-RPC methods the Arkiv SDK and web3 send for the
+backend: chain and account state, fees, raw transactions (decoded from the
+Arkiv calldata format, signature and nonce checked), receipts, eth_getLogs
+and log filters (for watch_*), and arkiv_query with the query syntax of
+src.query, including `at_block` and cursors. MemoryProvider is a web3
+provider backed by a node, so a real Arkiv client runs against it unchanged.
+
+Blocks are mined every `block_time` seconds by a background thread, or, with
+block_time 0, as soon as a transaction is sent (call `mine` to add empty
+blocks). Entities expire when their expiration block is mined.
+
+Latency and failures are injected per request:
+
+- latency: milliseconds, a number or "uniform:LOW:HIGH", "normal:MEAN:SD",
+  "lognormal:MEDIAN:SIGMA", "exponential:MEAN" (see parse_latency)
+- failure_rate: share of requests failing with a connection error
+- revert_rate: share of transactions mined with status 0
+- drop_rate: share of transactions never mined (their nonce is used up, as if
+  replaced)
+- fail_next(method, count, error): fail the next calls of one method
+"""
+
+import itertools
+import json
+import logging
+import math
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import brotli
+import requests
+import rlp
+from eth_abi import encode
+from eth_account import Account
+from eth_account.typed_transactions import TypedTransaction
+from eth_utils import event_abi_to_log_topic, keccak, to_checksum_address
+from hexbytes import HexBytes
+from web3.providers.base import JSONBaseProvider
+
+from arkiv.contract import ARKIV_ADDRESS, EVENTS_ABI
+from src.query import QuerySyntaxError, compile_query
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SECONDS = 2  # Seconds per block assumed by the SDK's expires_in / extend_by conversion
+
+_TOPICS = {abi["name"]: "0x" + event_abi_to_log_topic(abi).hex() for abi in EVENTS_ABI}
+_ZERO_HASH = "0x" + "00" * 32
+
+
+def parse_latency(spec: Optional[str], rng: Any = random) -> Callable[[], float]:
+    """Sampler of request latencies in seconds from a spec in milliseconds (see the module docstring)"""
+    if not spec:
+        return lambda: 0.0
+    name, _, rest = spec.partition(":")
+    if not rest:
+        name, rest = "fixed", spec
+    try:
+        args = [float(value) for value in rest.split(":")]
+    except ValueError:
+        raise ValueError(f"Invalid latency spec: {spec!r}")
+    if name == "fixed" and len(args) == 1:
+        return lambda: args[0] / 1000
+    if name == "uniform" and len(args) == 2:
+        return lambda: rng.uniform(args[0], args[1]) / 1000
+    if name == "normal" and len(args) == 2:
+        return lambda: max(0.0, rng.gauss(args[0], args[1])) / 1000
+    if name == "lognormal" and len(args) == 2 and args[0] > 0:
+        return lambda: rng.lognormvariate(math.log(args[0]), args[1]) / 1000
+    if name == "exponential" and len(args) == 1 and args[0] > 0:
+        return lambda: rng.expovariate(1 / args[0]) / 1000
+    raise ValueError(f"Invalid latency spec: {spec!r}")
+
+
+class RpcError(Exception):
+    """A JSON-RPC error answered by the node"""
+
+    def __init__(self, message: str, code: int = -32000):
+        super().__init__(message)
+        self.code = code
+
+
+def _hex(value: int) -> str:
+    return hex(value)
+
+
+def _int(value: bytes) -> int:
+    return int.from_bytes(value, "big") if value else 0
+
+
+def _key(value: bytes) -> str:
+    return "0x" + value.rjust(32, b"\0").hex()
+
+
+def _topic_address(address: str) -> str:
+    return "0x" + bytes.fromhex(address[2:]).rjust(32, b"\0").hex()
+
+
+def decode_operations(data: bytes) -> Dict[str, List[Any]]:
+    """Arkiv calldata (brotli-compressed RLP) back into operation dicts"""
+    creates, updates, deletes, extensions, change_owners = rlp.decode(brotli.decompress(data))
+
+    def attributes(strings: List[Any], numbers: List[Any]) -> Dict[str, Any]:
+        result: Dict[str, Any] = {k.decode(): v.decode() for k, v in strings}
+        result.update({k.decode(): _int(v) for k, v in numbers})
+        return result
+
+    return {
+        "creates": [{"btl": _int(btl), "content_type": ct.decode(), "payload": payload,
+                     "attributes": attributes(strings, numbers)}
+                    for btl, ct, payload, strings, numbers in creates],
+        "updates": [{"key": _key(key), "content_type": ct.decode(), "btl": _int(btl), "payload": payload,
+                     "attributes": attributes(strings, numbers)}
+                    for key, ct, btl, payload, strings, numbers in updates],
+        "deletes": [{"key": _key(key)} for key in deletes],
+        "extensions": [{"key": _key(key), "blocks": _int(blocks)} for key, blocks in extensions],
+        "change_owners": [{"key": _key(key), "owner": to_checksum_address(owner)} for key, owner in change_owners],
+    }
+
+
+class MemoryNode:
+    def __init__(self, chain_id: int = 60138453033, block_time: float = BLOCK_SECONDS, latency: Optional[str] = None,
+                 failure_rate: float = 0.0, revert_rate: float = 0.0, drop_rate: float = 0.0,
+                 base_fee: int = 10 ** 7, priority_fee: int = 10 ** 6, balance: int = 10 ** 21,
+                 gas_limit: int = 60_000_000, seed: Optional[int] = None):
+        self.chain_id = chain_id
+        self.block_time = block_time
+        self.failure_rate = failure_rate
+        self.revert_rate = revert_rate
+        self.drop_rate = drop_rate
+        self.base_fee = base_fee
+        self.priority_fee = priority_fee
+        self.default_balance = balance
+        self.gas_limit = gas_limit
+        self.random = random.Random(seed)
+        self.latency = parse_latency(latency, self.random)
+        self._lock = threading.RLock()
+        self.blocks: List[Dict[str, Any]] = []
+        # key -> [(block, entity record or None once deleted/expired)], oldest first
+        self.versions: Dict[str, List[Tuple[int, Optional[Dict[str, Any]]]]] = {}
+        self.expiries: Dict[int, set] = {}
+        self.txs: Dict[str, Dict[str, Any]] = {}
+        self.receipts: Dict[str, Dict[str, Any]] = {}
+        self.pool: List[Dict[str, Any]] = []
+        self.nonces: Dict[str, int] = {}
+        self.balances: Dict[str, int] = {}
+        self.logs: Dict[int, List[Dict[str, Any]]] = {}
+        self.filters: Dict[str, Dict[str, Any]] = {}
+        self._filter_ids = itertools.count(1)
+        self._failures: Dict[str, List[Exception]] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.requests = 0
+        self.injected = 0
+        self._mine_block([])  # Genesis
+
+    # Failure injection
+
+    def fail_next(self, method: str, count: int = 1, error: Optional[Exception] = None) -> None:
+        """Fail the next `count` calls of method with error (default: a connection error)"""
+        with self._lock:
+            self._failures.setdefault(method, []).extend(
+                [error or requests.ConnectionError(f"Injected failure: {method}")] * count)
+
+    def _inject(self, method: str) -> None:
+        with self._lock:
+            queued = self._failures.get(method)
+            error = queued.pop(0) if queued else None
+        if error is None and self.failure_rate and self.random.random() < self.failure_rate:
+            error = requests.ConnectionError(f"Injected failure: {method}")
+        if error is not None:
+            self.injected += 1
+            raise error
+
+    # JSON-RPC
+
+    def delay(self) -> None:
+        """Wait one sampled round trip"""
+        seconds = self.latency()
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def request(self, method: str, params: Any) -> Any:
+        """
+        Result of one JSON-RPC call (params and result as on the wire, without
+        the round trip delay); raises RpcError for node errors and transport
+        errors when a failure is injected
+        """
+        self.requests += 1
+        self._inject(method)
+        handler = getattr(self, "_rpc_" + method, None)
+        if handler is None:
+            raise RpcError(f"the method {method} does not exist/is not available", -32601)
+        with self._lock:
+            return handler(*(params or []))
+
+    def _rpc_eth_chainId(self) -> str:
+        return _hex(self.chain_id)
+
+    def _rpc_net_version(self) -> str:
+        return str(self.chain_id)
+
+    def _rpc_eth_blockNumber(self) -> str:
+        return _hex(self.head)
+
+    def _rpc_eth_getBalance(self, address: str, block: Any = "latest") -> str:
+        return _hex(self.balances.get(address.lower(), self.default_balance))
+
+    def _rpc_eth_getTransactionCount(self, address: str, block: Any = "latest") -> str:
+        nonce = self.nonces.get(address.lower(), 0)
+        if block == "pending":
+            queued = {tx["nonce"] for tx in self.pool if tx["from"].lower() == address.lower()}
+            while nonce in queued:
+                nonce += 1
+        return _hex(nonce)
+
+    def _rpc_eth_maxPriorityFeePerGas(self) -> str:
+        return _hex(self.priority_fee)
+
+    def _rpc_eth_gasPrice(self) -> str:
+        return _hex(self.base_fee + self.priority_fee)
+
+    def _rpc_eth_getBlockByNumber(self, block: Any, full: bool = False) -> Optional[Dict[str, Any]]:
+        number = self._block_number(block)
+        return self._block_json(self.blocks[number], full) if 0 <= number <= self.head else None
+
+    def _rpc_eth_getBlockByHash(self, block_hash: str, full: bool = False) -> Optional[Dict[str, Any]]:
+        block = next((b for b in self.blocks if b["hash"] == block_hash), None)
+        return self._block_json(block, full) if block else None
+
+    def _rpc_eth_estimateGas(self, tx: Dict[str, Any], block: Any = None) -> str:
+        return _hex(self._gas(HexBytes(tx.get("data") or tx.get("input") or "0x")))
+
+    def _rpc_eth_call(self, tx: Dict[str, Any], block: Any = None) -> str:
+        return "0x"
+
+    def _rpc_eth_sendRawTransaction(self, raw: str) -> str:
+        raw_bytes = HexBytes(raw)
+        tx_hash = "0x" + keccak(raw_bytes).hex()
+        if tx_hash in self.txs:
+            raise RpcError("already known")
+        fields = TypedTransaction.from_bytes(raw_bytes).as_dict()
+        sender = Account.recover_transaction(raw_bytes)
+        if fields.get("chainId") != self.chain_id:
+            raise RpcError("invalid chain id for signer")
+        if fields["nonce"] < self.nonces.get(sender.lower(), 0):
+            raise RpcError("nonce too low")
+        if any(tx["from"] == sender and tx["nonce"] == fields["nonce"] for tx in self.pool):
+            raise RpcError("replacement transaction underpriced")
+        if fields.get("maxFeePerGas", 0) < self.base_fee:
+            raise RpcError("max fee per gas less than block base fee")
+        if fields.get("to") is None or to_checksum_address(fields["to"]) != ARKIV_ADDRESS:
+            raise RpcError("only Arkiv transactions are supported by the memory node")
+        try:
+            operations = decode_operations(bytes(fields["data"]))
+        except Exception as e:
+            raise RpcError(f"invalid Arkiv transaction: {e}")
+        if fields["gas"] < self._gas(fields["data"]):
+            raise RpcError("intrinsic gas too low")
+        tx = {"hash": tx_hash, "from": sender, "nonce": fields["nonce"], "gas": fields["gas"],
+              "maxFeePerGas": fields["maxFeePerGas"], "maxPriorityFeePerGas": fields["maxPriorityFeePerGas"],
+              "input": "0x" + bytes(fields["data"]).hex(), "operations": operations, "block": None, "index": None}
+        self.txs[tx_hash] = tx
+        self.pool.append(tx)
+        if self.block_time <= 0:
+            self.mine()
+        return tx_hash
+
+    def _rpc_eth_getTransactionByHash(self, tx_hash: str) -> Optional[Dict[str, Any]]:
+        tx = self.txs.get(tx_hash.lower())
+        if tx is None:
+            return None
+        block = self.blocks[tx["block"]] if tx["block"] is not None else None
+        return {
+            "hash": tx["hash"], "from": tx["from"], "to": ARKIV_ADDRESS, "nonce": _hex(tx["nonce"]),
+            "gas": _hex(tx["gas"]), "maxFeePerGas": _hex(tx["maxFeePerGas"]),
+            "maxPriorityFeePerGas": _hex(tx["maxPriorityFeePerGas"]), "value": "0x0", "input": tx["input"],
+            "type": "0x2", "chainId": _hex(self.chain_id),
+            "blockNumber": _hex(block["number"]) if block else None, "blockHash": block["hash"] if block else None,
+            "transactionIndex": _hex(tx["index"]) if block else None,
+        }
+
+    def _rpc_eth_getTransactionReceipt(self, tx_hash: str) -> Optional[Dict[str, Any]]:
+        return self.receipts.get(tx_hash.lower())
+
+    def _rpc_eth_getLogs(self, criteria: Dict[str, Any]) -> List[Dict[str, Any]]:
+        from_block = self._block_number(criteria.get("fromBlock", "latest"))
+        to_block = self._block_number(criteria.get("toBlock", "latest"))
+        return self._logs(criteria, from_block, min(to_block, self.head))
+
+    def _rpc_eth_newFilter(self, criteria: Dict[str, Any]) -> str:
+        filter_id = _hex(next(self._filter_ids))
+        start = self._block_number(criteria.get("fromBlock", "latest"))
+        self.filters[filter_id] = {"criteria": criteria, "next_block": start if "fromBlock" in criteria else self.head + 1}
+        return filter_id
+
+    def _rpc_eth_newBlockFilter(self) -> str:
+        filter_id = _hex(next(self._filter_ids))
+        self.filters[filter_id] = {"criteria": None, "next_block": self.head + 1}
+        return filter_id
+
+    def _rpc_eth_getFilterChanges(self, filter_id: str) -> List[Any]:
+        entry = self.filters.get(filter_id)
+        if entry is None:
+            raise RpcError("filter not found")
+        start, entry["next_block"] = entry["next_block"], self.head + 1
+        if entry["criteria"] is None:
+            return [block["hash"] for block in self.blocks[start:self.head + 1]]
+        return self._logs(entry["criteria"], start, self.head)
+
+    def _rpc_eth_getFilterLogs(self, filter_id: str) -> List[Dict[str, Any]]:
+        entry = self.filters.get(filter_id)
+        if entry is None or entry["criteria"] is None:
+            raise RpcError("filter not found")
+        criteria = entry["criteria"]
+        return self._logs(criteria, self._block_number(criteria.get("fromBlock", "earliest")),
+                          min(self._block_number(criteria.get("toBlock", "latest")), self.head))
+
+    def _rpc_eth_uninstallFilter(self, filter_id: str) -> bool:
+        return self.filters.pop(filter_id, None) is not None
+
+    def _rpc_arkiv_query(self, query: str, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        options = options or {}
+        at_block = options.get("atBlock")
+        at_block = self.head if at_block is None else int(at_block)
+        if at_block > self.head:
+            raise RpcError(f"block {at_block} is in the future")
+        try:
+            compiled = compile_query(query)
+        except QuerySyntaxError as e:
+            raise RpcError(f"invalid query: {e}", -32602)
+
+        keys = [value for name, value in compiled.equalities if name == "$key"]
+        candidates = keys[:1] if keys else self.versions.keys()
+        matches = []
+        for key in candidates:
+            record = self._entity_at(key, at_block)
+            if record is not None and compiled.match(self._query_record(record)):
+                matches.append(record)
+        matches.sort(key=lambda r: (r["created_at"], r["tx_index"], r["op_index"]))
+        for order in reversed(options.get("orderBy") or []):
+            numeric = order.get("type") == "numeric"
+            present = [r for r in matches if isinstance(r["attributes"].get(order["name"]), (int if numeric else str))]
+            missing = [r for r in matches if r not in present]
+            present.sort(key=lambda r: r["attributes"][order["name"]], reverse=bool(order.get("desc")))
+            matches = present + missing
+
+        offset = int(options.get("cursor") or 0)
+        per_page = int(options.get("resultsPerPage") or 200)
+        page = matches[offset:offset + per_page]
+        include = options.get("includeData") or {}
+        return {
+            "data": [self._query_item(record, include) for record in page],
+            "blockNumber": at_block,
+            "cursor": str(offset + per_page) if offset + per_page < len(matches) else None,
+        }
+
+    def _rpc_arkiv_getBlockTiming(self) -> Dict[str, Any]:
+        block = self.blocks[self.head]
+        return {"current_block": self.head, "current_block_time": block["timestamp"],
+                "duration": self.block_time or BLOCK_SECONDS}
+
+    # Blocks
+
+    @property
+    def head(self) -> int:
+        return len(self.blocks) - 1
+
+    def _block_number(self, block: Any) -> int:
+        if block in (None, "latest", "pending", "safe", "finalized"):
+            return self.head
+        if block == "earliest":
+            return 0
+        return int(block, 16) if isinstance(block, str) else int(block)
+
+    def _block_json(self, block: Dict[str, Any], full: bool) -> Dict[str, Any]:
+        transactions = block["transactions"]
+        if full:
+            transactions = [self._rpc_eth_getTransactionByHash(h) for h in transactions]
+        return {
+            "number": _hex(block["number"]), "hash": block["hash"], "parentHash": block["parentHash"],
+            "timestamp": _hex(block["timestamp"]), "baseFeePerGas": _hex(self.base_fee),
+            "gasLimit": _hex(self.gas_limit), "gasUsed": _hex(block["gasUsed"]), "miner": ARKIV_ADDRESS,
+            "transactions": transactions, "logsBloom": "0x" + "00" * 256, "extraData": "0x",
+            "difficulty": "0x0", "nonce": "0x0000000000000000", "sha3Uncles": _ZERO_HASH, "size": "0x0",
+            "stateRoot": _ZERO_HASH, "transactionsRoot": _ZERO_HASH, "receiptsRoot": _ZERO_HASH,
+            "mixHash": _ZERO_HASH, "uncles": [],
+        }
+
+    def mine(self, count: int = 1) -> int:
+        """Mine `count` blocks from the pool; returns the new head"""
+        with self._lock:
+            for _ in range(count):
+                # Each sender's transactions in nonce order; one after a nonce gap waits for the gap to fill
+                ready, waiting = [], []
+                expected = dict(self.nonces)
+                for tx in sorted(self.pool, key=lambda tx: tx["nonce"]):
+                    sender = tx["from"].lower()
+                    if tx["nonce"] == expected.get(sender, 0):
+                        ready.append(tx)
+                        expected[sender] = tx["nonce"] + 1
+                    else:
+                        waiting.append(tx)
+                self.pool = waiting
+                self._mine_block(ready)
+            return self.head
+
+    def _mine_block(self, txs: List[Dict[str, Any]]) -> None:
+        number = len(self.blocks)
+        block_hash = "0x" + keccak(b"block" + number.to_bytes(8, "big")).hex()
+        block = {"number": number, "hash": block_hash, "parentHash": self.blocks[-1]["hash"] if self.blocks else _ZERO_HASH,
+                 "timestamp": int(time.time()), "transactions": [], "gasUsed": 0}
+        self.blocks.append(block)
+        logs: List[Dict[str, Any]] = []
+        self.logs[number] = logs
+
+        # Expirations come first, in a system transaction of their own
+        expiring = sorted(self.expiries.pop(number, ()))
+        if expiring:
+            system_hash = "0x" + keccak(b"expire" + number.to_bytes(8, "big")).hex()
+            for key in expiring:
+                record = self._entity_at(key, number)
+                if record is not None and record["expires_at"] == number:
+                    self.versions[key].append((number, None))
+                    logs.append(self._log(block, system_hash, 0, len(logs), "ArkivEntityExpired",
+                                          [_key(bytes.fromhex(key[2:])), _topic_address(record["owner"])], []))
+
+        for index, tx in enumerate(txs, start=1 if expiring else 0):
+            sender = tx["from"].lower()
+            self.nonces[sender] = tx["nonce"] + 1
+            if self.drop_rate and self.random.random() < self.drop_rate:
+                del self.txs[tx["hash"]]  # Never mined; the nonce is gone as if replaced
+                continue
+            tx["block"], tx["index"] = number, index
+            block["transactions"].append(tx["hash"])
+            first_log = len(logs)
+            status = 0
+            if not (self.revert_rate and self.random.random() < self.revert_rate):
+                try:
+                    logs.extend(self._apply(tx, block, index, first_log))
+                    status = 1
+                except RpcError as e:
+                    logger.debug("Memory node transaction reverted", extra={"tx_hash": tx["hash"], "error": str(e)})
+            gas_used = self._gas(HexBytes(tx["input"]))
+            price = min(tx["maxFeePerGas"], self.base_fee + tx["maxPriorityFeePerGas"])
+            self.balances[sender] = self.balances.get(sender, self.default_balance) - gas_used * price
+            block["gasUsed"] += gas_used
+            self.receipts[tx["hash"]] = {
+                "transactionHash": tx["hash"], "transactionIndex": _hex(index), "blockHash": block_hash,
+                "blockNumber": _hex(number), "from": tx["from"], "to": ARKIV_ADDRESS,
+                "cumulativeGasUsed": _hex(block["gasUsed"]), "gasUsed": _hex(gas_used),
+                "effectiveGasPrice": _hex(price), "contractAddress": None, "logs": logs[first_log:],
+                "logsBloom": "0x" + "00" * 256, "status": _hex(status), "type": "0x2",
+            }
+
+    def _apply(self, tx: Dict[str, Any], block: Dict[str, Any], index: int, first_log: int) -> List[Dict[str, Any]]:
+        """Apply a transaction's operations all or nothing; returns its logs, raises RpcError to revert"""
+        number, sender = block["number"], tx["from"]
+        staged: Dict[str, Optional[Dict[str, Any]]] = {}
+        logs: List[Dict[str, Any]] = []
+
+        def current(key: str) -> Dict[str, Any]:
+            record = staged[key] if key in staged else self._entity_at(key, number)
+            if record is None:
+                raise RpcError(f"entity {key} not found")
+            return record
+
+        def owned(key: str) -> Dict[str, Any]:
+            record = current(key)
+            if record["owner"].lower() != sender.lower():
+                raise RpcError(f"{sender} is not the owner of entity {key}")
+            return record
+
+        def log(name: str, key: str, owner: str, values: List[int], extra_topic: Optional[str] = None) -> None:
+            topics = [key, _topic_address(owner)] + ([_topic_address(extra_topic)] if extra_topic else [])
+            logs.append(self._log(block, tx["hash"], index, first_log + len(logs), name, topics, values))
+
+        ops = tx["operations"]
+        op_index = 0
+        for op in ops["creates"]:
+            if op["btl"] <= 0:
+                raise RpcError("expiration must be in the future")
+            key = "0x" + keccak(bytes.fromhex(tx["hash"][2:]) + op_index.to_bytes(4, "big")).hex()
+            staged[key] = {"key": key, "owner": sender, "creator": sender, "payload": op["payload"],
+                           "content_type": op["content_type"], "attributes": op["attributes"],
+                           "expires_at": number + op["btl"], "created_at": number, "last_modified_at": number,
+                           "tx_index": index, "op_index": op_index}
+            log("ArkivEntityCreated", key, sender, [number + op["btl"], 0])
+            op_index += 1
+        for op in ops["updates"]:
+            record = owned(op["key"])
+            if op["btl"] <= 0:
+                raise RpcError("expiration must be in the future")
+            staged[op["key"]] = {**record, "payload": op["payload"], "content_type": op["content_type"],
+                                 "attributes": op["attributes"], "expires_at": number + op["btl"],
+                                 "last_modified_at": number, "tx_index": index, "op_index": op_index}
+            log("ArkivEntityUpdated", op["key"], record["owner"], [record["expires_at"], number + op["btl"], 0])
+            op_index += 1
+        for op in ops["deletes"]:
+            record = owned(op["key"])
+            staged[op["key"]] = None
+            log("ArkivEntityDeleted", op["key"], record["owner"], [])
+            op_index += 1
+        for op in ops["extensions"]:
+            record = current(op["key"])
+            expires_at = record["expires_at"] + op["blocks"]
+            staged[op["key"]] = {**record, "expires_at": expires_at, "last_modified_at": number}
+            log("ArkivEntityBTLExtended", op["key"], record["owner"], [record["expires_at"], expires_at, 0])
+            op_index += 1
+        for op in ops["change_owners"]:
+            record = owned(op["key"])
+            staged[op["key"]] = {**record, "owner": op["owner"], "last_modified_at": number}
+            log("ArkivEntityOwnerChanged", op["key"], record["owner"], [], extra_topic=op["owner"])
+            op_index += 1
+
+        for key, record in staged.items():
+            self.versions.setdefault(key, []).append((number, record))
+            if record is not None:
+                self.expiries.setdefault(record["expires_at"], set()).add(key)
+        return logs
+
+    def _log(self, block: Dict[str, Any], tx_hash: str, tx_index: int, log_index: int, name: str,
+             topics: List[str], values: List[int]) -> Dict[str, Any]:
+        return {
+            "address": ARKIV_ADDRESS, "topics": [_TOPICS[name]] + topics,
+            "data": "0x" + encode(["uint256"] * len(values), values).hex(),
+            "blockNumber": _hex(block["number"]), "blockHash": block["hash"], "transactionHash": tx_hash,
+            "transactionIndex": _hex(tx_index), "logIndex": _hex(log_index), "removed": False,
+        }
+
+    def _logs(self, criteria: Dict[str, Any], from_block: int, to_block: int) -> List[Dict[str, Any]]:
+        addresses = criteria.get("address")
+        if isinstance(addresses, str):
+            addresses = [addresses]
+        addresses = {a.lower() for a in addresses} if addresses else None
+        wanted = criteria.get("topics") or []
+        result = []
+        for number in range(max(0, from_block), to_block + 1):
+            for log in self.logs.get(number, ()):
+                if addresses is not None and log["address"].lower() not in addresses:
+                    continue
+                if all(want is None or log["topics"][i] in ([want] if isinstance(want, str) else want)
+                       for i, want in enumerate(wanted) if i < len(log["topics"])):
+                    result.append(log)
+        return result
+
+    # Entities
+
+    def _entity_at(self, key: str, block: int) -> Optional[Dict[str, Any]]:
+        for number, record in reversed(self.versions.get(key.lower(), ())):
+            if number <= block:
+                return record
+        return None
+
+    @staticmethod
+    def _query_record(record: Dict[str, Any]) -> Dict[str, Any]:
+        return {"$key": record["key"], "$owner": record["owner"], "$creator": record["creator"],
+                "$expiration": record["expires_at"], "attributes": record["attributes"]}
+
+    @staticmethod
+    def _query_item(record: Dict[str, Any], include: Dict[str, bool]) -> Dict[str, Any]:
+        item: Dict[str, Any] = {}
+        if include.get("key"):
+            item["key"] = record["key"]
+        if include.get("owner"):
+            item["owner"] = record["owner"]
+        if include.get("payload"):
+            item["value"] = "0x" + record["payload"].hex()
+        if include.get("contentType"):
+            item["contentType"] = record["content_type"]
+        if include.get("expiration"):
+            item["expiresAt"] = record["expires_at"]
+        if include.get("createdAtBlock"):
+            item["createdAtBlock"] = record["created_at"]
+        if include.get("lastModifiedAtBlock"):
+            item["lastModifiedAtBlock"] = record["last_modified_at"]
+        if include.get("transactionIndexInBlock"):
+            item["transactionIndexInBlock"] = record["tx_index"]
+        if include.get("operationIndexInTransaction"):
+            item["operationIndexInTransaction"] = record["op_index"]
+        if include.get("attributes"):
+            attributes = record["attributes"]
+            item["stringAttributes"] = [{"key": k, "value": v} for k, v in attributes.items() if isinstance(v, str)]
+            item["numericAttributes"] = [{"key": k, "value": v} for k, v in attributes.items() if isinstance(v, int)]
+        return item
+
+    @staticmethod
+    def _gas(data: bytes) -> int:
+        return 21000 + 16 * len(data) + 20000
+
+    # Block production
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.block_time):
+            try:
+                self.mine()
+            except Exception:
+                logger.exception("Memory node failed to mine a block")
+
+    def start(self) -> None:
+        if self._thread is not None or self.block_time <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="memory-node", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+            self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            live = sum(1 for key in self.versions if self._entity_at(key, self.head) is not None)
+            return {"head": self.head, "entities": live, "pool": len(self.pool), "transactions": len(self.receipts),
+                    "requests": self.requests, "injected_failures": self.injected}
+
+
+class MemoryProvider(JSONBaseProvider):
+    """
+    web3 provider answering from a MemoryNode. Requests and results go through
+    JSON as they would over HTTP; `guard` (an RpcGuard) adds retries and the
+    circuit breaker, as for the HTTP provider.
+    """
+
+    def __init__(self, node: MemoryNode, guard: Any = None):
+        super().__init__()
+        self.node = node
+        self.guard = guard
+
+    def _respond(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            result = json.loads(json.dumps(self.node.request(request["method"], request["params"])))
+            return {"jsonrpc": "2.0", "id": request["id"], "result": result}
+        except RpcError as e:
+            return {"jsonrpc": "2.0", "id": request["id"], "error": {"code": e.code, "message": str(e)}}
+
+    def _guarded(self, methods: List[Any], fn: Callable[[], Any]) -> Any:
+        return fn() if self.guard is None else self.guard.call(methods, fn)
+
+    def make_request(self, method: Any, params: Any) -> Any:
+        request = json.loads(self.encode_rpc_request(method, params))
+
+        def run() -> Dict[str, Any]:
+            self.node.delay()
+            return self._respond(request)
+
+        return self._guarded([method], run)
+
+    def make_batch_request(self, batch_requests: List[Tuple[Any, Any]]) -> List[Dict[str, Any]]:
+        requests_ = json.loads(self.encode_batch_rpc_request(batch_requests))
+
+        def run() -> List[Dict[str, Any]]:
+            self.node.delay()  # One round trip for the whole batch
+            return [self._respond(request) for request in requests_]
+
+        return self._guarded([method for method, _ in batch_requests], run)
+
+    def is_connected(self, show_traceback: bool = False) -> bool:
+        return True
@@ -0,0 +1,243 @@
+"""
+Local evaluation of Arkiv query expressions.
+
+Parses the query syntax accepted by `query_entities` (comparisons on attributes
+or `$key`/`$owner`, GLOB, AND/OR/NOT with `&&`/`||`/`!` aliases, parentheses,
+bare `0x..` hex values as sent by the SDK)
+and compiles it to a predicate over an entity record:
+
+    {"$key": "0x..", "$owner": "0x..", "attributes": {...}}
+
+so event subscriptions can be matched in memory without asking the node.
+"""
+
+import fnmatch
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+Record = Dict[str, Any]
+Predicate = Callable[[Record], bool]
+
+
+class QuerySyntaxError(ValueError):
+    pass
+
+
+_TOKEN = re.compile(
+    r'\s*(?:(?P<string>"(?:[^"\\]|\\.)*")'
+    r"|(?P<hex>0[xX][0-9a-fA-F]+)"
+    r"|(?P<number>-?\d+(?:\.\d+)?)"
+    r"|(?P<op>&&|\|\||!=|>=|<=|!~|=|<|>|~|!|\(|\))"
+    r"|(?P<word>[$A-Za-z_][\w.\-]*))"
+)
+
+_KEYWORDS = {"AND": "&&", "OR": "||", "NOT": "!", "GLOB": "~"}
+
+
+def _tokenize(text: str) -> List[Tuple[str, Any]]:
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        m = _TOKEN.match(text, pos)
+        if not m or m.end() == pos:
+            raise QuerySyntaxError(f"Unexpected input at position {pos}: {text[pos:pos + 10]!r}")
+        pos = m.end()
+        if m.group("string") is not None:
+            tokens.append(("value", bytes(m.group("string")[1:-1], "utf-8").decode("unicode_escape")))
+        elif m.group("hex") is not None:
+            tokens.append(("value", m.group("hex")))
+        elif m.group("number") is not None:
+            num = m.group("number")
+            tokens.append(("value", float(num) if "." in num else int(num)))
+        elif m.group("op") is not None:
+            tokens.append(("op", m.group("op")))
+        else:
+            word = m.group("word")
+            if word.upper() in _KEYWORDS:
+                tokens.append(("op", _KEYWORDS[word.upper()]))
+            else:
+                tokens.append(("ident", word))
+    return tokens
+
+
+def _field(record: Record, name: str) -> Any:
+    if name.startswith("$"):
+        value = record.get(name)
+        return value.lower() if isinstance(value, str) else value
+    return (record.get("attributes") or {}).get(name)
+
+
+def _compare(name: str, op: str, value: Any) -> Predicate:
+    # Addresses and keys are hex strings compared case-insensitively
+    if name.startswith("$") and isinstance(value, str):
+        value = value.lower()
+
+    def pred(record: Record) -> bool:
+        actual = _field(record, name)
+        if actual is None:
+            return False
+        if op == "~" or op == "!~":
+            matched = isinstance(actual, str) and isinstance(value, str) and fnmatch.fnmatchcase(actual, value)
+            return matched if op == "~" else not matched
+        if isinstance(value, (int, float)) != isinstance(actual, (int, float)):
+            return op == "!="
+        if op == "=":
+            return actual == value
+        if op == "!=":
+            return actual != value
+        if op == ">":
+            return actual > value
+        if op == ">=":
+            return actual >= value
+        if op == "<":
+            return actual < value
+        if op == "<=":
+            return actual <= value
+        return False
+
+    return pred
+
+
+class Query:
+    """Compiled query: `match(record)` plus the equality terms every match must satisfy"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self._tokens = _tokenize(text)
+        self._pos = 0
+        # (name, value) pairs ANDed at the top level; used to index subscriptions
+        self.equalities: List[Tuple[str, Any]] = []
+        if not self._tokens:
+            self.match: Predicate = lambda record: True
+            return
+        self.match = self._parse_or(top=True)
+        if self._pos != len(self._tokens):
+            raise QuerySyntaxError(f"Unexpected token {self._tokens[self._pos][1]!r}")
+
+    def _peek(self) -> Optional[Tuple[str, Any]]:
+        return self._tokens[self._pos] if self._pos < len(self._tokens) else None
+
+    def _next(self) -> Tuple[str, Any]:
+        token = self._peek()
+        if token is None:
+            raise QuerySyntaxError("Unexpected end of query")
+        self._pos += 1
+        return token
+
+    def _parse_or(self, top: bool = False) -> Predicate:
+        terms = [self._parse_and(top)]
+        while self._peek() == ("op", "||"):
+            self._next()
+            terms.append(self._parse_and(False))
+        if len(terms) > 1:
+            if top:
+                self.equalities = []  # A disjunction guarantees nothing
+            return lambda record: any(t(record) for t in terms)
+        return terms[0]
+
+    def _parse_and(self, top: bool) -> Predicate:
+        terms = [self._parse_not(top)]
+        while self._peek() == ("op", "&&"):
+            self._next()
+            terms.append(self._parse_not(top))
+        if len(terms) > 1:
+            return lambda record: all(t(record) for t in terms)
+        return terms[0]
+
+    def _parse_not(self, top: bool) -> Predicate:
+        if self._peek() == ("op", "!"):
+            self._next()
+            inner = self._parse_not(False)
+            return lambda record: not inner(record)
+        return self._parse_primary(top)
+
+    def _parse_primary(self, top: bool) -> Predicate:
+        kind, value = self._next()
+        if (kind, value) == ("op", "("):
+            inner = self._parse_or(False)
+            if self._next() != ("op", ")"):
+                raise QuerySyntaxError("Expected ')'")
+            return inner
+        if kind != "ident":
+            raise QuerySyntaxError(f"Expected attribute name, got {value!r}")
+        op_kind, op = self._next()
+        if op_kind != "op" or op not in ("=", "!=", ">", ">=", "<", "<=", "~", "!~"):
+            raise QuerySyntaxError(f"Expected comparison operator after {value!r}")
+        val_kind, operand = self._next()
+        if val_kind != "value":
+            raise QuerySyntaxError(f"Expected value after {value} {op}")
+        if top and op == "=":
+            self.equalities.append((value, operand.lower() if value.startswith("$") and isinstance(operand, str) else operand))
+        return _compare(value, op, operand)
+
+
+def compile_query(text: Optional[str]) -> Query:
+    """Compile a query expression; empty/None matches everything"""
+    return Query(text or "")
+
+
+class FilterTable:
+    """
+    Matches records against many compiled queries without testing each one.
+
+    A query with a top-level equality term is indexed under one such
+    (name, value) pair - `$key` first, then an attribute, then `$owner` - and is
+    only evaluated for records carrying that pair; the rest sit in a residual
+    list checked for every record.
+    """
+
+    def __init__(self):
+        self._index: Dict[Tuple[str, Any], Dict[Any, Tuple[Query, frozenset]]] = {}
+        self._residual: Dict[Any, Tuple[Query, frozenset]] = {}
+        self._slots: Dict[Any, Optional[Tuple[str, Any]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    @staticmethod
+    def _index_term(query: Query) -> Optional[Tuple[str, Any]]:
+        terms = query.equalities
+        for pick in (lambda n: n == "$key", lambda n: not n.startswith("$"), lambda n: n == "$owner"):
+            for name, value in terms:
+                if pick(name):
+                    return name, value
+        return None
+
+    def add(self, item: Any, query: Query, types: Any) -> None:
+        self.remove(item)
+        entry = (query, frozenset(types))
+        term = self._index_term(query)
+        self._slots[item] = term
+        if term is None:
+            self._residual[item] = entry
+        else:
+            self._index.setdefault(term, {})[item] = entry
+
+    def remove(self, item: Any) -> None:
+        if item not in self._slots:
+            return
+        term = self._slots.pop(item)
+        if term is None:
+            self._residual.pop(item, None)
+            return
+        bucket = self._index.get(term)
+        if bucket is not None:
+            bucket.pop(item, None)
+            if not bucket:
+                del self._index[term]
+
+    def match(self, event_type: str, record: Record) -> List[Any]:
+        """Items whose event types include event_type and whose query matches record"""
+        candidates = list(self._residual.items())
+        if self._index:
+            pairs = [("$key", _field(record, "$key")), ("$owner", _field(record, "$owner"))]
+            pairs.extend((record.get("attributes") or {}).items())
+            for pair in pairs:
+                try:
+                    bucket = self._index.get(pair)
+                except TypeError:
+                    continue  # Unhashable attribute value
+                if bucket:
+                    candidates.extend(bucket.items())
+        return [item for item, (query, types) in candidates if event_type in types and query.match(record)]
@@ -0,0 +1,279 @@
+"""
+Transaction receipt tracking.
+
+Writes no longer poll for their own receipt. Each sent transaction is handed
+to ReceiptTracker, which polls every unfinished hash (plus the head block) in
+one batched RPC per interval and moves it through
+
+    pending -> included -> final      (final: `finality` confirmations)
+    pending -> failed                 (mined with status 0)
+    pending -> dropped                (unknown to the node after `drop_after` seconds)
+
+An included transaction whose receipt disappears (reorg) goes back to pending.
+Requests wait on the tracker for the confirmations their policy asks for;
+`on_receipt` callbacks run once, in the tracker thread, before any waiter
+wakes up. Subscribers registered with `subscribe` get a signed POST when the
+transaction is final, failed or dropped.
+"""
+
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+
+from src.responses import dumps
+from src.webhooks import SIGNATURE_HEADER, delivery_session, permanent_failure, sign
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATES = ("final", "failed", "dropped")
+
+_TX_HASH = re.compile(r"^0x[0-9a-f]{64}$")
+
+# (head block, {tx hash: {"status", "block"} or None if there is no receipt yet})
+PollFn = Callable[[List[str]], Tuple[int, Dict[str, Optional[Dict[str, int]]]]]
+
+
+def is_tx_hash(value: str) -> bool:
+    return bool(_TX_HASH.match(value))
+
+
+def created_keys(receipt: Any) -> List[str]:
+    """Keys of the entities an Arkiv receipt created"""
+    return [str(create.key) for create in getattr(receipt, "creates", None) or ()]
+
+
+class TrackedTx:
+    def __init__(self, tx_hash: str):
+        self.hash = tx_hash
+        self.state = "pending"
+        self.block: Optional[int] = None
+        self.confirmations = 0
+        self.receipt: Any = None  # Arkiv receipt, once included
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.updated_at = self.submitted_at
+        self.callbacks: List[Callable[["TrackedTx"], None]] = []
+        self.subscribers: List[Dict[str, Any]] = []
+        self.seen_receipt = False
+
+    @property
+    def done(self) -> bool:
+        return self.state in TERMINAL_STATES
+
+    def reached(self, confirmations: int) -> bool:
+        """Whether a waiter asking for `confirmations` (0: submitted) can return"""
+        if confirmations == 0:
+            return True
+        # Only once the receipt callbacks have run, so waiters see their effects
+        return self.seen_receipt and (self.done or (self.state == "included" and self.confirmations >= confirmations))
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {"tx_hash": self.hash, "state": self.state, "block": self.block, "confirmations": self.confirmations,
+                "error": self.error, "submitted_at": self.submitted_at, "updated_at": self.updated_at}
+        if self.receipt is not None and self.state in ("included", "final"):
+            data["entity_keys"] = created_keys(self.receipt)  # How writes answered before mining learn their keys
+        return data
+
+
+class ReceiptTracker:
+    def __init__(self, poll: PollFn, fetch_receipt: Callable[[str], Any], is_known: Callable[[str], bool],
+                 finality: int = 6, interval: float = 1.0, drop_after: float = 300.0, retain: float = 3600.0,
+                 batch_size: int = 100, max_attempts: int = 4, backoff: float = 1.0, timeout: float = 10.0,
+                 post: Optional[Callable[[str, bytes, Dict[str, str]], int]] = None, allow_private: bool = False):
+        self.poll = poll
+        self.fetch_receipt = fetch_receipt
+        self.is_known = is_known
+        self.finality = finality
+        self.interval = interval
+        self.drop_after = drop_after
+        self.retain = retain
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.timeout = timeout
+        self._session = delivery_session(allow_private)
+        self.post = post or (lambda url, body, headers: self._session.post(
+            url, data=body, headers=headers, timeout=self.timeout, allow_redirects=False).status_code)
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="tx-notify")
+        self._txs: Dict[str, TrackedTx] = {}
+        self._changed = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.polls = 0
+        self.errors = 0
+        self.notified = 0
+
+    # Registration
+
+    def track(self, tx_hash: str, on_receipt: Optional[Callable[[TrackedTx], None]] = None) -> TrackedTx:
+        """Follow a sent transaction; on_receipt runs once it is included, failed or dropped"""
+        with self._changed:
+            tx = self._txs.get(tx_hash)
+            if tx is None:
+                tx = self._txs[tx_hash] = TrackedTx(tx_hash)
+            if on_receipt is not None:
+                tx.callbacks.append(on_receipt)
+        return tx
+
+    def get(self, tx_hash: str) -> Optional[TrackedTx]:
+        return self._txs.get(tx_hash)
+
+    def subscribe(self, tx_hash: str, url: str, secret: Optional[str] = None) -> TrackedTx:
+        """POST to url once the transaction is final, failed or dropped (at once if it already is)"""
+        tx = self.track(tx_hash)
+        subscriber = {"url": url, "secret": secret}
+        with self._changed:
+            if not tx.done:
+                tx.subscribers.append(subscriber)
+                return tx
+        self._executor.submit(self._deliver, subscriber, tx.to_dict())
+        return tx
+
+    def wait(self, tx: TrackedTx, confirmations: int, timeout: float) -> TrackedTx:
+        """Block until tx has `confirmations` confirmations (0: return at once) or is done, or timeout"""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while not tx.reached(confirmations):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+        return tx
+
+    def lookup(self, tx_hash: str) -> Optional[Dict[str, Any]]:
+        """State of a transaction this tracker does not follow, straight from the node; None if unknown"""
+        head, states = self.poll([tx_hash])
+        state = states.get(tx_hash)
+        if state is None:
+            if not self.is_known(tx_hash):
+                return None
+            return {"tx_hash": tx_hash, "state": "pending", "block": None, "confirmations": 0}
+        confirmations = max(0, head - state["block"] + 1)
+        if state["status"] != 1:
+            return {"tx_hash": tx_hash, "state": "failed", "block": state["block"], "confirmations": confirmations}
+        name = "final" if confirmations >= self.finality else "included"
+        return {"tx_hash": tx_hash, "state": name, "block": state["block"], "confirmations": confirmations,
+                "entity_keys": created_keys(self.fetch_receipt(tx_hash))}
+
+    # Polling
+
+    def _update(self, tx: TrackedTx, head: int, state: Optional[Dict[str, int]]) -> Optional[str]:
+        """Apply one poll result to tx; returns the new state if it changed"""
+        previous = tx.state
+        if state is None:
+            if tx.state == "included":
+                tx.state, tx.block, tx.confirmations = "pending", None, 0  # Reorged out
+            elif time.time() - tx.submitted_at >= self.drop_after and not self.is_known(tx.hash):
+                tx.state, tx.error = "dropped", "Transaction is no longer known to the node"
+        elif state["status"] != 1:
+            tx.state, tx.block = "failed", state["block"]
+            tx.error = f"Transaction failed with status {state['status']}"
+        else:
+            if tx.receipt is None or tx.block != state["block"]:
+                tx.receipt = self.fetch_receipt(tx.hash)
+            tx.block = state["block"]
+            tx.confirmations = max(1, head - tx.block + 1)
+            tx.state = "final" if tx.confirmations >= self.finality else "included"
+        if tx.state == previous:
+            return None
+        tx.updated_at = time.time()
+        return tx.state
+
+    def poll_once(self) -> int:
+        """Poll every unfinished transaction; returns the number whose state changed"""
+        with self._changed:
+            active = [tx for tx in self._txs.values() if not tx.done]
+        changed = []
+        for i in range(0, len(active), self.batch_size):
+            batch = active[i:i + self.batch_size]
+            head, states = self.poll([tx.hash for tx in batch])
+            self.polls += 1
+            for tx in batch:
+                try:
+                    if self._update(tx, head, states.get(tx.hash)) is not None:
+                        changed.append(tx)
+                except Exception as e:
+                    logger.warning("Failed to update transaction", extra={"tx_hash": tx.hash, "error": str(e)})
+
+        for tx in changed:
+            if tx.state != "pending" and not tx.seen_receipt:
+                for callback in tx.callbacks:
+                    try:
+                        callback(tx)
+                    except Exception:
+                        logger.exception("Transaction receipt callback failed")
+                tx.seen_receipt = True
+            if tx.done:
+                for subscriber in tx.subscribers:
+                    self._executor.submit(self._deliver, subscriber, tx.to_dict())
+                tx.subscribers = []
+        if active:
+            # Confirmations grow without a state change, so wake every waiter
+            with self._changed:
+                self._changed.notify_all()
+        self._prune()
+        return len(changed)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.retain
+        with self._changed:
+            for tx_hash in [h for h, tx in self._txs.items() if tx.done and tx.updated_at < cutoff]:
+                del self._txs[tx_hash]
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.poll_once()
+            except Exception as e:
+                self.errors += 1
+                logger.warning("Receipt poll failed", extra={"error": str(e)})
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="receipts", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+            self._thread = None
+        self._executor.shutdown(wait=False)
+
+    # Notification
+
+    def _deliver(self, subscriber: Dict[str, Any], payload: Dict[str, Any]) -> None:
+        body = dumps(payload)
+        headers = {"Content-Type": "application/json"}
+        if subscriber.get("secret"):
+            headers[SIGNATURE_HEADER] = sign(subscriber["secret"], body)
+        error = None
+        for attempt in range(self.max_attempts):
+            try:
+                status = self.post(subscriber["url"], body, headers)
+                if status < 300:
+                    self.notified += 1
+                    return
+                error = f"HTTP {status}"
+                if permanent_failure(status):
+                    break
+            except requests.RequestException as e:
+                error = str(e)
+            if attempt < self.max_attempts - 1:
+                time.sleep(self.backoff * 2 ** attempt)
+        logger.warning("Transaction notification failed", extra={"tx_hash": payload["tx_hash"], "error": error})
+
+    def stats(self) -> Dict[str, Any]:
+        states: Dict[str, int] = {}
+        for tx in list(self._txs.values()):
+            states[tx.state] = states.get(tx.state, 0) + 1
+        return {"tracked": len(self._txs), "states": states, "polls": self.polls, "errors": self.errors,
+                "notified": self.notified}
@@ -0,0 +1,151 @@
+"""
+Retries and circuit breaking for Arkiv RPC calls.
+
+Every JSON-RPC request of a client goes through its endpoint's RpcGuard:
+
+- errors are classified: transport failures (connection errors, timeouts,
+  HTTP 408/429/5xx) are transient, anything else (JSON-RPC errors, other HTTP
+  errors) is fatal and raised at once
+- read methods are retried on transient errors with full-jitter exponential
+  backoff; writes (eth_sendRawTransaction, ...) never are, as the node may
+  already have the transaction
+- a circuit breaker per endpoint opens after `failure_threshold` consecutive
+  failed calls and then fails calls fast with CircuitOpenError for
+  `reset_after` seconds, after which one probe call decides whether it closes
+
+Callers see RpcUnavailable (a ConnectionError) once an endpoint is down, with
+the number of seconds after which a retry makes sense.
+"""
+
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Sequence
+
+import requests
+
+# Methods that only read state, safe to send again
+READ_METHODS = {
+    "eth_chainId", "eth_blockNumber", "eth_getBalance", "eth_getBlockByNumber", "eth_getBlockByHash",
+    "eth_getTransactionByHash", "eth_getTransactionReceipt", "eth_getTransactionCount", "eth_call",
+    "eth_estimateGas", "eth_gasPrice", "eth_maxPriorityFeePerGas", "eth_feeHistory", "eth_getLogs", "eth_getCode",
+    "net_version",
+}
+READ_PREFIXES = ("arkiv_", "golembase_")  # Entity queries and metadata
+
+TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+def is_read(method: str) -> bool:
+    return method in READ_METHODS or method.startswith(READ_PREFIXES)
+
+
+def is_transient(error: BaseException) -> bool:
+    """Whether error means the endpoint could not answer (as opposed to answering with an error)"""
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code in TRANSIENT_STATUS
+    return isinstance(error, (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError))
+
+
+class RpcUnavailable(ConnectionError):
+    """The RPC endpoint is unreachable; retry after `retry_after` seconds"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(RpcUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    """closed -> open after `failure_threshold` consecutive failures -> half open after `reset_after` seconds"""
+
+    def __init__(self, failure_threshold: int = 5, reset_after: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.rejected = 0
+
+    def allow(self) -> None:
+        """Raise CircuitOpenError unless a call may go through"""
+        with self._lock:
+            if self.state == "closed":
+                return
+            remaining = self._opened_at + self.reset_after - time.monotonic()
+            if self.state == "open" and remaining <= 0:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probing:
+                self._probing = True  # This call is the probe
+                return
+            self.rejected += 1
+        raise CircuitOpenError("RPC endpoint unavailable (circuit open)", max(1.0, remaining))
+
+    def success(self) -> None:
+        with self._lock:
+            self.state, self.failures, self._probing = "closed", 0, False
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                if self.state == "closed":
+                    self.opened += 1
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures, "opened": self.opened, "rejected": self.rejected}
+
+
+class RpcGuard:
+    """Retry policy plus circuit breaker for one RPC endpoint"""
+
+    def __init__(self, attempts: int = 3, backoff: float = 0.2, max_backoff: float = 2.0,
+                 breaker: Optional[CircuitBreaker] = None, sleep: Callable[[float], None] = time.sleep):
+        self.attempts = max(1, attempts)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.sleep = sleep
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+
+    def delay(self, attempt: int) -> float:
+        """Full jitter: uniform in [0, min(max_backoff, backoff * 2**attempt)]"""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def call(self, methods: Sequence[str], fn: Callable[[], Any]) -> Any:
+        """Run one request for `methods` (several for a batch), retried only if every method is a read"""
+        attempts = self.attempts if all(is_read(method) for method in methods) else 1
+        self.calls += 1
+        self.breaker.allow()
+        for attempt in range(attempts):
+            try:
+                result = fn()
+            except Exception as e:
+                if not is_transient(e):
+                    self.breaker.success()  # The endpoint answered
+                    raise
+                if attempt < attempts - 1:
+                    self.retries += 1
+                    self.sleep(self.delay(attempt))
+                    continue
+                self.failures += 1
+                self.breaker.failure()
+                retry_after = self.breaker.reset_after if self.breaker.state == "open" else 1.0
+                raise RpcUnavailable(f"RPC endpoint unavailable: {e}", retry_after) from e
+            self.breaker.success()
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {"calls": self.calls, "retries": self.retries, "failures": self.failures,
+                "breaker": self.breaker.stats()}
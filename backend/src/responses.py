@@ -0,0 +1,124 @@
+"""
+Fast JSON responses and conditional GET (ETag / If-None-Match) helpers.
+"""
+
+import hashlib
+import time
+from email.utils import formatdate
+from typing import Any, Dict, Optional
+
+import orjson
+from fastapi.responses import Response
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize to compact JSON bytes (NumPy arrays natively, other non-JSON types as str)"""
+    return orjson.dumps(content, default=str, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def make_etag(*parts: Any) -> str:
+    """Strong ETag from the given identity parts"""
+    digest = hashlib.blake2b("|".join(str(p) for p in parts).encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+
+def content_etag(body: bytes) -> str:
+    """Strong ETag from the serialized response body"""
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def entity_etag(entity_key: str, last_modified_at_block: Optional[int], owner: Optional[str]) -> Optional[str]:
+    """Strong ETag for an entity representation, None if the block is unknown"""
+    if last_modified_at_block is None:
+        return None
+    return make_etag(entity_key, last_modified_at_block, owner)
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """Weak comparison of If-None-Match against etag (RFC 9110 13.1.2)"""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    for candidate in if_none_match.split(","):
+        if candidate.strip().removeprefix("W/") == opaque:
+            return True
+    return False
+
+
+def not_modified(etag: str, headers: Optional[Dict[str, str]] = None) -> Response:
+    """Empty 304 carrying the validator"""
+    return Response(status_code=304, headers={"ETag": etag, **(headers or {})})
+
+
+def is_immutable(attributes: Optional[Dict[str, Any]]) -> bool:
+    """Write-once (`immutable` attribute) or content-addressed (`content_hash` attribute) entity"""
+    if not attributes:
+        return False
+    flag = str(attributes.get("immutable", "")).lower()
+    return flag in ("1", "true", "yes") or bool(attributes.get("content_hash"))
+
+
+def cache_headers(
+    expires_at_block: Optional[int],
+    head_block: Optional[int],
+    block_time: int,
+    immutable: bool = False,
+    max_age_cap: int = 60,
+    shared: bool = False,
+) -> Dict[str, str]:
+    """
+    Cache-Control/Expires/Vary for an entity read, bounded by the entity's remaining lifetime.
+
+    Mutable entities are cacheable for at most max_age_cap seconds and must be
+    revalidated (ETag) afterwards; immutable ones for their whole remaining TTL.
+    Unless shared caching is enabled, responses are private and vary on the
+    payment header so one payer's response is never served to another.
+    """
+    vary = "Accept-Encoding" if shared else "X-PAYMENT, Accept-Encoding"
+    scope = "public" if shared else "private"
+
+    if expires_at_block is None or head_block is None:
+        return {"Cache-Control": f"{scope}, no-cache", "Vary": vary}
+
+    remaining = max(0, (expires_at_block - head_block) * block_time)
+    if remaining == 0:
+        return {"Cache-Control": "no-store", "Vary": vary}
+
+    if immutable:
+        max_age = remaining
+        directives = f"{scope}, max-age={max_age}, immutable"
+    else:
+        max_age = min(remaining, max_age_cap)
+        directives = f"{scope}, max-age={max_age}, must-revalidate"
+
+    return {
+        "Cache-Control": directives,
+        "Expires": formatdate(time.time() + max_age, usegmt=True),
+        "Vary": vary,
+    }
+
+
+def json_response(
+    content: Any,
+    status_code: int = 200,
+    etag: Optional[str] = None,
+    if_none_match: Optional[str] = None,
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """
+    Serialize content once with orjson and attach an ETag.
+    Uses the given etag or hashes the body; answers 304 when If-None-Match matches.
+    """
+    body = dumps(content)
+    etag = etag or content_etag(body)
+    if status_code == 200 and etag_matches(if_none_match, etag):
+        return not_modified(etag, headers)
+    return Response(
+        content=body,
+        status_code=status_code,
+        media_type="application/json",
+        headers={"ETag": etag, **(headers or {})},
+    )
+
@@ -0,0 +1,317 @@
+"""
+Thin wrapper around the Arkiv SDK: client construction, warm-up and event log decoding.
+
+arkiv/web3 account for most of the backend's import time, so main.py imports
+this module lazily and the lifespan hook loads it off the event loop.
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from arkiv import Arkiv
+from arkiv.account import NamedAccount
+from arkiv.contract import ARKIV_ADDRESS, EVENTS
+from arkiv.types import (
+    ChangeOwnerEvent,
+    DeleteOp,
+    CreateEvent,
+    DeleteEvent,
+    ExpiryEvent,
+    ExtendEvent,
+    UpdateEvent,
+    ExtendOp,
+    ChangeOwnerOp,
+    Operations,
+    TransactionReceipt,
+    QueryOptions,
+    KEY,
+    ATTRIBUTES,
+    PAYLOAD,
+    OWNER,
+    CONTENT_TYPE,
+    EXPIRATION,
+    LAST_MODIFIED_AT,
+)
+from arkiv.utils import is_entity_key, to_create_op, to_event, to_receipt, to_tx_params, to_update_op
+from web3 import HTTPProvider, Web3
+from web3.exceptions import TransactionNotFound
+
+from src.resilience import RpcGuard
+from src.txparams import TxParamsCache
+
+logger = logging.getLogger(__name__)
+
+# Everything but the payload: enough to compute validators and caching headers
+META_FIELDS = KEY | OWNER | CONTENT_TYPE | ATTRIBUTES | LAST_MODIFIED_AT | EXPIRATION
+
+# Event classes by the names the backend publishes them under
+EVENT_NAMES = {
+    CreateEvent: "created",
+    UpdateEvent: "updated",
+    ExtendEvent: "extended",
+    DeleteEvent: "deleted",
+    ExpiryEvent: "expired",
+    ChangeOwnerEvent: "owner_changed",
+}
+
+
+class GuardedHTTPProvider(HTTPProvider):
+    """HTTPProvider sending every request (single or batch) through an RpcGuard instead of web3's own retries"""
+
+    def __init__(self, endpoint_uri: str, guard: RpcGuard, **kwargs: Any):
+        super().__init__(endpoint_uri, exception_retry_configuration=None, **kwargs)
+        self.guard = guard
+
+    def make_request(self, method: Any, params: Any) -> Any:
+        return self.guard.call([method], lambda: super(GuardedHTTPProvider, self).make_request(method, params))
+
+    def make_batch_request(self, batch_requests: List[Tuple[Any, Any]]) -> Any:
+        return self.guard.call([method for method, _ in batch_requests],
+                               lambda: super(GuardedHTTPProvider, self).make_batch_request(batch_requests))
+
+
+def build_client(private_key: str, rpc_url: str, pool_size: int = 10, guard: Optional[RpcGuard] = None,
+                 timeout: float = 10.0) -> Arkiv:
+    """
+    Create an Arkiv client whose provider keeps up to pool_size RPC connections
+    open and sends requests through guard (retries, circuit breaker)
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    account = NamedAccount.from_private_key("backend", private_key)
+    provider = GuardedHTTPProvider(rpc_url, guard or RpcGuard(), session=session, request_kwargs={"timeout": timeout})
+    return Arkiv(provider=provider, account=account)
+
+
+def build_memory_client(private_key: str, guard: Optional[RpcGuard] = None, **node_options: Any) -> Arkiv:
+    """
+    Create an Arkiv client backed by a new in-memory node (src.memnode) instead
+    of an RPC endpoint; node_options go to MemoryNode. The node is at
+    client.provider.node.
+    """
+    from src.memnode import MemoryNode, MemoryProvider
+
+    node = MemoryNode(**node_options)
+    node.start()
+    account = NamedAccount.from_private_key("backend", private_key)
+    return Arkiv(provider=MemoryProvider(node, guard or RpcGuard()), account=account)
+
+
+def build_signer(client: Arkiv, private_key: str, name: str) -> Arkiv:
+    """Another client signing with private_key, sharing client's provider (and its connection pool)"""
+    return Arkiv(provider=client.provider, account=NamedAccount.from_private_key(name, private_key))
+
+
+def warm_up(client: Arkiv, connections: int = 4, query: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Pay first-call costs before traffic arrives: open `connections` pooled RPC
+    connections, cache the chain id and head block, and optionally prefetch
+    metadata of the entities matching `query`.
+    """
+    started = time.monotonic()
+    chain_id = client.eth.chain_id
+
+    # Concurrent calls force the pool to open (and keep) several connections
+    with ThreadPoolExecutor(max_workers=max(1, connections)) as pool:
+        blocks = list(pool.map(lambda _: client.eth.block_number, range(max(1, connections))))
+
+    entities = []
+    if query:
+        options = QueryOptions(META_FIELDS, max_results_per_page=100)
+        entities = client.arkiv.query_entities_page(query, options).entities
+
+    return {
+        "chain_id": chain_id,
+        "head_block": max(blocks),
+        "entities": entities,
+        "seconds": round(time.monotonic() - started, 3),
+    }
+
+
+# Send errors meaning the nonce was already used (by this process before a resync, or another one)
+NONCE_ERRORS = ("nonce too low", "already known", "replacement transaction underpriced")
+
+
+def operations_kind(operations: Operations) -> str:
+    """Gas estimate class of a transaction, e.g. "creates:1" or "extensions:40" """
+    return ",".join(f"{name}:{len(getattr(operations, name))}"
+                    for name in ("creates", "updates", "deletes", "extensions", "change_owners")
+                    if getattr(operations, name))
+
+
+def send_operations(client: Arkiv, operations: Operations, tx: TxParamsCache) -> Tuple[Any, str, int]:
+    """
+    Sign a transaction locally with parameters from tx and send it raw:
+    (tx hash, operations kind, calldata size). A send rejected for its nonce
+    is retried once with a nonce refetched from the node.
+    """
+    params = to_tx_params(operations)
+    address = client.eth.default_account
+    account = next(a for a in client.accounts.values() if a.address == address).local_account
+    kind, size = operations_kind(operations), len(params["data"])
+
+    params["from"] = address
+    params["gas"] = tx.gas(kind, size, lambda: client.eth.estimate_gas(dict(params)))
+    params["chainId"] = tx.chain_id(client)
+    params.update(tx.fees(client))
+    for attempt in range(2):
+        params["nonce"] = tx.next_nonce(client, address)
+        try:
+            signed = account.sign_transaction(params)
+            return client.eth.send_raw_transaction(signed.raw_transaction), kind, size
+        except Exception as e:
+            tx.resync_nonce(address)
+            if attempt or not any(marker in str(e).lower() for marker in NONCE_ERRORS):
+                raise
+
+
+def create_operations(payload: bytes, content_type: str, attributes: Dict[str, Any], expires_in: int) -> Operations:
+    return Operations(creates=[to_create_op(payload=payload, content_type=content_type, attributes=attributes,
+                                            expires_in=expires_in)])
+
+
+def update_operations(entity_key: str, payload: Optional[bytes] = None, content_type: Optional[str] = None,
+                      attributes: Optional[Dict[str, Any]] = None, expires_in: Optional[int] = None) -> Operations:
+    return Operations(updates=[to_update_op(entity_key=entity_key, payload=payload, content_type=content_type,
+                                            attributes=attributes, expires_in=expires_in)])
+
+
+def delete_operations(entity_key: str) -> Operations:
+    return Operations(deletes=[DeleteOp(key=entity_key)])
+
+
+def change_owner_operations(transfers: List[Tuple[str, str]]) -> Operations:
+    return Operations(change_owners=[ChangeOwnerOp(key=key, new_owner=owner) for key, owner in transfers])
+
+
+def extend_operations(extensions: List[Tuple[str, int]]) -> Operations:
+    """Extend several entities, each by its own number of seconds, in one transaction"""
+    return Operations(extensions=[ExtendOp(key=key, extend_by=seconds) for key, seconds in extensions])
+
+
+def is_address(value: str) -> bool:
+    return isinstance(value, str) and Web3.is_address(value)
+
+
+def query_all(client: Arkiv, query: str, fields: int, at_block: Optional[int] = None) -> Iterator[Any]:
+    """Every entity matching query (as of at_block), fetched page by page"""
+    options = QueryOptions(fields, max_results_per_page=200, at_block=at_block)
+    return iter(client.arkiv.query_entities(query, options))
+
+
+def get_owners(client: Arkiv, keys: List[str], chunk: int = 100) -> Dict[str, str]:
+    """Owner of every existing entity among keys, reading `chunk` keys per query"""
+    owners = {}
+    for i in range(0, len(keys), chunk):
+        query = " || ".join(f"$key = {key}" for key in keys[i:i + chunk])
+        options = QueryOptions(KEY | OWNER, max_results_per_page=chunk)
+        for entity in client.arkiv.query_entities(query, options):
+            owners[entity.key.lower()] = entity.owner
+    return owners
+
+
+def get_attributes(client: Arkiv, keys: List[str], at_block: Optional[int] = None,
+                   chunk: int = 100) -> Dict[str, Dict[str, Any]]:
+    """Attributes of every entity among keys that existed as of at_block, reading `chunk` keys per query"""
+    attributes = {}
+    for i in range(0, len(keys), chunk):
+        query = " || ".join(f"$key = {key}" for key in keys[i:i + chunk])
+        for entity in query_all(client, query, KEY | ATTRIBUTES, at_block=at_block):
+            attributes[entity.key.lower()] = entity.attributes
+    return attributes
+
+
+def query_owners(client: Arkiv, query: str, limit: int) -> Dict[str, str]:
+    """Owner of each entity matching query, for up to limit + 1 entities (so callers can tell there are more)"""
+    owners = {}
+    options = QueryOptions(KEY | OWNER, max_results_per_page=min(limit + 1, 200))
+    for entity in client.arkiv.query_entities(query, options):
+        owners[entity.key.lower()] = entity.owner
+        if len(owners) > limit:
+            break
+    return owners
+
+
+def send_change_owners(client: Arkiv, transfers: List[Tuple[str, str]], tx: TxParamsCache,
+                       batch_size: int = 100) -> List[Dict[str, Any]]:
+    """
+    Change the owner of many entities: `batch_size` operations per transaction,
+    every transaction sent back to back with consecutive nonces. Returns one
+    {"keys", "tx_hash", "kind", "size", "error"} per transaction, without
+    waiting for receipts.
+    """
+    sent = []
+    for i in range(0, len(transfers), batch_size):
+        batch = transfers[i:i + batch_size]
+        result = {"keys": [key for key, _ in batch], "tx_hash": None, "kind": None, "size": None, "error": None}
+        try:
+            tx_hash, result["kind"], result["size"] = send_operations(client, change_owner_operations(batch), tx)
+            result["tx_hash"] = tx_hash.to_0x_hex()
+        except Exception as e:
+            # Nothing was broadcast; the nonce was resynced for the next batch
+            result["error"] = str(e)
+        sent.append(result)
+    return sent
+
+
+def poll_receipts(client: Arkiv, tx_hashes: List[str]) -> Tuple[int, Dict[str, Optional[Dict[str, int]]]]:
+    """
+    Head block and {tx hash: {"status", "block"}, or None without a receipt}
+    for many transactions in one batched JSON-RPC request
+    """
+    batch = [("eth_blockNumber", [])] + [("eth_getTransactionReceipt", [h]) for h in tx_hashes]
+    responses = client.provider.make_batch_request(batch)
+    if not isinstance(responses, list):
+        raise RuntimeError(f"Batch request failed: {responses.get('error')}")
+    errors = [r["error"] for r in responses if r.get("error")]
+    if errors:
+        raise RuntimeError(f"Batch request failed: {errors[0]}")
+    head = int(responses[0]["result"], 16)
+    states = {}
+    for tx_hash, response in zip(tx_hashes, responses[1:]):
+        receipt = response.get("result")
+        states[tx_hash] = None if receipt is None else {
+            "status": int(receipt["status"], 16), "block": int(receipt["blockNumber"], 16)
+        }
+    return head, states
+
+
+def get_receipt(client: Arkiv, tx_hash: str) -> TransactionReceipt:
+    """Arkiv receipt (created keys, extensions, ...) of a mined transaction"""
+    return to_receipt(client.arkiv.contract, tx_hash, client.eth.get_transaction_receipt(tx_hash))
+
+
+def is_transaction_known(client: Arkiv, tx_hash: str) -> bool:
+    """Whether the node has the transaction (mined or in its pool)"""
+    try:
+        client.eth.get_transaction(tx_hash)
+        return True
+    except TransactionNotFound:
+        return False
+
+
+def event_log_filter(client: Arkiv, from_block: int, to_block: int) -> Dict[str, Any]:
+    """eth_getLogs filter matching every (non-legacy) Arkiv entity event in a block range"""
+    contract = client.arkiv.contract
+    topics = [contract.events[EVENTS[name]].topic for name in EVENT_NAMES.values()]
+    return {"address": ARKIV_ADDRESS, "fromBlock": from_block, "toBlock": to_block, "topics": [topics]}
+
+
+def decode_log(client: Arkiv, log: Any) -> Optional[Tuple[str, Any]]:
+    """(event name, SDK event) for an Arkiv contract log; None for events the backend ignores"""
+    event = to_event(client.arkiv.contract, log)
+    if event is None:
+        return None
+    return EVENT_NAMES[type(event)], event
+
+
+def get_event_logs(client: Arkiv, from_block: int, to_block: int) -> List[Any]:
+    """Raw Arkiv entity event logs in a block range (one eth_getLogs call)"""
+    return client.eth.get_logs(event_log_filter(client, from_block, to_block))
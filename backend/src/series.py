@@ -0,0 +1,397 @@
+"""
+Columnar time series of stash snapshot metrics.
+
+Snapshot entities (attribute `type` = "polkadot-stash", JSON payload as written
+by the CLI's stash monitor) are reduced to a few numeric fields and appended to
+one series per stash address. Each series is a directory of flat binary
+columns, memory-mapped with NumPy for reads:
+
+    DATA_DIR/series/<stash>/ts.i8            snapshot timestamp (unix ms)
+                           block.i8          block of the create/update
+                           <field>.f8        one per field, NaN when missing
+
+Columns are only ever appended to, by the worker holding the store's leader
+lock; the length of a series is that of its shortest column, so a reader never
+sees a half-written row. Rows are kept in timestamp order.
+
+Aggregates (min/max/mean/last/count per bucket of `bucket` ms, aligned to
+the epoch) are computed with NumPy reduceat over bucket boundaries. Each
+series also keeps rollups, the same partial aggregates per hour and per day,
+folded forward as rows are appended; a bucket that is a multiple of a rollup
+level is answered from that rollup, in O(buckets) rather than O(points).
+"""
+
+from __future__ import annotations  # np.ndarray annotations must not load NumPy
+
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import orjson
+
+from src.events import Event
+from src.lazy import lazy_import
+from src.localstate import LeaderLock
+
+np = lazy_import("numpy")  # Loaded on the first series read or append, not at startup
+
+logger = logging.getLogger(__name__)
+
+# Numeric leaves of the CLI's StashInfo payload (balances are strings of planck)
+SNAPSHOT_FIELDS = ("balance.total", "balance.spendable", "balance.locked", "balance.untouchable", "activeEra.index")
+
+_SERIES_NAME = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+
+ROLLUP_LEVELS = (3600 * 1000, 86400 * 1000)  # Hourly, daily
+# Partial aggregates, mergeable across buckets: per field "<field>.<part>"
+_PARTS = ("min", "max", "sum", "n", "last")
+
+_DURATION = re.compile(r"^(\d+)(ms|s|m|h|d|w)?$")
+_UNIT_MS = {"ms": 1, "s": 1000, "m": 60 * 1000, "h": 3600 * 1000, "d": 86400 * 1000, "w": 7 * 86400 * 1000}
+
+
+def parse_duration(value: str) -> int:
+    """Milliseconds in "500ms", "30s", "15m", "1h", "1d", "1w" or a bare number of ms"""
+    match = _DURATION.match(value.strip())
+    if not match or int(match.group(1)) <= 0:
+        raise ValueError(f"Invalid duration: {value}")
+    return int(match.group(1)) * _UNIT_MS[match.group(2) or "ms"]
+
+
+def extract_fields(payload: bytes, fields: Iterable[str]) -> Dict[str, float]:
+    """Values of dotted-path numeric fields in a JSON payload (numeric strings included)"""
+    try:
+        document = orjson.loads(payload)
+    except orjson.JSONDecodeError:
+        return {}
+    values = {}
+    for field in fields:
+        value: Any = document
+        for part in field.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        if isinstance(value, bool) or value is None:
+            continue
+        try:
+            values[field] = float(value)
+        except (TypeError, ValueError):
+            continue
+    return values
+
+
+def _segments(ids: np.ndarray) -> np.ndarray:
+    """Start index of every run of equal ids"""
+    return np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+
+
+def _last_valid(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """Last non-NaN value of each segment (NaN if none)"""
+    index = np.maximum.reduceat(np.where(np.isnan(values), -1, np.arange(len(values))), starts)
+    last = np.full(len(starts), np.nan)
+    found = index >= 0
+    last[found] = values[index[found]]
+    return last
+
+
+def partial_aggregates(ts: np.ndarray, values: Dict[str, np.ndarray],
+                       bucket: int) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """(bucket starts, partial aggregates) of raw points; only non-empty buckets appear"""
+    if not len(ts):
+        return np.empty(0, dtype=np.int64), {f"{f}.{p}": np.empty(0) for f in values for p in _PARTS}
+    ids = ts // bucket
+    starts = _segments(ids)
+    parts = {}
+    for field, v in values.items():
+        valid = ~np.isnan(v)
+        parts[f"{field}.min"] = np.fmin.reduceat(v, starts)
+        parts[f"{field}.max"] = np.fmax.reduceat(v, starts)
+        parts[f"{field}.sum"] = np.add.reduceat(np.where(valid, v, 0.0), starts)
+        parts[f"{field}.n"] = np.add.reduceat(valid.astype(np.float64), starts)
+        parts[f"{field}.last"] = _last_valid(v, starts)
+    return ids[starts] * bucket, parts
+
+
+def merge_aggregates(buckets: np.ndarray, parts: Dict[str, np.ndarray], fields: Iterable[str],
+                     bucket: int) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """Re-bucket partial aggregates into coarser buckets (`bucket` a multiple of theirs)"""
+    if not len(buckets):
+        return buckets, {f"{f}.{p}": np.empty(0) for f in fields for p in _PARTS}
+    ids = buckets // bucket
+    starts = _segments(ids)
+    merged = {}
+    for field in fields:
+        merged[f"{field}.min"] = np.fmin.reduceat(parts[f"{field}.min"], starts)
+        merged[f"{field}.max"] = np.fmax.reduceat(parts[f"{field}.max"], starts)
+        merged[f"{field}.sum"] = np.add.reduceat(parts[f"{field}.sum"], starts)
+        merged[f"{field}.n"] = np.add.reduceat(parts[f"{field}.n"], starts)
+        merged[f"{field}.last"] = _last_valid(parts[f"{field}.last"], starts)
+    return ids[starts] * bucket, merged
+
+
+def finalize(parts: Dict[str, np.ndarray], fields: Iterable[str]) -> Dict[str, Dict[str, np.ndarray]]:
+    """{field: {min, max, mean, last, count}} from partial aggregates"""
+    result = {}
+    for field in fields:
+        n = parts[f"{field}.n"]
+        mean = np.divide(parts[f"{field}.sum"], n, out=np.full(len(n), np.nan), where=n > 0)
+        result[field] = {"min": parts[f"{field}.min"], "max": parts[f"{field}.max"], "mean": mean,
+                         "last": parts[f"{field}.last"], "count": n.astype(np.int64)}
+    return result
+
+
+class Rollup:
+    """
+    Partial aggregates of a series per `size` ms bucket, in growable arrays.
+    `fold` takes in the rows appended since the last call: O(new rows).
+    """
+
+    def __init__(self, size: int, fields: Iterable[str]):
+        self.size = size
+        self.fields = tuple(fields)
+        self.rows = 0  # Series rows folded in
+        self.length = 0  # Buckets
+        self._data = {"bucket": np.empty(16, dtype=np.int64),
+                      **{f"{f}.{p}": np.empty(16) for f in self.fields for p in _PARTS}}
+
+    def _reserve(self, length: int) -> None:
+        capacity = len(self._data["bucket"])
+        if length > capacity:
+            capacity = max(length, capacity * 2)
+            for name, array in self._data.items():
+                grown = np.empty(capacity, dtype=array.dtype)
+                grown[:self.length] = array[:self.length]
+                self._data[name] = grown
+
+    def fold(self, columns: Dict[str, np.ndarray], rows: int) -> None:
+        if rows <= self.rows:
+            return
+        buckets, parts = partial_aggregates(
+            columns["ts"][self.rows:rows], {f: columns[f][self.rows:rows] for f in self.fields}, self.size
+        )
+        self.rows = rows
+        data, first = self._data, 0
+        if self.length and buckets[0] == data["bucket"][self.length - 1]:
+            # The newest bucket is still open: merge the first new one into it
+            i = self.length - 1
+            for field in self.fields:
+                data[f"{field}.min"][i] = np.fmin(data[f"{field}.min"][i], parts[f"{field}.min"][0])
+                data[f"{field}.max"][i] = np.fmax(data[f"{field}.max"][i], parts[f"{field}.max"][0])
+                data[f"{field}.sum"][i] += parts[f"{field}.sum"][0]
+                data[f"{field}.n"][i] += parts[f"{field}.n"][0]
+                if not np.isnan(parts[f"{field}.last"][0]):
+                    data[f"{field}.last"][i] = parts[f"{field}.last"][0]
+            first = 1
+        added = len(buckets) - first
+        self._reserve(self.length + added)
+        end = self.length + added
+        data = self._data
+        data["bucket"][self.length:end] = buckets[first:]
+        for name, values in parts.items():
+            data[name][self.length:end] = values[first:]
+        self.length = end
+
+    def view(self, start: Optional[int] = None, end: Optional[int] = None) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """(bucket starts, partial aggregates) of the buckets with start <= bucket < end"""
+        buckets = self._data["bucket"][:self.length]
+        lo = int(np.searchsorted(buckets, start)) if start is not None else 0
+        hi = int(np.searchsorted(buckets, end)) if end is not None else self.length
+        hi = max(lo, hi)
+        return buckets[lo:hi], {name: a[lo:hi] for name, a in self._data.items() if name != "bucket"}
+
+
+class Series:
+    """One append-only columnar series; see module docstring"""
+
+    def __init__(self, path: str, fields: Iterable[str], levels: Iterable[int] = ROLLUP_LEVELS):
+        self.path = path
+        self.fields = tuple(fields)
+        self.dtypes = {"ts": np.int64, "block": np.int64, **{f: np.float64 for f in self.fields}}
+        self._maps: Dict[str, np.ndarray] = {}
+        self._mapped = 0
+        self.levels = tuple(sorted(levels))
+        self._rollups: Dict[int, Rollup] = {}
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        # A field added since the series was created starts out missing for the existing rows
+        rows = min(self._rows("ts"), self._rows("block"))
+        for field in self.fields:
+            if not os.path.exists(self._file(field)):
+                np.full(rows, np.nan).tofile(self._file(field))
+
+    def _file(self, column: str) -> str:
+        suffix = "i8" if self.dtypes[column] is np.int64 else "f8"
+        return os.path.join(self.path, f"{column}.{suffix}")
+
+    def _rows(self, column: str) -> int:
+        try:
+            return os.path.getsize(self._file(column)) // np.dtype(self.dtypes[column]).itemsize
+        except FileNotFoundError:
+            return 0
+
+    def __len__(self) -> int:
+        return min(self._rows(column) for column in self.dtypes)
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """Read-only memory maps of every column, trimmed to the complete rows"""
+        length = len(self)
+        if length != self._mapped:
+            self._maps = {
+                column: np.asarray(np.memmap(self._file(column), dtype=dtype, mode="r", shape=(length,)))
+                for column, dtype in self.dtypes.items()
+            } if length else {}
+            self._mapped = length
+        if not length:
+            return {column: np.empty(0, dtype=dtype) for column, dtype in self.dtypes.items()}
+        return self._maps
+
+    def last(self) -> Optional[Tuple[int, int]]:
+        """(ts, block) of the newest row"""
+        columns = self.columns()
+        if not len(columns["ts"]):
+            return None
+        return int(columns["ts"][-1]), int(columns["block"][-1])
+
+    def append(self, ts: int, block: int, values: Dict[str, float]) -> bool:
+        """Append one row; False (and nothing written) unless it is newer than the last row"""
+        last = self.last()
+        if last is not None and (block <= last[1] or ts < last[0]):
+            return False
+        length = len(self)
+        row = {"ts": ts, "block": block, **{f: values.get(f, np.nan) for f in self.fields}}
+        for column, dtype in self.dtypes.items():
+            with open(self._file(column), "r+b" if os.path.exists(self._file(column)) else "wb") as f:
+                # Overwrite any partial row left by an interrupted append
+                f.seek(length * np.dtype(dtype).itemsize)
+                f.truncate()
+                f.write(np.array([row[column]], dtype=dtype).tobytes())
+        for level in self.levels:
+            self.rollup(level)
+        return True
+
+    def rollup(self, level: int) -> Rollup:
+        """The rollup for `level` ms, caught up with every appended row (built on first use)"""
+        with self._lock:
+            rollup = self._rollups.get(level)
+            if rollup is None:
+                rollup = self._rollups[level] = Rollup(level, self.fields)
+            columns = self.columns()
+            rollup.fold(columns, len(columns["ts"]))
+            return rollup
+
+    def aggregate(self, bucket: int, start: Optional[int] = None, end: Optional[int] = None,
+                  fields: Optional[Iterable[str]] = None) -> Tuple[np.ndarray, Dict[str, Dict[str, np.ndarray]]]:
+        """
+        (bucket starts, {field: {min, max, mean, last, count}}) per `bucket` ms
+        over the whole buckets covering [start, end). Uses the coarsest rollup
+        level that divides `bucket`, else the raw points.
+        """
+        fields = tuple(fields or self.fields)
+        if start is not None:
+            start = start // bucket * bucket
+        if end is not None:
+            end = -(-end // bucket) * bucket
+        level = max((l for l in self.levels if bucket % l == 0), default=None)
+        if level is not None:
+            buckets, parts = self.rollup(level).view(start, end)
+            buckets, parts = merge_aggregates(buckets, parts, fields, bucket)
+        else:
+            lo, hi = self.window(start, end)
+            columns = self.columns()
+            buckets, parts = partial_aggregates(columns["ts"][lo:hi], {f: columns[f][lo:hi] for f in fields}, bucket)
+        return buckets, finalize(parts, fields)
+
+    def window(self, start: Optional[int] = None, end: Optional[int] = None) -> Tuple[int, int]:
+        """[lo, hi) row range with start <= ts < end"""
+        ts = self.columns()["ts"]
+        lo = int(np.searchsorted(ts, start, side="left")) if start is not None else 0
+        hi = int(np.searchsorted(ts, end, side="left")) if end is not None else len(ts)
+        return lo, max(lo, hi)
+
+
+class SeriesStore:
+    """Series by name (stash address) under `root`"""
+
+    def __init__(self, root: str, fields: Iterable[str] = SNAPSHOT_FIELDS):
+        self.root = root
+        self.fields = tuple(fields)
+        self.leader = LeaderLock(os.path.join(root, ".leader"))
+        self._series: Dict[str, Series] = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def get(self, name: str, create: bool = False) -> Optional[Series]:
+        """The named series; None if it does not exist (or the name is not a valid series name)"""
+        if not _SERIES_NAME.match(name):
+            return None
+        with self._lock:
+            series = self._series.get(name)
+            if series is None:
+                path = os.path.join(self.root, name)
+                if not create and not os.path.isdir(path):
+                    return None
+                series = self._series[name] = Series(path, self.fields)
+            return series
+
+    def names(self) -> List[str]:
+        return sorted(n for n in os.listdir(self.root) if _SERIES_NAME.match(n))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"series": len(self.names()), "leader": self.leader.held}
+
+
+class SeriesRecorder:
+    """
+    EventHub consumer appending a row for every created/updated snapshot
+    entity. `fetch_payload(key, block)` returns the entity's payload as of
+    the event's block; `on_append(name, ts, block, values)` is called for
+    every appended row.
+    """
+
+    def __init__(self, store: SeriesStore, fetch_payload: Callable[[str, int], Optional[bytes]],
+                 entity_type: str = "polkadot-stash", name_attribute: str = "stash_address",
+                 on_append: Optional[Callable[[str, int, int, Dict[str, float]], Any]] = None):
+        self.store = store
+        self.on_append = on_append
+        self.fetch_payload = fetch_payload
+        self.entity_type = entity_type
+        self.name_attribute = name_attribute
+        self.appended = 0
+        self.skipped = 0
+
+    def offer(self, event: Event) -> None:
+        if not self.store.leader.held or event["type"] not in ("created", "updated"):
+            return
+        attributes = event.get("attributes") or {}
+        name = attributes.get(self.name_attribute)
+        if attributes.get("type") != self.entity_type or not isinstance(name, str):
+            return
+        try:
+            payload = self.fetch_payload(event["key"], event["block"])
+        except Exception as e:
+            logger.warning("Failed to fetch snapshot payload", extra={"entity_key": event["key"], "error": str(e)})
+            return
+        self.observe(name, payload, event["block"], attributes.get("timestamp"))
+
+    def observe(self, name: str, payload: Optional[bytes], block: int, timestamp: Any = None) -> bool:
+        """Append a snapshot's fields to its series; False if it has none or is not newer"""
+        values = extract_fields(payload, self.store.fields) if payload else {}
+        series = self.store.get(name, create=bool(values))
+        if series is None:
+            self.skipped += 1
+            return False
+        ts = int(timestamp) if isinstance(timestamp, (int, float)) else int(time.time() * 1000)
+        if not series.append(ts, block, values):
+            self.skipped += 1
+            return False
+        self.appended += 1
+        if self.on_append is not None:
+            try:
+                self.on_append(name, ts, block, values)
+            except Exception:
+                logger.exception("Series append listener failed")
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.store.stats(), "appended": self.appended, "skipped": self.skipped}
@@ -0,0 +1,117 @@
+"""
+Pool of backend signer wallets.
+
+Each wallet has its own nonce sequence, so spreading writes over several
+wallets lifts the one-transaction-pipeline cap of a single key. New entities go
+to the signer with the fewest writes in flight; writes to an existing entity
+are routed to the signer that owns it (only the owner may update, delete or
+transfer an entity).
+
+Balances are refreshed in the background; signers below `min_balance` stop
+receiving new entities (unless every signer is below it) but keep serving
+writes to the entities they own.
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Signer:
+    def __init__(self, client: Any):
+        self.client = client
+        self.address: str = client.eth.default_account
+        self.pending = 0
+        self.sent = 0
+        self.failed = 0
+        self.balance: Optional[int] = None  # Wei, None until first refreshed
+
+    def stats(self) -> Dict[str, Any]:
+        return {"address": self.address, "pending": self.pending, "sent": self.sent, "failed": self.failed,
+                # Wei as a string: balances overflow the 64-bit integers orjson encodes
+                "balance": None if self.balance is None else str(self.balance)}
+
+
+class SignerPool:
+    """Signers built from `clients` (one Arkiv client per key, the first being the primary)"""
+
+    def __init__(self, clients: List[Any], balance_of: Optional[Callable[[Any, str], int]] = None,
+                 min_balance: int = 0, interval: float = 60.0):
+        if not clients:
+            raise ValueError("A signer pool needs at least one client")
+        self.signers = [Signer(client) for client in clients]
+        self._by_address = {signer.address.lower(): signer for signer in self.signers}
+        self.balance_of = balance_of or (lambda client, address: client.eth.get_balance(address))
+        self.min_balance = min_balance
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def addresses(self) -> List[str]:
+        return [signer.address for signer in self.signers]
+
+    def owns(self, address: Optional[str]) -> bool:
+        return bool(address) and address.lower() in self._by_address
+
+    def pick(self, owner: Optional[str] = None) -> Signer:
+        """The signer owning `owner`'s entities if it is ours, else the least busy funded signer"""
+        if owner:
+            signer = self._by_address.get(owner.lower())
+            if signer is not None:
+                return signer
+        funded = [s for s in self.signers if s.balance is None or s.balance >= self.min_balance] or self.signers
+        with self._lock:
+            return min(funded, key=lambda s: (s.pending, s.sent + s.failed))
+
+    @contextmanager
+    def use(self, owner: Optional[str] = None) -> Iterator[Any]:
+        """Client of the signer picked for `owner`, counted as pending while the block runs"""
+        signer = self.pick(owner)
+        with self._lock:
+            signer.pending += 1
+        try:
+            yield signer.client
+            signer.sent += 1
+        except Exception:
+            signer.failed += 1
+            raise
+        finally:
+            with self._lock:
+                signer.pending -= 1
+
+    # Balances
+
+    def refresh_balances(self) -> None:
+        for signer in self.signers:
+            try:
+                signer.balance = self.balance_of(signer.client, signer.address)
+            except Exception as e:
+                logger.warning("Failed to fetch signer balance", extra={"address": signer.address, "error": str(e)})
+            if signer.balance is not None and signer.balance < self.min_balance:
+                logger.warning("Signer balance low", extra={"address": signer.address, "balance": signer.balance})
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            self.refresh_balances()
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="signer-balances", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+            self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"signers": [signer.stats() for signer in self.signers], "min_balance": self.min_balance}
@@ -0,0 +1,74 @@
+"""
+Single-flight request coalescing.
+
+Concurrent calls that share a key wait for the one call already in flight and
+receive its result (or exception) instead of issuing their own RPC.
+"""
+
+import re
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Deduplicates concurrent executions of the same keyed call"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            inflight = len(self._calls)
+        return {"executed": self.executed, "coalesced": self.coalesced, "inflight": inflight}
+
+
+# String literals (kept verbatim) or runs of whitespace outside them
+_LITERAL_OR_SPACE = re.compile(r'"(?:[^"\\]|\\.)*"|\s+')
+
+
+def normalize_query(query: str) -> str:
+    """Canonical whitespace so equivalent query strings share one in-flight call"""
+    return _LITERAL_OR_SPACE.sub(lambda m: " " if m.group(0)[0] != '"' else m.group(0), query).strip()
@@ -0,0 +1,192 @@
+"""
+Live entity event streams (SSE and WebSocket).
+
+StreamHub keeps the most recent events in a ring buffer and pushes new ones to
+connected clients whose query filter matches. Every event gets an id
+"<block>-<seq>"; a client reconnecting with its last-seen id (SSE
+Last-Event-ID) replays what it missed from the buffer, or, when the id is not
+buffered, everything after that block.
+
+Backpressure: each client has a bounded queue. A client that falls further
+behind than that is sent an "overflow" message and disconnected; it resumes
+from its last id, so the server never buffers unboundedly on its behalf.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from src.events import EVENT_TYPES, Event, query_record
+from src.query import FilterTable, Query, compile_query
+from src.responses import dumps
+
+logger = logging.getLogger(__name__)
+
+
+def event_id(seq: int, event: Event) -> str:
+    return f"{event.get('block') or 0}-{seq}"
+
+
+def parse_event_id(value: Optional[str]) -> Optional[Tuple[int, int]]:
+    """(block, seq) from "<block>-<seq>" or a bare block number; None if absent/invalid"""
+    if not value:
+        return None
+    block, _, seq = value.strip().partition("-")
+    try:
+        return int(block), int(seq or -1)
+    except ValueError:
+        return None
+
+
+class Stream:
+    """One connected client: its filter and bounded queue of (id, event), or a control message"""
+
+    def __init__(self, query: Query, types: Iterable[str], queue_size: int):
+        self.query = query
+        self.types = set(types)
+        self.queue: "asyncio.Queue[Tuple[str, Any]]" = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    def matches(self, event: Event) -> bool:
+        return event["type"] in self.types and self.query.match(query_record(event))
+
+    def push(self, seq: int, event: Event) -> None:
+        if self.overflowed:
+            return
+        if self.queue.qsize() >= self.queue.maxsize - 1:
+            # Keep one slot for the overflow notice, then stop queuing
+            self.overflowed = True
+            self.queue.put_nowait(("overflow", None))
+            return
+        self.queue.put_nowait((event_id(seq, event), event))
+
+    async def next(self) -> Tuple[str, Any]:
+        return await self.queue.get()
+
+
+class StreamHub:
+    """
+    Fan-out of EventHub events to stream clients. `on_active(bool)` is called
+    when the first client connects and `linger` seconds after the last one
+    leaves, so the event source keeps the buffer warm for reconnects.
+    """
+
+    def __init__(self, head_block: Callable[[], Optional[int]], buffer_size: int = 10000, queue_size: int = 1000,
+                 max_clients: int = 1000, linger: float = 300.0, on_active: Optional[Callable[[bool], None]] = None):
+        self.head_block = head_block
+        self.queue_size = queue_size
+        self.max_clients = max_clients
+        self.linger = linger
+        self.on_active = on_active
+        self._buffer: Deque[Tuple[int, Event]] = deque(maxlen=buffer_size)
+        self._streams: List[Stream] = []
+        self._table = FilterTable()
+        self._seq = 0
+        # Every event from this block on is in the buffer (None: unknown)
+        self._covered_from: Optional[int] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._linger_handle: Optional[asyncio.TimerHandle] = None
+        self.active = False
+        self.overflows = 0
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+
+    def offer(self, event: Event) -> None:
+        """EventHub consumer; safe to call from watcher threads"""
+        if self._loop is not None and self.active:
+            self._loop.call_soon_threadsafe(self._append, event)
+
+    def _append(self, event: Event) -> None:
+        self._seq += 1
+        if len(self._buffer) == self._buffer.maxlen and self._covered_from is not None:
+            self._covered_from = max(self._covered_from, self._buffer[0][1].get("block") or 0)
+        self._buffer.append((self._seq, event))
+        for stream in self._table.match(event["type"], query_record(event)):
+            was_overflowed = stream.overflowed
+            stream.push(self._seq, event)
+            if stream.overflowed and not was_overflowed:
+                self.overflows += 1
+
+    def _replay(self, stream: Stream, last_id: Tuple[int, int]) -> bool:
+        """Queue buffered events after last_id; False if the buffer no longer reaches back that far"""
+        block, seq = last_id
+        buffered = list(self._buffer)
+        start = next((i + 1 for i, (s, e) in enumerate(buffered) if s == seq and (e.get("block") or 0) == block), None)
+        complete = start is not None
+        if start is None:
+            # Unknown id (other worker, restart or evicted): resume after the block
+            start = next((i for i, (_, e) in enumerate(buffered) if (e.get("block") or 0) > block), len(buffered))
+            complete = self._covered_from is not None and block >= self._covered_from
+        for s, event in buffered[start:]:
+            if stream.matches(event):
+                stream.push(s, event)
+        return complete
+
+    async def subscribe(self, query: Optional[str] = None, types: Optional[Iterable[str]] = None,
+                        last_event_id: Optional[str] = None) -> Tuple[Stream, bool]:
+        """
+        New stream (raises ValueError for a bad filter or when full), and whether
+        the replay from last_event_id is gap-free. Must run on the event loop.
+        """
+        if len(self._streams) >= self.max_clients:
+            raise OverflowError("Too many stream clients")
+        types = list(types or EVENT_TYPES)
+        unknown = set(types) - set(EVENT_TYPES)
+        if unknown:
+            raise ValueError(f"Unknown event types: {', '.join(sorted(unknown))}")
+        stream = Stream(compile_query(query), types, self.queue_size)
+
+        head = None
+        if not self.active:
+            # The source starts watching from the current head, which may take an RPC: not on the event loop
+            head = await asyncio.to_thread(self.head_block)
+
+        complete = True
+        last_id = parse_event_id(last_event_id)
+        if last_id is not None:
+            complete = self._replay(stream, last_id)
+        self._streams.append(stream)
+        self._table.add(stream, stream.query, stream.types)
+        self._set_active(True, head)
+        return stream, complete
+
+    def unsubscribe(self, stream: Stream) -> None:
+        if stream in self._streams:
+            self._streams.remove(stream)
+            self._table.remove(stream)
+        if not self._streams and self._loop is not None:
+            if self._linger_handle is not None:
+                self._linger_handle.cancel()
+            self._linger_handle = self._loop.call_later(self.linger, self._linger_expired)
+
+    def _linger_expired(self) -> None:
+        self._linger_handle = None
+        if not self._streams:
+            self._set_active(False)
+
+    def _set_active(self, active: bool, head: Optional[int] = None) -> None:
+        if active and self._linger_handle is not None:
+            self._linger_handle.cancel()
+            self._linger_handle = None
+        if active != self.active:
+            self.active = active
+            self._buffer.clear()
+            self._covered_from = head if active else None
+            if self.on_active is not None:
+                self.on_active(active)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "clients": len(self._streams),
+            "buffered": len(self._buffer),
+            "active": self.active,
+            "overflows": self.overflows,
+        }
+
+
+def sse_message(event: str, data: Any, id: Optional[str] = None) -> bytes:
+    """One Server-Sent Events message"""
+    head = f"id: {id}\n" if id is not None else ""
+    return f"{head}event: {event}\ndata: ".encode() + dumps(data) + b"\n\n"
@@ -0,0 +1,127 @@
+"""
+Cached transaction parameters for the backend's writes.
+
+Letting web3 fill a transaction costs an RPC per missing field: chain id, max
+priority fee, latest block (base fee), gas estimate and pending nonce. This
+cache keeps each of them locally:
+
+- chain id: fetched once
+- fees: shared by every signer, refreshed at most every `fee_interval` seconds
+- gas: one estimate per (operations kind, calldata size bucket), scaled up for
+  larger calldata in the bucket and padded by `gas_margin`; dropped when a
+  transaction using it fails
+- nonces: fetched once per sender, then counted locally; resynced from the
+  node whenever a send fails. With `nonce_path`, the count lives in a
+  JsonStore, so uvicorn workers sending from the same signers take turns
+  instead of handing out the same nonce; a count idle for `nonce_ttl`
+  seconds (e.g. left by a worker that has since died) is refetched
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from src.localstate import JsonStore
+
+GasKey = Tuple[str, int]
+
+
+def size_bucket(size: int) -> int:
+    """Power-of-two bucket of a calldata size"""
+    return max(0, size - 1).bit_length()
+
+
+class TxParamsCache:
+    def __init__(self, fee_interval: float = 5.0, gas_margin: float = 1.2, gas_ttl: float = 3600.0,
+                 nonce_path: Optional[str] = None, nonce_ttl: float = 60.0):
+        self.fee_interval = fee_interval
+        self.gas_margin = gas_margin
+        self.gas_ttl = gas_ttl
+        self._chain_id: Optional[int] = None
+        self._fees: Optional[Dict[str, int]] = None
+        self._fees_at = 0.0
+        self._fee_lock = threading.Lock()
+        # GasKey -> (estimate, calldata size it was made for, monotonic time)
+        self._gas: Dict[GasKey, Tuple[int, int, float]] = {}
+        self._nonces: Dict[str, int] = {}
+        self._nonce_lock = threading.Lock()
+        self._nonce_store = JsonStore(nonce_path) if nonce_path else None
+        self.nonce_ttl = nonce_ttl
+        self.rpc_calls = 0
+        self.gas_hits = 0
+        self.gas_misses = 0
+        self.nonce_resyncs = 0
+
+    def chain_id(self, client: Any) -> int:
+        if self._chain_id is None:
+            self.rpc_calls += 1
+            self._chain_id = client.eth.chain_id
+        return self._chain_id
+
+    def fees(self, client: Any) -> Dict[str, int]:
+        """EIP-1559 fee fields, allowing for the base fee to double before inclusion"""
+        if self._fees is None or time.monotonic() - self._fees_at >= self.fee_interval:
+            with self._fee_lock:
+                if self._fees is None or time.monotonic() - self._fees_at >= self.fee_interval:
+                    self.rpc_calls += 2
+                    priority = client.eth.max_priority_fee
+                    base_fee = client.eth.get_block("latest")["baseFeePerGas"]
+                    self._fees = {"maxPriorityFeePerGas": priority, "maxFeePerGas": priority + 2 * base_fee}
+                    self._fees_at = time.monotonic()
+        return self._fees
+
+    def gas(self, kind: str, size: int, estimate: Callable[[], int]) -> int:
+        """Gas limit for a transaction of `kind` with `size` bytes of calldata"""
+        key = (kind, size_bucket(size))
+        cached = self._gas.get(key)
+        if cached is not None and time.monotonic() - cached[2] < self.gas_ttl:
+            self.gas_hits += 1
+            estimated, estimated_size, _ = cached
+        else:
+            self.gas_misses += 1
+            self.rpc_calls += 1
+            estimated, estimated_size = estimate(), size
+            self._gas[key] = (estimated, size, time.monotonic())
+        return int(estimated * max(1.0, size / max(1, estimated_size)) * self.gas_margin)
+
+    def forget_gas(self, kind: str, size: int) -> None:
+        self._gas.pop((kind, size_bucket(size)), None)
+
+    def _fetch_nonce(self, client: Any, address: str) -> int:
+        self.rpc_calls += 1
+        return client.eth.get_transaction_count(address, "pending")
+
+    def next_nonce(self, client: Any, address: str) -> int:
+        with self._nonce_lock:
+            if self._nonce_store is None:
+                nonce = self._nonces.get(address)
+                if nonce is None:
+                    nonce = self._fetch_nonce(client, address)
+                self._nonces[address] = nonce + 1
+                return nonce
+
+            allocated = []
+
+            def allocate(nonces: Dict[str, Any]) -> None:
+                # address -> [next nonce, wall time it was handed out]
+                entry = nonces.get(address)
+                if entry is None or time.time() - entry[1] >= self.nonce_ttl:
+                    entry = [self._fetch_nonce(client, address), 0.0]
+                allocated.append(entry[0])
+                nonces[address] = [entry[0] + 1, time.time()]
+
+            self._nonce_store.update(allocate)
+            return allocated[0]
+
+    def resync_nonce(self, address: str) -> None:
+        """Refetch the sender's nonce on its next transaction (a send failed, or another process used it)"""
+        with self._nonce_lock:
+            if self._nonce_store is None:
+                self._nonces.pop(address, None)
+            else:
+                self._nonce_store.update(lambda nonces: nonces.pop(address, None))
+        self.nonce_resyncs += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"chain_id": self._chain_id, "rpc_calls": self.rpc_calls, "gas_entries": len(self._gas),
+                "gas_hits": self.gas_hits, "gas_misses": self.gas_misses, "nonce_resyncs": self.nonce_resyncs}
@@ -0,0 +1,144 @@
+"""
+Wallet -> entity keys index for custody mode.
+
+Entities created for a user carry a `user_wallet` attribute (the backend
+keeps ownership, Option A) and may later be handed to that wallet (Option B).
+WalletIndex lists, per wallet, the entities tagged with it or owned by it, so
+`GET /me/entities` is answered from memory instead of a `user_wallet = ...`
+query per request.
+
+The index is loaded from one query at startup (`begin_load`/`finish_load`),
+then kept current by
+the backend's own writes and by entity events, which also cover writes made
+by other workers or other backends. Events arriving while the load runs are
+buffered and applied after it.
+"""
+
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from src.events import Event
+
+WALLET_ATTRIBUTE = "user_wallet"
+
+
+class WalletIndex:
+    """In-memory index; every method is safe to call from any thread"""
+
+    def __init__(self, attribute: str = WALLET_ATTRIBUTE):
+        self.attribute = attribute
+        # key -> {"wallet": tagged wallet, "owner": owner}; wallet -> keys (dict as an ordered set)
+        self._entities: Dict[str, Dict[str, Optional[str]]] = {}
+        self._by_wallet: Dict[str, Dict[str, None]] = {}
+        self._lock = threading.Lock()
+        self._buffer: Optional[List[Event]] = None
+        self.loaded = False
+
+    # Index maintenance (call with the lock held)
+
+    def _unlink(self, key: str) -> None:
+        entry = self._entities.pop(key, None)
+        if entry is None:
+            return
+        for wallet in {entry["wallet"], entry["owner"]} - {None}:
+            keys = self._by_wallet.get(wallet)
+            if keys is not None:
+                keys.pop(key, None)
+                if not keys:
+                    del self._by_wallet[wallet]
+
+    def _link(self, key: str, wallet: Optional[str], owner: Optional[str]) -> None:
+        self._unlink(key)
+        if wallet is None:
+            return  # Not a user entity
+        entry = {"wallet": wallet, "owner": owner}
+        self._entities[key] = entry
+        for w in {wallet, owner} - {None}:
+            self._by_wallet.setdefault(w, {})[key] = None
+
+    def _wallet_of(self, attributes: Optional[Dict[str, Any]]) -> Optional[str]:
+        wallet = (attributes or {}).get(self.attribute)
+        return wallet.lower() if isinstance(wallet, str) and wallet else None
+
+    # Updates
+
+    def put(self, key: str, attributes: Optional[Dict[str, Any]], owner: Optional[str] = None) -> None:
+        """Entity created or its attributes replaced; owner None keeps the known owner"""
+        key = key.lower()
+        with self._lock:
+            known = self._entities.get(key)
+            if owner is None and known is not None:
+                owner = known["owner"]
+            self._link(key, self._wallet_of(attributes), owner.lower() if owner else None)
+
+    def set_owner(self, key: str, owner: str) -> None:
+        key = key.lower()
+        with self._lock:
+            known = self._entities.get(key)
+            if known is not None:
+                self._link(key, known["wallet"], owner.lower())
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            self._unlink(key.lower())
+
+    def wallet_of(self, key: str) -> Optional[str]:
+        """Wallet an entity is tagged with, if indexed"""
+        entry = self._entities.get(key.lower())
+        return entry["wallet"] if entry else None
+
+    def _apply(self, event: Event) -> None:
+        if event["type"] in ("created", "updated"):
+            if event.get("attributes") is not None:
+                self.put(event["key"], event["attributes"], event.get("owner"))
+        elif event["type"] == "owner_changed":
+            self.set_owner(event["key"], event["owner"])
+        elif event["type"] in ("deleted", "expired"):
+            self.remove(event["key"])
+
+    def offer(self, event: Event) -> None:
+        """EventHub consumer"""
+        with self._lock:
+            if self._buffer is not None:
+                self._buffer.append(event)
+                return
+        self._apply(event)
+
+    # Loading
+
+    def begin_load(self) -> None:
+        """Buffer events until finish_load (call before the event source starts)"""
+        with self._lock:
+            self._buffer = []
+
+    def finish_load(self, entities: Iterable[Any], after_block: int, complete: bool = True) -> None:
+        """
+        Index the entities (KEY | OWNER | ATTRIBUTES) of the initial query as
+        of after_block, then the buffered events past it. `complete=False`
+        (the query failed) applies the events but leaves the index unloaded.
+        """
+        for entity in entities:
+            self.put(entity.key, entity.attributes, entity.owner)
+        while True:
+            with self._lock:
+                pending, self._buffer = self._buffer or [], []
+                if not pending:
+                    self._buffer = None
+                    self.loaded = complete
+                    return
+            for event in pending:
+                if (event.get("block") or 0) > after_block:
+                    self._apply(event)
+
+    # Reads
+
+    def keys(self, wallet: str, cursor: int = 0, limit: int = 50) -> Tuple[List[Dict[str, Any]], Optional[int], int]:
+        """(entities, next cursor or None, total) for one page of a wallet's entities, in index order"""
+        with self._lock:
+            keys = list(self._by_wallet.get(wallet.lower(), ()))
+            page = [{"entity_key": key, **self._entities[key]} for key in keys[cursor:cursor + limit]]
+        next_cursor = cursor + limit if cursor + limit < len(keys) else None
+        return page, next_cursor, len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"loaded": self.loaded, "entities": len(self._entities), "wallets": len(self._by_wallet)}
@@ -0,0 +1,414 @@
+"""
+Webhook subscriptions for entity events.
+
+Subscriptions (url, query filter, event types, optional signing secret) are
+persisted in DATA_DIR so every worker sees them; the worker holding the leader
+lock dispatches. Each subscriber has its own bounded queue and delivery task:
+events are batched (up to `batch_size`, or whatever arrives within
+`batch_window` seconds of the first), POSTed as
+
+    {"subscription_id": "...", "events": [...]}
+
+and retried with exponential backoff. When a queue is full the oldest event is
+dropped, so a slow or dead webhook only ever delays itself.
+
+URLs are user supplied, so deliveries (here and for alerts and transaction
+notifications) go through delivery_session: redirects are not followed and the
+address is checked again when connecting, as DNS may have changed since the
+URL was validated.
+
+LocalReceiver is an in-process HTTP endpoint standing in for a subscriber in tests.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import http.server
+import ipaddress
+import json
+import logging
+import random
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError
+
+from src.events import EVENT_TYPES, Event, query_record
+from src.localstate import JsonStore, LeaderLock
+from src.query import FilterTable, Query, compile_query
+from src.responses import dumps
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = "X-Arkivendor-Signature"
+
+
+def public_address(host: str, port: int) -> str:
+    """An address host resolves to; ValueError if it cannot be resolved or any address is not public"""
+    try:
+        infos = socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)
+    except socket.gaierror:
+        raise ValueError(f"Cannot resolve host {host}")
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%", 1)[0])
+        if (address.is_private or address.is_loopback or address.is_link_local or address.is_reserved
+                or address.is_multicast or address.is_unspecified):
+            raise ValueError("url must not point to a private address")
+    return infos[0][4][0]
+
+
+def validate_url(url: str, allow_private: bool = False) -> None:
+    """Reject non-HTTP(S) URLs and, unless allowed, hosts resolving to private/loopback addresses"""
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise ValueError("url must be an absolute http(s) URL")
+    if not allow_private:
+        public_address(parsed.hostname, parsed.port or 443)
+
+
+class _PublicOnly:
+    """Connection mixin: resolve and check the host when connecting, then connect to the checked address"""
+
+    def _new_conn(self):
+        host = self._dns_host
+        try:
+            self._dns_host = public_address(host, self.port)
+        except ValueError as e:
+            raise NewConnectionError(self, str(e)) from None
+        try:
+            return super()._new_conn()  # TLS still verifies and sends SNI for self.host
+        finally:
+            self._dns_host = host
+
+
+class _PublicHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = type("PublicHTTPConnection", (_PublicOnly, HTTPConnection), {})
+
+
+class _PublicHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = type("PublicHTTPSConnection", (_PublicOnly, HTTPSConnection), {})
+
+
+class _PublicOnlyAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _PublicHTTPConnectionPool,
+                                                   "https": _PublicHTTPSConnectionPool}
+
+
+def delivery_session(allow_private: bool = False) -> requests.Session:
+    """Session for POSTs to user supplied URLs (send them with allow_redirects=False)"""
+    session = requests.Session()
+    session.trust_env = False  # No proxy from the environment: connections must go where they were checked
+    if not allow_private:
+        adapter = _PublicOnlyAdapter()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+    return session
+
+
+def permanent_failure(status: int) -> bool:
+    """Whether a delivery answered with status should not be retried (redirects are never followed)"""
+    return 300 <= status < 500 and status not in (408, 429)
+
+
+def sign(secret: str, body: bytes) -> str:
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+class _Subscriber:
+    """Runtime state of one subscription: compiled filter, queue and delivery task"""
+
+    def __init__(self, sub: Dict[str, Any], queue_size: int):
+        self.sub = sub
+        self.query: Query = compile_query(sub.get("query"))
+        self.types = set(sub.get("events") or EVENT_TYPES)
+        self.queue: "asyncio.Queue[Event]" = asyncio.Queue(maxsize=queue_size)
+        self.task: Optional[asyncio.Task] = None
+        self.delivered = 0
+        self.dropped = 0
+        self.failed = 0
+
+
+class WebhookDispatcher:
+    """Registry of webhook subscriptions plus the asyncio delivery machinery"""
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = 50,
+        batch_window: float = 1.0,
+        queue_size: int = 1000,
+        max_attempts: int = 6,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        timeout: float = 10.0,
+        concurrency: int = 16,
+        on_active: Optional[Callable[[bool], None]] = None,
+        refresh_interval: float = 2.0,
+        allow_private: bool = False,
+    ):
+        self.store = JsonStore(path)
+        self.leader = LeaderLock(path + ".leader")
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.queue_size = queue_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.on_active = on_active
+        self.refresh_interval = refresh_interval
+
+        self.subscriptions: Dict[str, Dict[str, Any]] = {}
+        self._subscribers: Dict[str, _Subscriber] = {}
+        self._table = FilterTable()
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="webhook")
+        self._session = delivery_session(allow_private)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.active = False
+        self.received = 0
+
+    # Registry (callable from any thread)
+
+    def register(self, url: str, query: Optional[str] = None, events: Optional[List[str]] = None,
+                 secret: Optional[str] = None, payer: Optional[str] = None) -> Dict[str, Any]:
+        compile_query(query)  # Raises QuerySyntaxError
+        unknown = set(events or ()) - set(EVENT_TYPES)
+        if unknown:
+            raise ValueError(f"Unknown event types: {', '.join(sorted(unknown))}")
+        sub = {
+            "id": uuid.uuid4().hex,
+            "url": url,
+            "query": query or "",
+            "events": list(events or EVENT_TYPES),
+            "secret": secret,
+            "payer": payer.lower() if payer else None,  # Only this wallet may remove it
+            "created_at": int(time.time()),
+        }
+        self.subscriptions = self.store.update(lambda subs: subs.__setitem__(sub["id"], sub))
+        return sub
+
+    def get(self, subscription_id: str) -> Optional[Dict[str, Any]]:
+        if self.store.changed():
+            self.subscriptions = self.store.read()
+        return self.subscriptions.get(subscription_id)
+
+    def unregister(self, subscription_id: str) -> bool:
+        found = {}
+        def remove(subs):
+            found["sub"] = subs.pop(subscription_id, None)
+        self.subscriptions = self.store.update(remove)
+        return found["sub"] is not None
+
+    # Dispatch
+
+    def offer(self, event: Event) -> None:
+        """EventHub consumer; safe to call from watcher threads"""
+        if self._loop is not None and self._subscribers:
+            self._loop.call_soon_threadsafe(self._enqueue, event)
+
+    def _enqueue(self, event: Event) -> None:
+        self.received += 1
+        for subscriber in self._table.match(event["type"], query_record(event)):
+            if subscriber.queue.full():
+                subscriber.queue.get_nowait()
+                subscriber.dropped += 1
+            subscriber.queue.put_nowait(event)
+
+    async def _worker(self, subscriber: _Subscriber) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await subscriber.queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(subscriber.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            await self._deliver(subscriber, batch)
+
+    def _post(self, sub: Dict[str, Any], body: bytes) -> int:
+        headers = {"Content-Type": "application/json"}
+        if sub.get("secret"):
+            headers[SIGNATURE_HEADER] = sign(sub["secret"], body)
+        return self._session.post(sub["url"], data=body, headers=headers, timeout=self.timeout,
+                                  allow_redirects=False).status_code
+
+    async def _deliver(self, subscriber: _Subscriber, batch: List[Event]) -> None:
+        sub = subscriber.sub
+        body = dumps({"subscription_id": sub["id"], "events": batch})
+        loop = asyncio.get_running_loop()
+        error = None
+        for attempt in range(self.max_attempts):
+            try:
+                status = await loop.run_in_executor(self._executor, self._post, sub, body)
+                if status < 300:
+                    subscriber.delivered += len(batch)
+                    return
+                error = f"HTTP {status}"
+                if permanent_failure(status):
+                    break  # The receiver rejected the batch; retrying will not help
+            except requests.RequestException as e:
+                error = str(e)
+            if attempt == self.max_attempts - 1:
+                break
+            # Full jitter, so subscribers that failed together do not retry together
+            await asyncio.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+        subscriber.failed += len(batch)
+        logger.warning(
+            "Webhook delivery failed",
+            extra={"subscription_id": sub["id"], "events": len(batch), "error": error}
+        )
+
+    # Lifecycle
+
+    def _reconcile(self) -> None:
+        """Start/stop delivery tasks to match the persisted subscriptions (leader only)"""
+        if self.store.changed():
+            self.subscriptions = self.store.read()
+        wanted = self.subscriptions if self.leader.acquire() else {}
+
+        for sub_id in list(self._subscribers):
+            if sub_id not in wanted or wanted[sub_id] != self._subscribers[sub_id].sub:
+                subscriber = self._subscribers.pop(sub_id)
+                self._table.remove(subscriber)
+                subscriber.task.cancel()
+        for sub_id, sub in wanted.items():
+            if sub_id not in self._subscribers:
+                try:
+                    subscriber = _Subscriber(sub, self.queue_size)
+                except ValueError as e:
+                    logger.warning("Skipping invalid subscription", extra={"subscription_id": sub_id, "error": str(e)})
+                    continue
+                subscriber.task = asyncio.create_task(self._worker(subscriber))
+                self._subscribers[sub_id] = subscriber
+                self._table.add(subscriber, subscriber.query, subscriber.types)
+
+        active = bool(self._subscribers)
+        if active != self.active:
+            self.active = active
+            if self.on_active is not None:
+                self.on_active(active)
+
+    async def _refresh(self) -> None:
+        while True:
+            try:
+                self._reconcile()
+            except Exception:
+                logger.exception("Webhook subscription refresh failed")
+            await asyncio.sleep(self.refresh_interval)
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._refresh_task = asyncio.create_task(self._refresh())
+
+    async def stop(self) -> None:
+        tasks = [s.task for s in self._subscribers.values()]
+        if self._refresh_task is not None:
+            tasks.append(self._refresh_task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._subscribers.clear()
+        self._table = FilterTable()
+        self._executor.shutdown(wait=False)
+        self.leader.release()
+
+    def stats(self) -> Dict[str, Any]:
+        # Totals only: subscription ids are what DELETE /entities/events/{id} takes, they are not public
+        subscribers = list(self._subscribers.values())
+        return {
+            "subscriptions": len(self.subscriptions),
+            "leader": self.leader.held,
+            "received": self.received,
+            "subscribers": len(subscribers),
+            "queued": sum(s.queue.qsize() for s in subscribers),
+            "delivered": sum(s.delivered for s in subscribers),
+            "dropped": sum(s.dropped for s in subscribers),
+            "failed": sum(s.failed for s in subscribers),
+        }
+
+
+class LocalReceiver:
+    """
+    Webhook receiver on 127.0.0.1 for tests. Records every batch; can fail the
+    first `fail_first` requests (HTTP 503) or answer slowly (`delay` seconds).
+
+        with LocalReceiver() as receiver:
+            register(receiver.url, ...)
+            receiver.wait_for(events=3)
+    """
+
+    def __init__(self, fail_first: int = 0, delay: float = 0.0, secret: Optional[str] = None):
+        self.fail_first = fail_first
+        self.delay = delay
+        self.secret = secret
+        self.batches: List[Dict[str, Any]] = []
+        self.requests = 0
+        self.bad_signatures = 0
+        self._cond = threading.Condition()
+        receiver = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with receiver._cond:
+                    receiver.requests += 1
+                    failing = receiver.requests <= receiver.fail_first
+                if receiver.delay:
+                    time.sleep(receiver.delay)
+                if failing:
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+                if receiver.secret and self.headers.get(SIGNATURE_HEADER) != sign(receiver.secret, body):
+                    receiver.bad_signatures += 1
+                    self.send_response(401)
+                    self.end_headers()
+                    return
+                with receiver._cond:
+                    receiver.batches.append(json.loads(body))
+                    receiver._cond.notify_all()
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_port}/hook"
+
+    @property
+    def events(self) -> List[Event]:
+        with self._cond:
+            return [event for batch in self.batches for event in batch["events"]]
+
+    def wait_for(self, events: int, timeout: float = 10.0) -> bool:
+        """Block until at least `events` events arrived"""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: sum(len(b["events"]) for b in self.batches) >= events, timeout
+            )
+
+    def __enter__(self) -> "LocalReceiver":
+        threading.Thread(target=self._server.serve_forever, name="local-receiver", daemon=True).start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._server.shutdown()
+        self._server.server_close()
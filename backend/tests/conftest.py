@@ -0,0 +1,85 @@
+"""
+Fixtures running the whole app against the in-memory Arkiv node (ARKIV_BACKEND=memory).
+
+x402 verification is replaced by the X-Test-Payer header, which stands in for
+the wallet a verified payment came from.
+"""
+
+import os
+import time
+import types
+
+import pytest
+
+PAYER = "0x1111111111111111111111111111111111111111"
+OTHER_PAYER = "0x2222222222222222222222222222222222222222"
+PAYER_HEADER = "X-Test-Payer"
+
+
+def wait_until(condition, timeout: float = 10.0, interval: float = 0.05):
+    """Poll condition until it returns something truthy; returns it, or fails the test"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = condition()
+        if result:
+            return result
+        time.sleep(interval)
+    pytest.fail(f"Timed out after {timeout}s")
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    os.environ.update({
+        "ARKIV_BACKEND": "memory",
+        "MEMORY_NODE_BLOCK_SECONDS": "0",
+        "DATA_DIR": str(tmp_path_factory.mktemp("data")),
+        "PAYTO_ADDRESS": "0xbd3461330f3a42583127bdb0f72652fcc9259992",
+        "EVENT_POLL_SECONDS": "0.05",
+        "TX_POLL_SECONDS": "0.05",
+        "WEBHOOK_BATCH_WINDOW": "0.05",
+        "WEBHOOK_ALLOW_PRIVATE": "true",
+        "SERIES_ENABLED": "false",
+        "READ_RATE": "1000",
+        "READ_BURST": "1000",
+        "WRITE_RATE": "1000",
+        "WRITE_BURST": "1000",
+    })
+    os.environ.pop("ARKIV_PRIVATE_KEY", None)
+    os.environ.pop("ARKIV_SIGNER_KEYS", None)
+    os.environ.pop("CACHE_SOCKET", None)
+
+    import main
+
+    main.app.user_middleware = [
+        m for m in main.app.user_middleware
+        if getattr(m.kwargs.get("dispatch"), "__module__", "") != "x402.fastapi.middleware"
+    ]
+
+    @main.app.middleware("http")
+    async def test_payment(request, call_next):
+        payer = request.headers.get(PAYER_HEADER)
+        if payer:
+            request.state.verify_response = types.SimpleNamespace(payer=payer)
+        return await call_next(request)
+
+    return main.app
+
+
+@pytest.fixture(scope="session")
+def client(app):
+    from fastapi.testclient import TestClient
+
+    with TestClient(app) as client:
+        wait_until(lambda: client.get("/ready").status_code == 200)
+        yield client
+
+
+@pytest.fixture
+def create(client):
+    """Create an entity paid for by `payer`; returns its key"""
+    def create(payer: str = PAYER, **body) -> str:
+        body = {"payload": "hello", "content_type": "text/plain", "ttl": 3600, **body}
+        response = client.post("/entities", json=body, headers={PAYER_HEADER: payer})
+        assert response.status_code == 201, response.text
+        return response.json()["entity_key"]
+    return create
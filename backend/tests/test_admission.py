@@ -0,0 +1,63 @@
+"""
+Admission control: buckets refill at their rate, keys never trust a claimed payer alone, and load is shed.
+"""
+
+import base64
+import json
+
+from src import admission
+from src.admission import LoadShedder, TokenBucket, WalletLimiter, limiter_key
+
+
+def payment(payer):
+    return base64.b64encode(json.dumps({"payload": {"authorization": {"from": payer}}}).encode()).decode()
+
+
+def test_bucket_refills_at_its_rate():
+    bucket = TokenBucket(rate=2, burst=3)
+    now = bucket.updated
+    assert [bucket.take(now) for _ in range(3)] == [0, 0, 0]
+    assert bucket.take(now) == 0.5
+    assert bucket.take(now + 0.5) == 0
+    assert TokenBucket(rate=0, burst=0).take(now) == float("inf")
+
+
+def test_reads_and_writes_have_separate_buckets(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(admission.time, "monotonic", lambda: now[0])
+    limiter = WalletLimiter(read_rate=1, read_burst=2, write_rate=1, write_burst=1)
+
+    assert limiter.check("a", "write") == 0
+    assert limiter.check("a", "write") == 1.0
+    assert limiter.check("a", "read") == 0  # Writes do not use up reads
+    assert limiter.check("b", "write") == 0  # Nor one wallet another's
+    now[0] += 1
+    assert limiter.check("a", "write") == 0
+    assert limiter.limited == {"read": 0, "write": 1}
+
+
+def test_idle_wallets_are_evicted():
+    limiter = WalletLimiter(1, 1, 1, 1, max_wallets=2)
+    for wallet in ("a", "b", "c"):
+        limiter.check(wallet, "read")
+    assert [key for key, _ in limiter.buckets] == ["b", "c"]
+
+
+def test_claimed_payer_is_paired_with_the_client_ip():
+    payer = "0xAbC0000000000000000000000000000000000001"
+    assert limiter_key(payment(payer), "10.0.0.1") == f"{payer.lower()}@10.0.0.1"
+    # A victim's wallet claimed from elsewhere lands in another bucket
+    assert limiter_key(payment(payer), "10.0.0.2") != limiter_key(payment(payer), "10.0.0.1")
+    assert limiter_key(None, "10.0.0.1") == limiter_key("not base64 json", "10.0.0.1") == "ip:10.0.0.1"
+
+
+def test_shedding_past_the_backlog():
+    shedder = LoadShedder(max_inflight=2, max_writes=1)
+    assert shedder.admit(is_write=True) == 0
+    assert shedder.admit(is_write=True) >= 1  # Too many pending writes
+    assert shedder.admit(is_write=False) == 0  # Reads still fit
+    assert shedder.admit(is_write=False) >= 1  # Backlog full
+    assert shedder.stats()["shed"] == 2
+
+    shedder.done(is_write=True, elapsed=0.1)
+    assert shedder.admit(is_write=True) == 0
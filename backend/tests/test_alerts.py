@@ -0,0 +1,87 @@
+"""
+AlertEngine: rule kinds, debouncing and ownership.
+"""
+
+import threading
+import time
+
+import orjson
+import pytest
+
+from src.alerts import AlertEngine
+
+STASH = "5GrwvaEF5zXb26Fz9rcQpDWS57CtERHpNehXCPcNoHGKutQY"
+
+
+class Receiver:
+    def __init__(self):
+        self.alerts = []
+        self.lock = threading.Lock()
+
+    def post(self, url, body, headers):
+        with self.lock:
+            self.alerts.extend(orjson.loads(body)["alerts"])
+        return 204
+
+    def wait_for(self, count, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.lock:
+                if len(self.alerts) >= count:
+                    return list(self.alerts)
+            time.sleep(0.01)
+        pytest.fail(f"Expected {count} alerts, got {len(self.alerts)}")
+
+
+@pytest.fixture
+def engine(tmp_path):
+    receiver = Receiver()
+    engine = AlertEngine(str(tmp_path / "alerts.json"), ["balance.total"], post=receiver.post, backoff=0)
+    engine.receiver = receiver
+    yield engine
+    engine.stop()
+
+
+def rule(engine, kind="change", threshold=10.0, cooldown=0.0, **kwargs):
+    return engine.register(STASH, "balance.total", kind, threshold, "http://receiver/hook", cooldown=cooldown, **kwargs)
+
+
+def observe(engine, values):
+    return [engine.observe(STASH, 1000 + i, 10 + i, {"balance.total": v}) for i, v in enumerate(values)]
+
+
+def test_change_fires_on_drift_and_jumps(engine):
+    rule(engine)
+    # The reference moves to the value of each alert: 100 -> 112 -> 100
+    assert observe(engine, [100, 105, 109, 112, 113, 100]) == [0, 0, 0, 1, 0, 1]
+    alerts = engine.receiver.wait_for(2)
+    assert [(a["reference"], a["value"]) for a in alerts] == [(100, 112), (112, 100)]
+
+
+def test_pct_change_and_deviation(engine):
+    rule(engine, "pct_change", threshold=50)
+    rule(engine, "deviation", threshold=3, window=4)
+    fired = observe(engine, [10, 11, 9, 10, 11, 10, 16])
+    assert fired[-1] == 2  # +60% from 10, and far outside the last four values
+    assert sum(fired[:-1]) == 0
+
+
+def test_alerts_within_cooldown_are_coalesced(engine):
+    rule(engine, threshold=1, cooldown=0.3)
+    observe(engine, [0, 5, 10, 15, 20])
+    first = engine.receiver.wait_for(1)
+    assert first[0]["value"] == 5 and first[0]["coalesced"] == 0
+    time.sleep(0.1)
+    assert len(engine.receiver.alerts) == 1
+
+    # One delivery at the end of the cooldown: the latest alert, with the number it replaced
+    alerts = engine.receiver.wait_for(2)
+    assert alerts[1]["value"] == 20 and alerts[1]["coalesced"] == 2
+    assert engine.stats()["coalesced"] == 2
+
+
+def test_rules_record_their_payer(engine):
+    created = rule(engine, payer="0xAbC0000000000000000000000000000000000001")
+    assert engine.get(created["id"])["payer"] == "0xabc0000000000000000000000000000000000001"
+    assert engine.unregister(created["id"])
+    assert engine.get(created["id"]) is None
@@ -0,0 +1,91 @@
+"""
+Backfill hands logs over in order, splits ranges the node refuses, and resumes from its checkpoint.
+"""
+
+import random
+import time
+
+import pytest
+import requests
+
+from src.backfill import Backfill, is_range_error
+from src.resilience import RpcUnavailable
+
+
+def chain(blocks: int):
+    """Raw logs of a fake chain with 0-2 logs per block"""
+    rng = random.Random(blocks)
+    return [{"blockNumber": block, "logIndex": index} for block in range(blocks) for index in range(rng.randint(0, 2))]
+
+
+def fetcher(logs, max_range: int = 64, fail_from=None):
+    """fetch_logs over logs: out-of-order completion, range errors past max_range, failures from a block on"""
+    def fetch_logs(from_block: int, to_block: int):
+        if to_block - from_block + 1 > max_range:
+            raise ValueError(f"block range too large, max {max_range}")
+        if fail_from is not None and to_block >= fail_from:
+            raise ConnectionError("node unavailable")
+        time.sleep(random.uniform(0, 0.002))
+        # Nodes do not promise any order within a response
+        return sorted((log for log in logs if from_block <= log["blockNumber"] <= to_block), key=lambda _: random.random())
+    return fetch_logs
+
+
+def test_logs_are_handed_over_in_order():
+    logs = chain(1000)
+    received, through = [], []
+
+    def on_logs(batch, through_block):
+        received.extend(batch)
+        through.append(through_block)
+
+    Backfill(fetcher(logs), on_logs, 0, 999, chunk_size=200, backoff=0).run()
+
+    assert received == logs
+    assert through == sorted(through) and through[-1] == 999
+
+
+def test_resumes_from_checkpoint_with_a_later_end_block(tmp_path):
+    logs = chain(1500)
+    received = []
+    checkpoint = str(tmp_path / "backfill.json")
+
+    def on_logs(batch, through_block):
+        received.extend(batch)
+
+    # One fetch at a time, so the run gets partway before failing
+    failing = Backfill(fetcher(logs, fail_from=700), on_logs, 0, 999, checkpoint_path=checkpoint,
+                       chunk_size=50, concurrency=1, max_attempts=1, backoff=0)
+    with pytest.raises(ConnectionError):
+        failing.run()
+    assert 0 < failing.done_through < 700
+
+    # The chain moved on before the retry: the range now ends later, but starts where it did
+    Backfill(fetcher(logs), on_logs, 0, 1499, checkpoint_path=checkpoint, chunk_size=50, backoff=0).run()
+
+    assert received == logs
+
+
+def test_connection_failures_are_not_range_errors():
+    assert not is_range_error(RpcUnavailable("HTTPSConnectionPool(host='rpc'): Max retries exceeded with url: /", 1.0))
+    assert not is_range_error(requests.ReadTimeout("Read timed out"))
+    assert not is_range_error(ValueError("rate limit exceeded"))
+    assert is_range_error(ValueError("exceed maximum block range: 5000"))
+    assert is_range_error(ValueError("query returned more than 10000 results"))
+    assert is_range_error(ValueError("Log response size exceeded."))
+
+
+def test_an_outage_does_not_shrink_chunks():
+    logs = chain(400)
+    calls = {"n": 0}
+
+    def flaky(from_block, to_block):
+        calls["n"] += 1
+        if calls["n"] <= 3:
+            raise RpcUnavailable("Max retries exceeded with url: /rpc", 0.0)
+        return [log for log in logs if from_block <= log["blockNumber"] <= to_block]
+
+    backfill = Backfill(flaky, lambda batch, through: None, 0, 399, chunk_size=100, concurrency=1, backoff=0)
+    stats = backfill.run()
+    assert stats["splits"] == 0 and stats["retries"] == 3
+    assert backfill.max_chunk == 100
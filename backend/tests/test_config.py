@@ -0,0 +1,40 @@
+"""
+Settings read at import time: a copied .env.example must start the app.
+"""
+
+import os
+import re
+import subprocess
+import sys
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_main(env):
+    return subprocess.run([sys.executable, "-c", "import main"], cwd=BACKEND, env=env,
+                          capture_output=True, text=True, timeout=120)
+
+
+def test_blank_settings_fall_back_to_defaults(tmp_path):
+    with open(os.path.join(BACKEND, "main.py")) as f:
+        numeric = set(re.findall(r'(?:int|float)\(os\.getenv\("([A-Z_]+)"', f.read()))
+    assert "MEMORY_NODE_BLOCK_SECONDS" in numeric
+
+    env = {**os.environ, **{name: "" for name in numeric},
+           "PAYTO_ADDRESS": "0xbd3461330f3a42583127bdb0f72652fcc9259992", "DATA_DIR": str(tmp_path)}
+    result = import_main(env)
+    assert result.returncode == 0, result.stderr
+
+
+def test_env_template_imports(tmp_path):
+    """Every KEY=value line of .env.example, as python-dotenv would read it"""
+    env = dict(os.environ)
+    with open(os.path.join(BACKEND, ".env.example")) as f:
+        for line in f:
+            match = re.match(r"([A-Z_][A-Z0-9_]*)=\s*([^#\s]*)", line)
+            if match:
+                env[match.group(1)] = match.group(2)
+    env.update({"PAYTO_ADDRESS": "0xbd3461330f3a42583127bdb0f72652fcc9259992", "DATA_DIR": str(tmp_path),
+                "ARKIV_BACKEND": "memory", "ARKIV_PRIVATE_KEY": "", "CACHE_BACKEND": "memory"})
+    result = import_main(env)
+    assert result.returncode == 0, result.stderr
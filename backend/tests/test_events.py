@@ -0,0 +1,61 @@
+"""
+EventHub looks up the attributes a batch of events needs with one fetch per block.
+"""
+
+from src.events import EventHub
+
+
+def event(event_type, key, block, log_index=0):
+    return {"type": event_type, "key": key, "block": block, "log_index": log_index, "tx_hash": "0x", "owner": "0x"}
+
+
+class Chain:
+    """Attributes of each entity as of each block; counts lookups"""
+
+    def __init__(self, versions):
+        self.versions = versions  # key -> {block: attributes}
+        self.calls = []
+
+    def fetch_attributes(self, keys, block):
+        self.calls.append((sorted(keys), block))
+        found = {}
+        for key in keys:
+            known = [b for b in self.versions.get(key, {}) if b <= block]
+            if known:
+                found[key.lower()] = self.versions[key][max(known)]
+        return found
+
+
+def test_one_fetch_per_block():
+    chain = Chain({
+        "0xA": {10: {"n": 1}, 11: {"n": 2}},
+        "0xb": {10: {"n": 10}},
+    })
+    hub = EventHub(fetch_attributes=chain.fetch_attributes)
+    received = []
+    hub.subscribe(received.append)
+
+    hub.publish_many([
+        event("created", "0xA", 10), event("created", "0xb", 10, 1), event("created", "0xgone", 10, 2),
+        event("extended", "0xb", 11), event("updated", "0xA", 11, 1), event("deleted", "0xb", 11, 2),
+    ])
+
+    assert chain.calls == [(["0xA", "0xb", "0xgone"], 10), (["0xA"], 11)]
+    assert [e["attributes"] for e in received] == [{"n": 1}, {"n": 10}, None, {"n": 10}, {"n": 2}, {"n": 10}]
+    assert hub.fetches == 2
+
+    # Remembered: a later extension needs no lookup, a deleted entity is forgotten
+    hub.publish_many([event("extended", "0xA", 12), event("extended", "0xb", 12, 1)])
+    assert chain.calls[2:] == [(["0xb"], 12)]
+    assert received[-2]["attributes"] == {"n": 2}
+
+
+def test_failed_fetch_leaves_attributes_empty():
+    def unavailable(keys, block):
+        raise ConnectionError("node unavailable")
+
+    hub = EventHub(fetch_attributes=unavailable)
+    received = []
+    hub.subscribe(received.append)
+    hub.publish(event("created", "0xa", 1))
+    assert received[0]["attributes"] is None and hub.published == 1
@@ -0,0 +1,34 @@
+"""
+HistoryStore: versions of entities, read back in order.
+"""
+
+from src.history import HistoryStore
+
+KEY = "0x" + "11" * 32
+
+
+def event(block: int, log_index: int = 0, type: str = "updated"):
+    return {"key": KEY, "type": type, "block": block, "log_index": log_index, "tx_hash": f"0x{block:064x}"}
+
+
+def test_no_history_before_the_log_exists(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.jsonl"))
+    assert store.versions(KEY) == ([], None, 0)
+
+
+def test_versions_are_ordered_and_deduplicated(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.jsonl"))
+    store.append(event(5, type="created"), {"n": 1})
+    store.append(event(9, 1), {"n": 3})
+    store.append(event(9, 0), {"n": 2})
+    assert store.append(event(9, 0), {"n": 2}) is None
+
+    versions, next_cursor, total = store.versions(KEY, newest_first=False)
+    assert [(v["block"], v["log_index"]) for v in versions] == [(5, 0), (9, 0), (9, 1)]
+    assert total == 3 and next_cursor is None
+
+    # Another process reading the same log sees the same versions, a page at a time
+    reader = HistoryStore(str(tmp_path / "history.jsonl"))
+    page, next_cursor, _ = reader.versions(KEY, limit=2)
+    assert [v["block"] for v in page] == [9, 9] and next_cursor == 2
+    assert reader.versions(KEY, cursor=5) == ([], None, 3)
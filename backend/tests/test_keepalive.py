@@ -0,0 +1,110 @@
+"""
+Keep-alive batching: due entities share transactions, a failed batch is retried
+entity by entity, and new expiries only land once the extension is mined.
+"""
+
+import types
+
+from src.keepalive import KeepAliveRegistry
+
+HEAD = 1000
+
+
+def receipt(batch, blocks: int = 500):
+    """Receipt of a mined extension of every entity in batch by `blocks`"""
+    return types.SimpleNamespace(block_number=HEAD + 1, extensions=[
+        types.SimpleNamespace(key=key, new_expiration_block=HEAD + blocks) for key, _ in batch])
+
+
+class Chain:
+    """extend() records submitted batches; the test settles them"""
+
+    def __init__(self, missing=()):
+        self.submitted = []
+        self.missing = set(missing)
+
+    def extend(self, batch, settled):
+        self.submitted.append((batch, settled))
+
+    def exists(self, entity_key):
+        return entity_key not in self.missing
+
+    def settle_all(self, fail=lambda batch: False):
+        pending, self.submitted = self.submitted, []
+        for batch, settled in pending:
+            settled(None if fail(batch) else receipt(batch))
+        return [batch for batch, _ in pending]
+
+
+def registry(tmp_path, chain, **kwargs):
+    kwargs = {"lead_blocks": 10, "window_blocks": 10, "max_batch": 3, **kwargs}
+    keepalive = KeepAliveRegistry(str(tmp_path / "keepalive.json"), extend=chain.extend,
+                                  head_block=lambda: HEAD, exists=chain.exists, **kwargs)
+    keepalive._load(keepalive.store.read())
+    return keepalive
+
+
+def test_due_entities_share_batches(tmp_path):
+    chain = Chain()
+    keepalive = registry(tmp_path, chain)
+    for n, expires in enumerate([1002, 1004, 1006, 1008, 1019, 1100]):
+        keepalive.register(f"0x{n}", 86400, expires, HEAD, "0xPayer")
+
+    assert keepalive.run_once() == 5
+    batches = [[key for key, _ in batch] for batch, _ in chain.submitted]
+    assert batches == [["0x0", "0x1", "0x2"], ["0x3", "0x4"]]  # 0x5 is not due within the window
+
+    # Submitted but unmined: not sent again, and expiries are unchanged
+    assert keepalive.run_once() == 0
+    assert keepalive.get("0x0")["expires_at_block"] == 1002
+
+    chain.settle_all()
+    assert keepalive.get("0x0")["expires_at_block"] == HEAD + 500
+    assert keepalive.stats()["transactions"] == 2 and keepalive.stats()["inflight"] == 0
+
+
+def test_failed_batch_is_retried_one_entity_at_a_time(tmp_path):
+    chain = Chain(missing={"0x1"})
+    keepalive = registry(tmp_path, chain)
+    for n in range(3):
+        keepalive.register(f"0x{n}", 86400, 1005, HEAD, "0xPayer")
+
+    keepalive.run_once()
+    chain.settle_all(fail=lambda batch: True)
+    assert keepalive.stats()["failures"] == 1
+
+    # Each entity now goes alone; only the one the chain no longer has keeps failing
+    keepalive.run_once()
+    retried = chain.settle_all(fail=lambda batch: batch[0][0] == "0x1")
+    assert [[key for key, _ in batch] for batch in retried] == [["0x0"], ["0x1"], ["0x2"]]
+
+    assert keepalive.get("0x0")["expires_at_block"] == keepalive.get("0x2")["expires_at_block"] == HEAD + 500
+    assert keepalive.get("0x1") is None
+    assert keepalive.stats()["dropped"] == 1
+
+
+def test_send_failure_retries_on_the_next_tick(tmp_path):
+    chain = Chain()
+    keepalive = registry(tmp_path, chain)
+    keepalive.register("0x0", 86400, 1005, HEAD, "0xPayer")
+
+    def unreachable(batch, settled):
+        raise ConnectionError("node unavailable")
+
+    keepalive.extend = unreachable
+    assert keepalive.run_once() == 0
+    assert keepalive.stats()["inflight"] == 0
+
+    keepalive.extend = chain.extend
+    assert keepalive.run_once() == 1
+
+
+def test_forget_stops_extensions(tmp_path):
+    chain = Chain()
+    keepalive = registry(tmp_path, chain)
+    for n in range(2):
+        keepalive.register(f"0x{n}", 86400, 1005, HEAD, "0xPayer")
+
+    keepalive.forget(["0x0", "0xunknown"])
+    keepalive.run_once()
+    assert [[key for key, _ in batch] for batch, _ in chain.submitted] == [["0x1"]]
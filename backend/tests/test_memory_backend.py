@@ -0,0 +1,182 @@
+"""
+End-to-end tests of the API against the in-memory Arkiv node (see conftest.py).
+"""
+
+import uuid
+
+from conftest import OTHER_PAYER, PAYER, PAYER_HEADER, wait_until
+from src.idempotency import IDEMPOTENCY_HEADER, REPLAYED_HEADER
+from src.webhooks import LocalReceiver
+
+NEW_OWNER = "0x3333333333333333333333333333333333333333"
+
+
+def test_create_read_and_revalidate(client, create):
+    key = create(payload="hello, arkiv", attributes={"type": "greeting"})
+
+    response = client.get(f"/entities/{key}")
+    assert response.status_code == 200
+    assert response.json()["data"] == "hello, arkiv"
+    assert response.json()["entity"]["attributes"]["type"] == "greeting"
+    etag = response.headers["ETag"]
+
+    response = client.get(f"/entities/{key}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+    # A new version gets a new validator
+    response = client.put(f"/entities/{key}", json={"payload": "bye"})
+    assert response.status_code == 200, response.text
+    response = client.get(f"/entities/{key}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["data"] == "bye"
+    assert response.headers["ETag"] != etag
+
+
+def test_idempotency_key_replays_the_first_response(client):
+    headers = {IDEMPOTENCY_HEADER: str(uuid.uuid4()), PAYER_HEADER: PAYER}
+    body = {"payload": "once", "content_type": "text/plain", "ttl": 3600}
+
+    first = client.post("/entities", json=body, headers=headers)
+    assert first.status_code == 201, first.text
+    retry = client.post("/entities", json=body, headers=headers)
+    assert retry.status_code == 201
+    assert retry.headers[REPLAYED_HEADER] == "true"
+    assert retry.json()["entity_key"] == first.json()["entity_key"]
+
+    # The same key for a different request is refused
+    conflict = client.post("/entities", json={**body, "payload": "twice"}, headers=headers)
+    assert conflict.status_code == 422
+
+
+def test_bulk_transfer(client, create):
+    mine = [create(attributes={"type": "bulk"}) for _ in range(3)]
+    theirs = create(payer=OTHER_PAYER, attributes={"type": "bulk"})
+
+    response = client.post("/entities/transfer/bulk", json={"new_owner": "nope", "entity_keys": mine},
+                           headers={PAYER_HEADER: PAYER})
+    assert response.status_code == 400
+
+    # A query only selects the paying wallet's entities
+    response = client.post("/entities/transfer/bulk", json={"new_owner": NEW_OWNER, "query": 'type = "bulk"'},
+                           headers={PAYER_HEADER: PAYER})
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert result["status"] == "success"
+    assert sorted(r["entity_key"] for r in result["results"]) == sorted(mine)
+    for key in mine:
+        assert client.get(f"/entities/{key}").json()["entity"]["owner"].lower() == NEW_OWNER
+
+    # Listed keys: one still held by the backend, one already transferred, one unknown
+    unknown = "0x" + "ab" * 32
+    response = client.post("/entities/transfer/bulk",
+                           json={"new_owner": NEW_OWNER, "entity_keys": [theirs, mine[0], unknown]},
+                           headers={PAYER_HEADER: OTHER_PAYER})
+    statuses = {r["entity_key"]: r["status"] for r in response.json()["results"]}
+    assert statuses == {theirs: "transferred", mine[0]: "already_owner", unknown: "not_found"}
+
+    # The backend no longer owns them, so it cannot delete them
+    assert client.delete(f"/entities/{theirs}").status_code == 403
+
+
+def test_webhook_delivery(client, create):
+    with LocalReceiver() as receiver:
+        response = client.post("/entities/events", json={"url": receiver.url, "query": 'type = "hooked"'},
+                               headers={PAYER_HEADER: PAYER})
+        assert response.status_code == 201, response.text
+        subscription_id = response.json()["subscription_id"]
+        # Subscriptions are picked up by the dispatcher's next refresh
+        wait_until(lambda: client.get("/metrics").json()["webhooks"]["subscribers"] == 1)
+
+        keys = [create(attributes={"type": "hooked"}) for _ in range(2)]
+        create(attributes={"type": "ignored"})
+        assert receiver.wait_for(events=2)
+        assert [event["key"] for event in receiver.events] == keys
+        assert {event["type"] for event in receiver.events} == {"created"}
+
+        # Only the wallet that registered the subscription may remove it
+        assert client.delete(f"/entities/events/{subscription_id}",
+                             headers={PAYER_HEADER: OTHER_PAYER}).status_code == 403
+        assert client.delete(f"/entities/events/{subscription_id}",
+                             headers={PAYER_HEADER: PAYER}).status_code == 200
+
+
+def test_history_is_recorded_in_order(client, create):
+    key = create(payload="v1", attributes={"type": "versioned", "n": 1})
+    for n in (2, 3):
+        response = client.put(f"/entities/{key}", json={"payload": f"v{n}", "attributes": {"type": "versioned", "n": n}})
+        assert response.status_code == 200, response.text
+
+    def recorded():
+        response = client.get(f"/entities/{key}/history", params={"order": "asc"})
+        return response.status_code == 200 and response.json()["total"] == 3 and response.json()
+
+    versions = wait_until(recorded)["versions"]
+    blocks = [version["block"] for version in versions]
+    assert blocks == sorted(blocks)
+    assert [version["type"] for version in versions] == ["created", "updated", "updated"]
+
+
+def test_entity_without_history(client):
+    assert client.get("/entities/0x" + "cd" * 32 + "/history").status_code == 404
+
+
+def test_submitted_create_learns_its_key_from_the_transaction(client):
+    response = client.post("/entities", params={"confirm": "submitted"}, headers={PAYER_HEADER: PAYER},
+                           json={"payload": "later", "content_type": "text/plain", "ttl": 3600})
+    assert response.status_code in (201, 202), response.text
+    tx_hash = response.json()["tx_hash"]
+
+    state = wait_until(lambda: (lambda tx: tx.get("entity_keys") and tx)(client.get(f"/tx/{tx_hash}").json()))
+    assert state["state"] in ("included", "final")
+    key, = state["entity_keys"]
+    assert client.get(f"/entities/{key}").json()["data"] == "later"
+
+
+def test_only_the_payer_removes_an_alert(client):
+    response = client.post("/alerts", headers={PAYER_HEADER: PAYER}, json={
+        "stash": "*", "field": "balance.total", "kind": "change", "threshold": 1, "url": "http://127.0.0.1:9/hook"})
+    assert response.status_code == 201, response.text
+    rule_id = response.json()["rule_id"]
+
+    assert client.delete(f"/alerts/{rule_id}").status_code == 403
+    assert client.delete(f"/alerts/{rule_id}", headers={PAYER_HEADER: OTHER_PAYER}).status_code == 403
+    assert client.delete(f"/alerts/{rule_id}", headers={PAYER_HEADER: PAYER}).status_code == 200
+    assert client.delete(f"/alerts/{rule_id}", headers={PAYER_HEADER: PAYER}).status_code == 404
+
+
+def test_deleting_an_entity_stops_its_keep_alive(client, create):
+    key = create()
+    response = client.post(f"/entities/{key}/keepalive", json={"lifetime": 86400}, headers={PAYER_HEADER: PAYER})
+    assert response.status_code == 200, response.text
+
+    assert client.delete(f"/entities/{key}").status_code == 200
+    wait_until(lambda: client.delete(f"/entities/{key}/keepalive", headers={PAYER_HEADER: PAYER}).status_code == 404)
+
+
+def test_unverified_payment_replays_nothing(client, monkeypatch):
+    import base64
+    import json
+    import types
+
+    import main
+
+    headers = {IDEMPOTENCY_HEADER: str(uuid.uuid4())}
+    body = {"payload": "mine", "content_type": "text/plain", "ttl": 3600}
+    first = client.post("/entities", json=body, headers={**headers, PAYER_HEADER: PAYER})
+    assert first.status_code == 201, first.text
+
+    # A payment claiming to come from PAYER that the facilitator rejects
+    async def reject(payment, requirements):
+        return types.SimpleNamespace(is_valid=False, invalid_reason="invalid_signature", payer=PAYER)
+
+    monkeypatch.setattr(main.payment_facilitator, "verify", reject)
+    forged = base64.b64encode(json.dumps({
+        "x402Version": 1, "scheme": "exact", "network": "base-sepolia",
+        "payload": {"signature": "0x" + "00" * 65, "authorization": {
+            "from": PAYER, "to": main.PAYTO_ADDRESS, "value": "10000", "validAfter": "0",
+            "validBefore": "9999999999", "nonce": "0x" + "00" * 32}},
+    }).encode()).decode()
+    retry = client.post("/entities", json=body, headers={**headers, "X-PAYMENT": forged})
+    assert REPLAYED_HEADER not in retry.headers
+    assert retry.json()["entity_key"] != first.json()["entity_key"]  # Ran again, without the payer's scope
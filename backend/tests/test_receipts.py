@@ -0,0 +1,82 @@
+"""
+ReceiptTracker state changes, driven by a fake node.
+"""
+
+import types
+
+from src.receipts import ReceiptTracker
+
+TX = "0x" + "aa" * 32
+OTHER = "0x" + "bb" * 32
+
+
+class FakeNode:
+    def __init__(self):
+        self.head = 10
+        self.receipts = {}  # tx hash -> {"status", "block"}
+        self.known = set()
+
+    def poll(self, tx_hashes):
+        return self.head, {h: self.receipts.get(h) for h in tx_hashes}
+
+    def fetch_receipt(self, tx_hash):
+        return types.SimpleNamespace(creates=[types.SimpleNamespace(key="0x" + tx_hash[2:4] * 32)])
+
+    def tracker(self, **kwargs):
+        return ReceiptTracker(self.poll, self.fetch_receipt, self.known.__contains__, finality=3, **kwargs)
+
+
+def test_pending_included_final():
+    node = FakeNode()
+    tracker = node.tracker()
+    seen = []
+    tx = tracker.track(TX, on_receipt=lambda tx: seen.append(tx.state))
+
+    tracker.poll_once()
+    assert tx.state == "pending" and "entity_keys" not in tx.to_dict()
+
+    node.receipts[TX] = {"status": 1, "block": 11}
+    node.head = 11
+    tracker.poll_once()
+    assert (tx.state, tx.confirmations) == ("included", 1)
+    assert tx.reached(1) and not tx.reached(3)
+    assert tx.to_dict()["entity_keys"] == ["0x" + "aa" * 32]
+
+    node.head = 13
+    tracker.poll_once()
+    assert tx.state == "final" and tx.reached(3)
+    assert seen == ["included"]  # Callbacks run once
+
+
+def test_reorged_out_goes_back_to_pending():
+    node = FakeNode()
+    tracker = node.tracker()
+    tx = tracker.track(TX)
+    node.receipts[TX] = {"status": 1, "block": 10}
+    tracker.poll_once()
+    assert tx.state == "included"
+    del node.receipts[TX]
+    tracker.poll_once()
+    assert (tx.state, tx.block) == ("pending", None)
+
+
+def test_failed_and_dropped():
+    node = FakeNode()
+    tracker = node.tracker(drop_after=0)
+    failed, dropped = tracker.track(TX), tracker.track(OTHER)
+    node.receipts[TX] = {"status": 0, "block": 10}
+    tracker.poll_once()
+    assert failed.state == "failed" and "entity_keys" not in failed.to_dict()
+    assert dropped.state == "dropped" and dropped.done
+
+
+def test_lookup_of_untracked_transactions():
+    node = FakeNode()
+    tracker = node.tracker()
+    assert tracker.lookup(TX) is None
+    node.known.add(TX)
+    assert tracker.lookup(TX)["state"] == "pending"
+    node.receipts[TX] = {"status": 1, "block": 9}
+    state = tracker.lookup(TX)
+    assert (state["state"], state["confirmations"]) == ("included", 2)
+    assert state["entity_keys"] == ["0x" + "aa" * 32]
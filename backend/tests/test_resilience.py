@@ -0,0 +1,105 @@
+"""
+RPC guard: reads are retried, writes never are, and the breaker opens, fails fast and probes.
+"""
+
+import pytest
+import requests
+
+from src import resilience
+from src.resilience import CircuitBreaker, CircuitOpenError, RpcGuard, RpcUnavailable, is_transient
+
+
+def failing(times, error=ConnectionError("connection refused"), result="ok"):
+    """fn failing `times` times with error, then returning result; counts calls"""
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= times:
+            raise error
+        return result
+    fn.calls = calls
+    return fn
+
+
+def guard(**kwargs):
+    return RpcGuard(attempts=3, sleep=lambda seconds: None, **kwargs)
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(response=response)
+
+
+def test_transient_errors():
+    assert is_transient(requests.ConnectionError()) and is_transient(requests.ReadTimeout())
+    assert is_transient(http_error(503)) and is_transient(http_error(429))
+    assert not is_transient(http_error(400)) and not is_transient(ValueError("execution reverted"))
+
+
+def test_reads_are_retried_writes_are_not():
+    rpc = guard()
+    fn = failing(2)
+    assert rpc.call(["eth_blockNumber"], fn) == "ok" and len(fn.calls) == 3
+    assert rpc.stats()["retries"] == 2
+
+    fn = failing(1)
+    with pytest.raises(RpcUnavailable):
+        rpc.call(["eth_sendRawTransaction"], fn)
+    assert len(fn.calls) == 1
+
+    # A batch is retried only if every request in it is a read
+    fn = failing(1)
+    with pytest.raises(RpcUnavailable):
+        rpc.call(["eth_getBalance", "eth_sendRawTransaction"], fn)
+    assert len(fn.calls) == 1
+
+
+def test_errors_from_the_node_are_raised_at_once():
+    rpc = guard()
+    fn = failing(1, error=ValueError("execution reverted"))
+    with pytest.raises(ValueError):
+        rpc.call(["eth_call"], fn)
+    assert len(fn.calls) == 1 and rpc.breaker.failures == 0
+
+
+def test_breaker_opens_fails_fast_and_probes(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    rpc = guard(breaker=CircuitBreaker(failure_threshold=2, reset_after=30))
+
+    for _ in range(2):
+        with pytest.raises(RpcUnavailable):
+            rpc.call(["eth_blockNumber"], failing(3))
+    assert rpc.breaker.state == "open"
+
+    # Open: calls fail without reaching the endpoint
+    fn = failing(0)
+    with pytest.raises(CircuitOpenError) as raised:
+        rpc.call(["eth_blockNumber"], fn)
+    assert not fn.calls and raised.value.retry_after == 30
+
+    # After reset_after one probe goes through; a failed probe reopens at once
+    now[0] += 30
+    with pytest.raises(RpcUnavailable):
+        rpc.call(["eth_blockNumber"], failing(3))
+    assert rpc.breaker.state == "open"
+
+    now[0] += 30
+    assert rpc.call(["eth_blockNumber"], failing(0)) == "ok"
+    assert rpc.breaker.stats() == {"state": "closed", "failures": 0, "opened": 1, "rejected": 1}
+
+
+def test_only_one_probe_while_half_open(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=1, reset_after=5)
+    breaker.failure()
+    now[0] += 5
+
+    breaker.allow()  # The probe
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    breaker.success()
+    breaker.allow()
@@ -0,0 +1,84 @@
+"""
+Transaction parameters: worker processes sharing a nonce file never hand out the same nonce.
+"""
+
+import multiprocessing
+import threading
+import time
+import types
+
+from src.txparams import TxParamsCache
+
+SENDER = "0x4444444444444444444444444444444444444444"
+
+
+class Node:
+    """Node whose pending nonce is `pending`; counts lookups"""
+
+    def __init__(self, pending: int = 7):
+        self.pending = pending
+        self.lookups = 0
+        self.eth = types.SimpleNamespace(get_transaction_count=self.get_transaction_count)
+
+    def get_transaction_count(self, address, block):
+        self.lookups += 1
+        return self.pending
+
+
+def allocate(path, count, queue):
+    cache = TxParamsCache(nonce_path=path)
+    queue.put([cache.next_nonce(Node(), SENDER) for _ in range(count)])
+
+
+def test_processes_sharing_a_nonce_file_take_turns(tmp_path):
+    path = str(tmp_path / "nonces.json")
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    workers = [context.Process(target=allocate, args=(path, 25, queue)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    nonces = sorted(n for _ in workers for n in queue.get(timeout=30))
+    for worker in workers:
+        worker.join()
+
+    assert nonces == list(range(7, 7 + 100))
+
+
+def test_threads_count_locally_after_one_lookup(tmp_path):
+    node = Node()
+    caches = [TxParamsCache(nonce_path=str(tmp_path / "nonces.json")) for _ in range(2)]
+    nonces = []
+
+    def send(cache):
+        for _ in range(20):
+            nonces.append(cache.next_nonce(node, SENDER))
+
+    threads = [threading.Thread(target=send, args=(cache,)) for cache in caches for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(nonces) == list(range(7, 7 + 80))
+    assert node.lookups == 1
+
+
+def test_resync_and_idle_counts_are_refetched(tmp_path):
+    node = Node()
+    cache = TxParamsCache(nonce_path=str(tmp_path / "nonces.json"), nonce_ttl=0.2)
+    assert [cache.next_nonce(node, SENDER) for _ in range(3)] == [7, 8, 9]
+
+    # A send failed: the node's count wins again
+    node.pending = 8
+    cache.resync_nonce(SENDER)
+    assert cache.next_nonce(node, SENDER) == 8
+
+    # A count nobody used for nonce_ttl (its worker died) is not trusted
+    node.pending = 20
+    time.sleep(0.25)
+    assert cache.next_nonce(node, SENDER) == 20
+    assert node.lookups == 3
+
+    # Without a nonce file the count is per process
+    local = TxParamsCache()
+    assert [local.next_nonce(node, SENDER) for _ in range(2)] == [20, 21]